@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time and peak memory of the broker hot paths over chunks and horizon
+
+Usage: python benchmarks/bench_broker.py [--chunks N ...] [--steps N ...]
+
+The number of chunks is `max_stake / min_bet` and the number of steps is
+`horizon / dt`. Results are stored as JSON per git commit in
+`benchmarks/results` and compared to the most recent earlier result.
+The results directory is not under version control, the reference numbers
+are published in `docs/benchmarks.rst`.
+"""
+import os
+import json
+import time
+import argparse
+import subprocess
+import tracemalloc
+from glob import glob
+
+import numpy as np
+
+from paul.broker import SimpleBroker
+from paul.model import Normal
+from paul.utils import find_next_extremum
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "gpl3"
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'results')
+PRICE = 100.
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def make_broker(n_chunks, n_steps, dt=10):
+    """Broker with half of its `n_chunks` chunks held"""
+    min_bet = 10.
+    funds = n_chunks * min_bet
+    broker = SimpleBroker(funds=funds, min_bet=min_bet, horizon=n_steps * dt,
+                          dt=dt, discount=0.9999, risk=0.25, max_loss=0.1,
+                          ask_fee=0.002, bid_fee=0.002)
+    rng = np.random.RandomState(42)
+    for _ in range(n_chunks // 2):
+        broker.get_chunks(1, PRICE * rng.uniform(0.9, 1.1), inplace=True)
+    return broker
+
+
+def make_dists(n_steps):
+    """Steadily rising forecasts, the worst case for the extremum search"""
+    return [Normal(PRICE + 0.01 * (i + 1), 1. + 0.1 * i)
+            for i in range(n_steps + 1)]
+
+
+def cases(broker, dists):
+    count = max(broker.max_ask // 2, 1)
+    rng = np.random.RandomState(0)
+
+    def trade():
+        """Buy and sell a chunk in place, the held chunks stay the same"""
+        leftover = broker.leftover
+        broker.get_chunks(1, PRICE * rng.uniform(0.9, 1.1), inplace=True)
+        broker.get_chunks(-1, PRICE, inplace=True)
+        # undo the fees, otherwise repeated trades use up the leftover
+        broker._leftover = leftover
+
+    diffs = [dist.mean() - PRICE for dist in dists]
+    max_loss = broker.max_loss * broker.max_stake
+    return [
+        ('make_order', lambda: broker.make_order(PRICE, dists)),
+        ('ask_chunks', lambda: broker.ask_chunks(count, PRICE)),
+        ('bid_chunks', lambda: broker.bid_chunks(count, PRICE)),
+        ('loss_risk', lambda: broker.loss_risk(max_loss, PRICE, count,
+                                               dists[-1].cdf)),
+        ('find_next_extremum', lambda: find_next_extremum(diffs)),
+        ('trade_inplace', trade),
+    ]
+
+
+def measure(func, min_time):
+    """Seconds per call and peak traced memory of a single call in bytes"""
+    func()
+    n_calls, elapsed = 1, 0.
+    while True:
+        start = time.perf_counter()
+        for _ in range(n_calls):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        n_calls *= 2
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / n_calls, peak
+
+
+def run(chunks, steps, min_time):
+    results = []
+    for n_chunks in chunks:
+        for n_steps in steps:
+            broker = make_broker(n_chunks, n_steps)
+            dists = make_dists(n_steps)
+            for name, func in cases(broker, dists):
+                secs, peak = measure(func, min_time)
+                results.append({'name': name, 'chunks': n_chunks,
+                                'steps': n_steps, 'time': secs,
+                                'peak': peak})
+    return results
+
+
+def key(result):
+    return result['name'], result['chunks'], result['steps']
+
+
+def previous_results(commit):
+    """Results of the most recent run of another commit"""
+    paths = [path for path in glob(os.path.join(RESULTS_DIR, '*.json'))
+             if not path.endswith('{}.json'.format(commit))]
+    if not paths:
+        return None, {}
+    path = max(paths, key=os.path.getmtime)
+    with open(path) as fh:
+        data = json.load(fh)
+    return data['commit'], {key(r): r for r in data['results']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--chunks', type=int, nargs='+',
+                        default=[10, 100, 1000, 10000])
+    parser.add_argument('--steps', type=int, nargs='+',
+                        default=[6, 60, 600])
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="minimal seconds of timing per case")
+    parser.add_argument('--no-save', action='store_true',
+                        help="do not store the results")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = run(args.chunks, args.steps, args.min_time)
+    base_commit, base = previous_results(commit)
+    header = "{:20s} {:>7s} {:>6s} {:>12s} {:>10s}".format(
+        'case', 'chunks', 'steps', 'time [us]', 'peak [KB]')
+    if base:
+        header += "  vs {}".format(base_commit)
+    print(header)
+    for result in results:
+        line = "{:20s} {:7d} {:6d} {:12.1f} {:10.1f}".format(
+            result['name'], result['chunks'], result['steps'],
+            result['time'] * 1e6, result['peak'] / 1024)
+        old = base.get(key(result))
+        if old is not None:
+            line += "  {:+6.0%}".format(result['time'] / old['time'] - 1)
+        print(line)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, '{}.json'.format(commit))
+        with open(path, 'w') as fh:
+            json.dump({'commit': commit, 'timestamp': time.time(),
+                       'results': results}, fh, indent=1)
+        print("Results stored in {}".format(path))
+
+
+if __name__ == '__main__':
+    main()
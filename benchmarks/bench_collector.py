@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+End-to-end throughput benchmark of the collector against a fake Kraken
+
+Usage: python benchmarks/bench_collector.py [--duration S] [--pairs N]
+                                            [--latency S] [--db-uri URI]
+
+A fake Kraken server runs in a separate process. The collector polls
+ticker and depth as fast as the rate limiter allows. Reported are the
+sustained pairs per second, the latency from API response to finished DB
+write and the CPU time of the collector process per written row. Without
+--db-uri the rows are only built, not written.
+"""
+import time
+import argparse
+import asyncio
+import multiprocessing
+from datetime import datetime
+
+import numpy as np
+
+from paul.kraken import AsyncAPI, RateLimiter
+from paul.collector import Collector
+from paul.db import DBClient, ticker_records, depth_records
+from paul import fakekraken
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "gpl3"
+
+
+class TimedAPI(AsyncAPI):
+    """Remembers when each result arrived"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.received = {}
+
+    async def _query(self, urlpath, params=None, headers=None):
+        resp = await super()._query(urlpath, params, headers)
+        if resp.get('result') is not None:
+            self.received[id(resp['result'])] = time.perf_counter()
+        return resp
+
+
+class ProbeDBClient(object):
+    """Counts rows and API-to-DB latency, writes to `db` if given"""
+    def __init__(self, api, db=None):
+        self.api = api
+        self.db = db
+        self.nrows = 0
+        self.npairs = 0
+        self.latencies = []
+
+    def _done(self, result, nrows, npairs):
+        received = self.api.received.pop(id(result), None)
+        if received is not None:
+            self.latencies.append(time.perf_counter() - received)
+        self.nrows += nrows
+        self.npairs += npairs
+
+    def insert_ticker(self, ticker):
+        if self.db is None:
+            ticker_records(ticker, datetime.utcnow())
+        else:
+            self.db.insert_ticker(ticker)
+        self._done(ticker, len(ticker), len(ticker))
+
+    def insert_depth(self, depth):
+        if self.db is None:
+            depth_records(depth, datetime.utcnow())
+        else:
+            self.db.insert_depth(depth)
+        nrows = sum(len(orders) for book in depth.values()
+                    for orders in book.values())
+        self._done(depth, nrows, len(depth))
+
+    def create_partitions(self):
+        if self.db is not None:
+            self.db.create_partitions()
+
+
+def run_server(port, n_pairs, latency):
+    fakekraken.main(['--port', str(port), '--pairs', str(n_pairs),
+                     '--latency', str(latency)])
+
+
+async def run_collector(collector, duration):
+    tasks = [asyncio.ensure_future(coro) for coro in
+             (collector.poll_ticker(), collector.poll_depth())]
+    await asyncio.sleep(duration)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await collector.api.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--duration', type=float, default=10.)
+    parser.add_argument('--pairs', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--db-uri', dest='db_uri')
+    args = parser.parse_args()
+
+    server = multiprocessing.Process(
+        target=run_server, args=(args.port, args.pairs, args.latency),
+        daemon=True)
+    server.start()
+    time.sleep(1.)
+    try:
+        api = TimedAPI(uri='http://127.0.0.1:{}'.format(args.port),
+                       limit=args.concurrency)
+        pairs = fakekraken.DEFAULT_PAIRS + ['PAIR{}EUR'.format(i) for i in
+                                            range(args.pairs)]
+        pairs = pairs[:args.pairs]
+        db = DBClient(uri=args.db_uri) if args.db_uri else None
+        if db is not None:
+            db.create_tables()
+        probe = ProbeDBClient(api, db)
+        limiter = RateLimiter(max_count=1e9, decay=1e9)
+        collector = Collector(probe, api, pairs, {'ticker': 0, 'depth': 0},
+                              limiter=limiter, concurrency=args.concurrency)
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        asyncio.run(run_collector(collector, args.duration))
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+    finally:
+        server.terminate()
+
+    latencies = np.array(probe.latencies) * 1e3
+    print("Pairs per second:        {:10.1f}".format(probe.npairs / wall))
+    print("Rows per second:         {:10.1f}".format(probe.nrows / wall))
+    if len(latencies):
+        print("API-to-DB latency in ms: p50 {:.2f}  p95 {:.2f}  p99 {:.2f}"
+              .format(*np.percentile(latencies, [50, 95, 99])))
+    if probe.nrows:
+        print("CPU per row in us:       {:10.2f}".format(
+            1e6 * cpu / probe.nrows))
+    print("Errors:                  {:10d}".format(collector._nerrors))
+
+
+if __name__ == '__main__':
+    main()
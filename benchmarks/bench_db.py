@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare rows per second of the INSERT and the COPY write path of DBClient
+
+Usage: python benchmarks/bench_db.py [--uri URI] [--pairs N] [--levels N]
+
+Without a reachable database only the preparation of the rows is timed.
+Results are kept in docs/benchmarks.rst.
+"""
+import argparse
+import time
+import random
+from datetime import datetime
+
+from paul.db import (DBClient, DB_URI, ticker_records, depth_records,
+                     ticker_rows, depth_rows, copy_buffer)
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "gpl3"
+
+
+def fake_ticker(n_pairs):
+    def pv():
+        return ['{:.5f}'.format(random.uniform(1, 1000)),
+                '{:.4f}'.format(random.uniform(0, 10))]
+
+    return {'PAIR{}EUR'.format(i): {'a': pv() + ['1.000'],
+                                    'b': pv() + ['1.000'],
+                                    'c': pv(), 'v': pv(), 'p': pv(),
+                                    't': [random.randint(0, 9999)] * 2,
+                                    'l': pv(), 'h': pv(),
+                                    'o': pv()[0]}
+            for i in range(n_pairs)}
+
+
+def fake_depth(n_pairs, n_levels):
+    now = int(time.time())
+
+    def levels():
+        # like Kraken, levels carry the time of their last change
+        return [['{:.5f}'.format(random.uniform(1, 1000)),
+                 '{:.3f}'.format(random.uniform(0, 10)),
+                 now - random.randint(0, 600)]
+                for _ in range(n_levels)]
+
+    return {'PAIR{}EUR'.format(i): {'asks': levels(), 'bids': levels()}
+            for i in range(n_pairs)}
+
+
+def timeit(func, arg, n_rows, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(arg)
+    elapsed = time.perf_counter() - start
+    return n_rows * repeat / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--uri', default=DB_URI)
+    parser.add_argument('--pairs', type=int, default=30)
+    parser.add_argument('--levels', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    ticker = fake_ticker(args.pairs)
+    depth = fake_depth(args.pairs, args.levels)
+    n_depth = 2 * args.pairs * args.levels
+    utcnow = datetime.utcnow()
+    print("Client side preparation (rows/s):  ticker        depth")
+    print("  INSERT dicts            {:12.0f} {:12.0f}".format(
+        timeit(lambda t: ticker_rows(t, utcnow), ticker, args.pairs,
+               args.repeat),
+        timeit(lambda d: depth_rows(d, utcnow), depth, n_depth,
+               args.repeat)))
+    print("  COPY text               {:12.0f} {:12.0f}".format(
+        timeit(lambda t: copy_buffer(ticker_records(t, utcnow)), ticker,
+               args.pairs, args.repeat),
+        timeit(lambda d: copy_buffer(depth_records(d, utcnow)), depth,
+               n_depth, args.repeat)))
+
+    results = {}
+    for bulk in (False, True):
+        try:
+            client = DBClient(uri=args.uri, bulk=bulk)
+            client.create_tables()
+        except Exception as e:
+            print("No database available at {}: {}".format(args.uri, e))
+            return
+        path = 'COPY' if bulk else 'INSERT'
+        results[path] = (
+            timeit(client.insert_ticker, ticker, args.pairs, args.repeat),
+            timeit(client.insert_depth, depth, n_depth, args.repeat))
+    print("End to end (rows/s):      ticker        depth")
+    for path, (ticker_rate, depth_rate) in results.items():
+        print("  {:8s}  {:12.0f} {:12.0f}".format(path, ticker_rate,
+                                                 depth_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,83 @@
 Agent integration and orchestrating everything
 """
 
+import time
+import asyncio
 import logging
 
+from .backtest import Backtest
+
 __author__ = "Florian Wilhelm"
 __copyright__ = "Florian Wilhelm"
 __license__ = "gpl3"
 
-_logger = logging.getLogger(__name__)
\ No newline at end of file
+_logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, .01, .025, .05,
+                   .1, .25, .5, 1.)
+
+
+class Agent(object):
+    """Decides on every ticker polled by a collector without the DB
+
+    Tickers are taken from a queue of :meth:`Collector.subscribe`, the mid
+    price of `pair` updates the forecaster and the broker decides like in
+    a :class:`~paul.backtest.Backtest`, i.e. orders are paper traded by
+    changing the broker in place. Storing the data is left to the
+    collector and never delays a decision. The decisions run one at a
+    time in the default executor so that the pollers keep running during
+    the broker computations.
+
+    Args:
+        collector (:obj:`Collector`): collector polling the ticker
+        pair (str): asset pair to trade
+        broker (:obj:`SimpleBroker`): broker making the decisions
+        forecaster: object with `update(time, price)` and
+            `forecast(n_steps)` returning frozen distributions
+        warmup (int): number of ticks before the first decision
+        queue_size (int): maximal number of pending tickers
+    """
+    def __init__(self, collector, pair, broker, forecaster, warmup=10,
+                 queue_size=100):
+        self.collector = collector
+        self.pair = pair
+        self.trader = Backtest(broker, forecaster, warmup=warmup)
+        self.queue = collector.subscribe('ticker', maxsize=queue_size)
+        self.latency = collector.metrics.histogram(
+            'paul_tick_to_decision_seconds',
+            'Latency from receiving a ticker to the decision',
+            buckets=LATENCY_BUCKETS)
+        self.max_latency = 0.
+
+    def on_ticker(self, received, now, ticker):
+        """Process one ticker received at `perf_counter` time `received`
+
+        Returns:
+            int: ordered chunks or None if no decision was made
+        """
+        quote = ticker.get(self.pair)
+        if quote is None:
+            return None
+        bid, ask = float(quote['b'][0]), float(quote['a'][0])
+        count = self.trader.step(now, bid, ask)
+        if count is None:
+            return None
+        latency = time.perf_counter() - received
+        self.latency.observe(latency)
+        self.max_latency = max(self.max_latency, latency)
+        _logger.info("Order of {} chunks after {:.2f}ms".format(
+            count, 1e3 * latency))
+        return count
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            item = await self.queue.get()
+            await loop.run_in_executor(None, self.on_ticker, *item)
+
+    def report(self):
+        """Report of the paper trades with tick-to-decision latencies"""
+        report = self.trader.report()
+        report['latency_mean'] = self.latency.mean()
+        report['latency_max'] = self.max_latency
+        return report
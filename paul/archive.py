@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar Parquet archive of the collected data
+
+Every table is stored as one Parquet file per pair and day under
+``<root>/<table>/pair=<pair>/date=<YYYY-MM-DD>/part-0.parquet``.
+"""
+import os
+import glob
+import logging
+from datetime import datetime, date, timedelta
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Integer, Numeric, DateTime, Boolean
+
+from .db import create_metadata
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "gpl3"
+
+_logger = logging.getLogger(__name__)
+
+TABLES = ['ticker', 'depth', 'trades', 'spreads']
+
+
+def arrow_schema(table):
+    """Arrow schema of a database table without its `id` column
+
+    Args:
+        table (:obj:`Table`): SQLAlchemy table
+
+    Returns:
+        :obj:`pyarrow.Schema`: schema with typed float/int64 columns
+    """
+    def arrow_type(sql_type):
+        if isinstance(sql_type, Numeric):
+            return pa.float64()
+        elif isinstance(sql_type, Integer):
+            return pa.int64()
+        elif isinstance(sql_type, DateTime):
+            return pa.timestamp('us')
+        elif isinstance(sql_type, Boolean):
+            return pa.bool_()
+        else:
+            return pa.string()
+
+    return pa.schema([(col.name, arrow_type(col.type))
+                      for col in table.columns if col.name != 'id'])
+
+
+SCHEMAS = {name: arrow_schema(table)
+           for name, table in create_metadata().tables.items()
+           if name in TABLES}
+
+
+def partition_path(root, table, pair, day):
+    return os.path.join(root, table, 'pair={}'.format(pair),
+                        'date={}'.format(day.isoformat()), 'part-0.parquet')
+
+
+def exported_days(root, table, pair):
+    """Sorted days of a pair already stored in the archive"""
+    pattern = os.path.join(root, table, 'pair={}'.format(pair), 'date=*')
+    return sorted(date(*map(int, os.path.basename(path)[5:].split('-')))
+                  for path in glob.glob(pattern))
+
+
+def write_partition(root, table, pair, day, df):
+    """Write the rows of one pair and day
+
+    Args:
+        root (str): root directory of the archive
+        table (str): table name
+        pair (str): asset pair
+        day (date): day of the rows
+        df (:obj:`DataFrame`): rows with the columns of the table
+    """
+    path = partition_path(root, table, pair, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = pa.Table.from_pandas(df, schema=SCHEMAS[table],
+                                preserve_index=False)
+    tmp_path = path + '.tmp'
+    pq.write_table(data, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def export(db_client, root, tables=None, pairs=None, until=None):
+    """Append all complete days missing in the archive
+
+    Args:
+        db_client (:obj:`DBClient`): database client
+        root (str): root directory of the archive
+        tables (list): tables to export, all of :obj:`TABLES` if None
+        pairs (list): pairs to export, all pairs in a table if None
+        until (date): first day not to export, today (UTC) if None
+    """
+    tables = TABLES if tables is None else tables
+    until = datetime.utcnow().date() if until is None else until
+    for table in tables:
+        cols = SCHEMAS[table].names
+        for pair in (db_client.pairs(table) if pairs is None else pairs):
+            days = exported_days(root, table, pair)
+            if days:
+                day = days[-1] + timedelta(days=1)
+            else:
+                first, _ = db_client.time_range(table, pair)
+                if first is None:
+                    continue
+                day = first.date()
+            while day < until:
+                start = datetime.combine(day, datetime.min.time())
+                df = db_client.load(table, pair, start,
+                                    start + timedelta(days=1), cols)
+                write_partition(root, table, pair, day, df)
+                _logger.info("Exported {} rows of {} for {} on {}".format(
+                    len(df), table, pair, day))
+                day += timedelta(days=1)
+
+
+def load(root, table, pair, start=None, end=None, columns=None):
+    """Load rows of a pair from the archive
+
+    Only the files of the requested days and the requested columns are
+    read, using memory mapping.
+
+    Args:
+        root (str): root directory of the archive
+        table (str): table name
+        pair (str): asset pair
+        start (datetime): inclusive start or None
+        end (datetime): exclusive end or None
+        columns (list): columns to read, all if None
+
+    Returns:
+        :obj:`DataFrame`: rows ordered by createtime
+    """
+    schema = SCHEMAS[table]
+    columns = schema.names if columns is None else list(columns)
+    read_cols = columns if 'createtime' in columns else (
+        columns + ['createtime'])
+    days = [day for day in exported_days(root, table, pair)
+            if (start is None or day >= start.date()) and
+            (end is None or day <= end.date())]
+    tables = [pq.read_table(partition_path(root, table, pair, day),
+                            columns=read_cols, memory_map=True)
+              for day in days]
+    if tables:
+        data = pa.concat_tables(tables)
+    else:
+        data = schema.empty_table().select(read_cols)
+    df = data.to_pandas()
+    if start is not None:
+        df = df[df['createtime'] >= start]
+    if end is not None:
+        df = df[df['createtime'] < end]
+    return df[columns].reset_index(drop=True)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Event-driven backtesting of brokers over stored ticker history
+"""
+import time
+import logging
+
+import numpy as np
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "gpl3"
+
+_logger = logging.getLogger(__name__)
+
+TICKER_COLS = ['createtime', 'bid_price', 'ask_price']
+
+
+def to_seconds(times):
+    """Convert an array of datetimes to POSIX seconds as floats"""
+    return np.asarray(times, dtype='datetime64[us]').astype(np.int64) / 1e6
+
+
+class Backtest(object):
+    """Drives a broker and a forecaster tick by tick
+
+    Every tick updates the forecaster with the mid price. At most every
+    `broker.dt` seconds the broker decides on an order which is executed
+    in place, buying at the ask and selling at the bid price. Only
+    running statistics are kept, so memory does not grow with the
+    number of ticks.
+
+    Args:
+        broker (:obj:`SimpleBroker`): broker making the decisions
+        forecaster: object with `update(time, price)` and
+            `forecast(n_steps)` returning frozen distributions
+        warmup (int): number of ticks before the first decision
+    """
+    def __init__(self, broker, forecaster, warmup=10):
+        self.broker = broker
+        self.forecaster = forecaster
+        self.warmup = warmup
+        self.funds = broker.funds
+        self.n_ticks = 0
+        self.n_decisions = 0
+        self.n_trades = 0
+        self.decision_time = 0.
+        self.equity = self.funds
+        self.max_equity = self.funds
+        self.max_drawdown = 0.
+        self._last_decision = -np.inf
+
+    def decide(self, bid, ask):
+        broker = self.broker
+        mid = (bid + ask) / 2
+        start = time.perf_counter()
+        dists = self.forecaster.forecast(broker.max_delta + 1)
+        count = broker.make_order(mid, dists)
+        self.decision_time += time.perf_counter() - start
+        self.n_decisions += 1
+        if count != 0:
+            broker.get_chunks(count, ask if count > 0 else bid, inplace=True)
+            self.n_trades += 1
+        return count
+
+    def step(self, t, bid, ask):
+        """Process a tick
+
+        Returns:
+            int: ordered chunks or None if no decision was made
+        """
+        self.forecaster.update(t, (bid + ask) / 2)
+        self.n_ticks += 1
+        count = None
+        if (self.n_ticks > self.warmup and
+                t - self._last_decision >= self.broker.dt):
+            count = self.decide(bid, ask)
+            self._last_decision = t
+        self.equity = self.broker.curr_depot_value(bid)
+        self.max_equity = max(self.max_equity, self.equity)
+        self.max_drawdown = max(self.max_drawdown,
+                                1 - self.equity / self.max_equity)
+        return count
+
+    def feed(self, times, bids, asks):
+        """Process a chunk of ticks
+
+        Args:
+            times (array): POSIX seconds of the ticks
+            bids (array): bid prices
+            asks (array): ask prices
+        """
+        for t, bid, ask in zip(times.tolist(), bids.tolist(), asks.tolist()):
+            self.step(t, bid, ask)
+
+    def report(self):
+        return {'pnl': self.equity - self.funds,
+                'return': self.equity / self.funds - 1,
+                'max_drawdown': self.max_drawdown,
+                'ticks': self.n_ticks,
+                'decisions': self.n_decisions,
+                'trades': self.n_trades,
+                'decisions_per_sec': (self.n_decisions / self.decision_time
+                                      if self.decision_time else 0.)}
+
+
+def run(db_client, pair, broker, forecaster, start=None, end=None,
+        chunksize=100000, warmup=10):
+    """Backtest over the ticker history of a pair in the database
+
+    Returns:
+        dict: report of :meth:`Backtest.report`
+    """
+    backtest = Backtest(broker, forecaster, warmup=warmup)
+    for df in db_client.load_ticker(pair, start, end, columns=TICKER_COLS,
+                                    chunksize=chunksize):
+        backtest.feed(to_seconds(df['createtime'].values),
+                      df['bid_price'].values, df['ask_price'].values)
+        _logger.info("Processed {} ticks".format(backtest.n_ticks))
+    return backtest.report()
@@ -5,11 +5,13 @@ Broker making trade decisions
 
 import logging
 from operator import itemgetter
+from functools import lru_cache
+from collections import OrderedDict
 
 import numpy as np
-import numpy.ma as ma
-from scipy import integrate
+from scipy import integrate, special
 
+from .risk import SampledPaths
 from .utils import find_next_extremum
 
 __author__ = "Florian Wilhelm"
@@ -19,14 +21,189 @@ __license__ = "gpl3"
 _logger = logging.getLogger(__name__)
 
 
-def sort_chunks(chunks):
-    chunks.sort(endwith=False)
-    chunks[:] = np.flipud(chunks)
+@lru_cache(maxsize=None)
+def quadrature_rule(rule, n_points):
+    """Read-only nodes and weights of a rule on the interval [-1, 1]
+
+    Args:
+        rule (str): `gauss` for Gauss-Legendre, `trapezoid` for an
+            equidistant grid
+        n_points (int): number of nodes
+
+    Returns:
+        tuple: arrays of nodes and weights
+    """
+    if rule == 'gauss':
+        nodes, weights = np.polynomial.legendre.leggauss(n_points)
+    elif rule == 'trapezoid':
+        nodes = np.linspace(-1., 1., n_points)
+        weights = np.full(n_points, 2. / (n_points - 1))
+        weights[[0, -1]] /= 2
+    else:
+        raise RuntimeError("rule should be gauss or trapezoid")
+    nodes.flags.writeable = False
+    weights.flags.writeable = False
+    return nodes, weights
+
+
+class Quadrature(object):
+    """Integration rule for expectations under forecast distributions
+
+    The nodes and weights of the rule on [-1, 1] are computed once per
+    rule and number of points by :func:`quadrature_rule`. For every
+    distribution, they are scaled to the interval covering all but `tail`
+    of its non-negative mass and multiplied with its pdf, so that an
+    expectation becomes a dot product. More points are more accurate but
+    slower.
+
+    Args:
+        n_points (int): number of nodes
+        rule (str): `gauss` for Gauss-Legendre, `trapezoid` for an
+            equidistant grid
+        tail (float): probability mass cut off on each side
+    """
+    def __init__(self, n_points=64, rule='gauss', tail=1e-9):
+        self._nodes, self._weights = quadrature_rule(rule, n_points)
+        self.n_points = n_points
+        self.rule = rule
+        self.tail = tail
+
+    def __call__(self, dist, delta=0, discount=1.):
+        """Prices and weights with discount**delta * pdf included
 
+        Returns:
+            tuple: arrays of prices and weights
+        """
+        low = max(dist.ppf(self.tail), 0.)
+        high = dist.ppf(1 - self.tail)
+        half = (high - low) / 2
+        prices = low + half * (self._nodes + 1)
+        weights = (discount**delta * half) * self._weights * dist.pdf(prices)
+        return prices, weights
+
+
+class ChunkLedger(object):
+    """Chunks of crypto currency held by a broker
+
+    Chunks of equal value are kept as runs sorted ascending by value, so
+    that the largest chunks, which are sold first, form the last runs.
+    With running prefix sums of the counts and values of the runs, count
+    and total are O(1) and the sum of the largest k chunks is a binary
+    search. Selling truncates the runs in O(log n) independent of k.
+    Buying is a binary search plus, unless the value is the largest, a
+    vectorized shift of the prefix sums of the runs of larger values.
+
+    Args:
+        capacity (int): maximal number of chunks
+    """
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._run_values = np.empty(capacity)
+        self._run_counts = np.empty(capacity, dtype=np.int64)
+        self._cum_counts = np.empty(capacity, dtype=np.int64)
+        self._cum_sums = np.empty(capacity)
+        self._m = 0
+        self._n = 0
+        self._total = 0.
+        self._top_sums = None
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def count(self):
+        return self._n
+
+    @property
+    def free(self):
+        return self._capacity - self._n
+
+    @property
+    def total(self):
+        return self._total
+
+    @property
+    def values(self):
+        """Read-only array of the chunks sorted descending"""
+        m = self._m
+        values = np.repeat(self._run_values[:m], self._run_counts[:m])[::-1]
+        values.flags.writeable = False
+        return values
+
+    def top_sums(self):
+        """Sums of the largest 1, 2, ..., count chunks"""
+        if self._top_sums is None:
+            self._top_sums = np.cumsum(self.values)
+        return self._top_sums
+
+    def _bottom(self, j):
+        """Run holding the (j+1)-th smallest chunk and the sum of the
+        smallest j chunks"""
+        idx = int(self._cum_counts[:self._m].searchsorted(j, side='right'))
+        prev_count = self._cum_counts[idx - 1] if idx else 0
+        prev_sum = self._cum_sums[idx - 1] if idx else 0.
+        if idx == self._m:
+            return idx, prev_sum
+        return idx, prev_sum + (j - prev_count) * self._run_values[idx]
+
+    def top_sum(self, k):
+        """Sum of the largest k chunks"""
+        if k <= 0:
+            return 0.
+        return self._total - self._bottom(self._n - k)[1]
+
+    def push(self, k, value):
+        """Add k chunks of the same value"""
+        assert 0 < k <= self.free
+        m = self._m
+        pos = int(self._run_values[:m].searchsorted(value))
+        if pos < m and self._run_values[pos] == value:
+            self._run_counts[pos] += k
+        else:
+            for array in (self._run_values, self._run_counts,
+                          self._cum_counts, self._cum_sums):
+                array[pos + 1:m + 1] = array[pos:m]
+            self._run_values[pos] = value
+            self._run_counts[pos] = k
+            self._cum_counts[pos] = self._cum_counts[pos - 1] if pos else 0
+            self._cum_sums[pos] = self._cum_sums[pos - 1] if pos else 0.
+            self._m = m = m + 1
+        self._cum_counts[pos:m] += k
+        self._cum_sums[pos:m] += k * value
+        self._n += k
+        self._total = float(self._cum_sums[m - 1])
+        self._top_sums = None
+
+    def pop(self, k):
+        """Remove the largest k chunks and return their sum"""
+        assert 0 < k <= self._n
+        total = self._total
+        keep = self._n - k
+        idx, kept_sum = self._bottom(keep)
+        kept = keep - (self._cum_counts[idx - 1] if idx else 0)
+        if kept:
+            self._run_counts[idx] = kept
+            self._cum_counts[idx] = keep
+            self._cum_sums[idx] = kept_sum
+            self._m = idx + 1
+        else:
+            self._m = idx
+        self._n, self._total = keep, float(kept_sum)
+        self._top_sums = None
+        return total - self._total
 
-class SimpleBroker(object):
+
+class BaseBroker(object):
+    """Settings and validation shared by all brokers
+
+    Holds the funds, the chunk size `min_bet`, the horizon as well as fees
+    and risk limits. Subclasses keep the bought chunks in ledgers of
+    :attr:`capacity` chunks.
+    """
     def __init__(self, funds, min_bet, horizon, dt, discount, risk=0.25,
-                 max_stake=None, ask_fee=0., bid_fee=0., max_loss=0.1):
+                 max_stake=None, ask_fee=0., bid_fee=0., max_loss=0.1,
+                 quadrature=None):
         self._dt = dt  # time step in seconds
         self.horizon = horizon  # maximal lookahead for decision in seconds
         self._min_bet = min_bet  # minimal chunk of money to invest, e.g. 10€
@@ -40,12 +217,7 @@ class SimpleBroker(object):
         self._dt = dt  # time step between two actions in seconds
         self.max_loss = max_loss  # maximum loss as percentage
         self.risk = risk  # risk to lose max_loss in horizon
-        n_chunks = self.max_stake // min_bet
-        self._chunks = ma.array(np.empty(size=n_chunks), mask=[True]*n_chunks)
-
-    @property
-    def chunks(self):
-        return self._chunks
+        self.quadrature = Quadrature() if quadrature is None else quadrature
 
     @property
     def risk(self):
@@ -110,7 +282,7 @@ class SimpleBroker(object):
 
     @property
     def ask_fee(self):
-        return self.ask_fee
+        return self._ask_fee
 
     @ask_fee.setter
     def ask_fee(self, fee):
@@ -128,66 +300,91 @@ class SimpleBroker(object):
             raise RuntimeError("fee should be in [0, 1]")
         self._bid_fee = fee
 
+    @property
+    def capacity(self):
+        """Maximal number of chunks given by `max_stake`"""
+        return int(self.max_stake // self.min_bet)
+
+    def chunk_value(self, price):
+        """Calculates the value of a chunk in the crypto currency"""
+        price *= 1 + self.ask_fee
+        return self.min_bet / price
+
+
+class SimpleBroker(BaseBroker):
+    def __init__(self, funds, min_bet, horizon, dt, discount, **kwargs):
+        super(SimpleBroker, self).__init__(funds, min_bet, horizon, dt,
+                                           discount, **kwargs)
+        self._ledger = ChunkLedger(self.capacity)
+
+    @property
+    def ledger(self):
+        return self._ledger
+
+    @property
+    def chunks(self):
+        return self._ledger.values
+
     @property
     def at_stake(self):
-        return ma.count(self.chunks) * self.min_bet
+        return self._ledger.count * self.min_bet
 
     @property
     def max_ask(self):
-        return min(ma.count_masked(self.chunks), self.leftover // self.min_bet)
+        return int(min(self._ledger.free, self.leftover // self.min_bet))
 
     @property
     def max_bid(self):
-        return ma.count(self.chunks)
+        return self._ledger.count
 
     def curr_depot_value(self, price):
         price *= 1 - self.bid_fee
-        return self.leftover + price * np.sum(self.chunks)
-
-    def chunk_value(self, price):
-        """Calculates the value of a chunk in the crypto currency"""
-        price *= 1 + self.ask_fee
-        return self.min_bet / price
+        return self.leftover + price * self._ledger.total
 
     def total_chunks_value(self, price, chunks):
         return price * (1 - self.bid_fee) * np.sum(chunks)
 
-    def _get_ret_val(self, leftover, chunks, inplace):
+    def ask_chunks(self, count, price, inplace=False):
+        """Buy `count` chunks
+
+        Returns:
+            None if `inplace` else the leftover and sum of chunks after
+            the trade without changing the broker
+        """
+        assert 0 < count <= self.max_ask
+        leftover = self.leftover - count * self.min_bet
+        value = self.chunk_value(price)
         if inplace:
             self._leftover = leftover
-            self._chunks = chunks
+            self._ledger.push(count, value)
             return None
         else:
-            return leftover, chunks
-
-    def ask_chunks(self, count, price, inplace=False):
-        assert 0 < count <= self.max_ask
-        leftover = self.leftover - count * self.min_bet
-        chunks = self.chunks if inplace else self.chunks.copy()
-        for _ in range(count):
-            idx = np.where(ma.getmask(chunks))[0][0]
-            chunks[idx] = self.chunk_value(price)
-            chunks.mask[idx] = False
-        sort_chunks(chunks)
-        return self._get_ret_val(leftover, chunks, inplace)
+            return leftover, self._ledger.total + count * value
 
     def bid_chunks(self, count, price, inplace=False):
+        """Sell the `count` largest chunks
+
+        Returns:
+            None if `inplace` else the leftover and sum of chunks after
+            the trade without changing the broker
+        """
         assert 0 < count <= self.max_bid
-        leftover = (self.leftover +
-                    np.sum(self.chunks[:count]) * (1 - self.bid_fee) * price)
-        chunks = self.chunks if inplace else self.chunks.copy()
-        for idx in range(count):
-            chunks.mask[idx] = True
-        sort_chunks(chunks)
-        return self._get_ret_val(leftover, chunks, inplace)
+        sold = self._ledger.top_sum(count)
+        leftover = self.leftover + sold * (1 - self.bid_fee) * price
+        if inplace:
+            self._leftover = leftover
+            self._ledger.pop(count)
+            return None
+        else:
+            return leftover, self._ledger.total - sold
 
     def get_chunks(self, count, price, inplace=False):
         if count > 0:
             return self.ask_chunks(count, price, inplace)
         elif count < 0:
             return self.bid_chunks(-count, price, inplace)
-        else:
-            return self._get_ret_val(self.leftover, self.chunks, inplace)
+        elif not inplace:
+            return self.leftover, self._ledger.total
 
     def value_at_delta(self, delta, pdf, curr_price, count):
         def cost(price):
@@ -195,16 +392,54 @@ class SimpleBroker(object):
             fut_value = leftover + self.total_chunks_value(price, chunks)
             return pdf(price) * self.discount**delta * fut_value
 
-        return integrate.quad(cost, 0., np.infinity)
+        # split at the current price so quad does not miss narrow peaks
+        return (integrate.quad(cost, 0., curr_price)[0] +
+                integrate.quad(cost, curr_price, np.inf)[0])
 
     def loss_risk(self, loss, price, count, cdf):
-        chunks = self.get_chunks(count, price)
+        _, chunks = self.get_chunks(count, price)
         curr_chunks_value = self.total_chunks_value(price, chunks)
         min_chunks_value = curr_chunks_value - loss
-        min_price = min_chunks_value / (np.sum(chunks) * (1 - self.bid_fee))
+        with np.errstate(divide='ignore'):
+            min_price = min_chunks_value / (np.sum(chunks) *
+                                            (1 - self.bid_fee))
         return cdf(min_price)
 
-    def make_order(self, price, dists):
+    def order_candidates(self, price):
+        """Leftover and chunk sum after every possible order
+
+        Returns:
+            tuple: arrays of counts, leftovers and chunk sums
+        """
+        counts = np.arange(-self.max_bid, self.max_ask + 1)
+        sold = np.concatenate([self._ledger.top_sums()[::-1], [0.]])
+        bought = np.arange(1, self.max_ask + 1)
+        leftovers = np.concatenate([
+            self.leftover + sold * (1 - self.bid_fee) * price,
+            self.leftover - bought * self.min_bet])
+        total = self._ledger.total
+        sums = np.concatenate([total - sold,
+                               total + bought * self.chunk_value(price)])
+        return counts, leftovers, sums
+
+    def expected_values(self, delta, dist, leftovers, sums):
+        """Discounted expected depot values for many orders at once
+
+        The weights of :attr:`quadrature` are shared by all orders. Since
+        the depot value is linear in the price, each expectation reduces
+        to two dot products of the weights.
+        """
+        prices, weights = self.quadrature(dist, delta, self.discount)
+        mass, mean = weights.sum(), weights.dot(prices)
+        return leftovers * mass + (1 - self.bid_fee) * sums * mean
+
+    def loss_risks(self, loss, price, sums, cdf):
+        """Probabilities to lose more than `loss` for many orders at once"""
+        with np.errstate(divide='ignore'):
+            min_prices = price - loss / (sums * (1 - self.bid_fee))
+        return cdf(min_prices)
+
+    def make_order(self, price, dists, vectorized=True):
         assert len(dists) == self.max_delta + 1
         diffs = [dist.mean() - price for dist in dists]
         delta, extremum = find_next_extremum(diffs)
@@ -212,12 +447,265 @@ class SimpleBroker(object):
             extremum, delta + 1))
         dist = dists[delta]
         max_loss = self.max_loss * self.max_stake
-        fut_at_risk = [(count, self.value_at_delta(delta + 1, dist.pdf,
-                                                   price, count))
-                       for count in range(-self.max_bid, self.max_ask+1)]
-        opts = [(count, value) for count, value in fut_at_risk if
-                self.loss_risk(max_loss, price, count, dist.cdf) < self.risk]
-        order_count, value = max(opts, key=itemgetter(1))
+        if vectorized:
+            counts, leftovers, sums = self.order_candidates(price)
+            values = self.expected_values(delta + 1, dist, leftovers, sums)
+            risks = self.loss_risks(max_loss, price, sums, dist.cdf)
+            values[risks >= self.risk] = -np.inf
+            idx = np.argmax(values)
+            order_count, value = int(counts[idx]), values[idx]
+        else:
+            fut_at_risk = [(count, self.value_at_delta(delta + 1, dist.pdf,
+                                                       price, count))
+                           for count in range(-self.max_bid,
+                                              self.max_ask + 1)]
+            opts = [(count, value) for count, value in fut_at_risk if
+                    self.loss_risk(max_loss, price, count,
+                                   dist.cdf) < self.risk]
+            order_count, value = max(opts, key=itemgetter(1))
         _logger.info("Expected depot gain of {} with {} chunks".format(
             value - self.curr_depot_value(price), order_count))
         return order_count
+
+    def make_order_samples(self, price, paths):
+        """Like :meth:`make_order` but for a forecast of sampled paths
+
+        Args:
+            price (float): current price
+            paths: :class:`~paul.risk.SampledPaths` or an array of shape
+                (paths, steps) with one step per dt up to the horizon
+
+        Returns:
+            int: number of chunks to buy (> 0) or sell (< 0)
+        """
+        if not isinstance(paths, SampledPaths):
+            paths = SampledPaths(paths)
+        means = paths.mean()
+        assert len(means) == self.max_delta + 1
+        delta, extremum = find_next_extremum(means - price)
+        _logger.info("Expected price difference {} at delta {}".format(
+            extremum, delta + 1))
+        counts, leftovers, sums = self.order_candidates(price)
+        values = self.discount**(delta + 1) * (
+            leftovers + (1 - self.bid_fee) * sums * means[delta])
+        risks = self.loss_risks(self.max_loss * self.max_stake, price, sums,
+                                lambda x: paths.cdf(delta, x))
+        values[risks >= self.risk] = -np.inf
+        idx = np.argmax(values)
+        _logger.info("Expected depot gain of {} with {} chunks".format(
+            values[idx] - self.curr_depot_value(price), counts[idx]))
+        return int(counts[idx])
+
+
+class PortfolioBroker(BaseBroker):
+    """Broker for several pairs sharing the same funds and stake
+
+    Every pair has its own :class:`ChunkLedger` while leftover money and
+    `max_stake` are shared. Orders for all pairs are evaluated as one
+    padded (pairs x counts) array. The loss risk is taken jointly over the
+    portfolio with a normal approximation assuming independent pairs,
+    i.e. only `mean` and `std` of the forecasts enter the constraint.
+
+    Args:
+        pairs (list): names of the asset pairs
+        **kwargs: see :class:`BaseBroker`
+    """
+    def __init__(self, pairs, funds, min_bet, horizon, dt, discount,
+                 **kwargs):
+        super(PortfolioBroker, self).__init__(funds, min_bet, horizon, dt,
+                                              discount, **kwargs)
+        self.pairs = list(pairs)
+        self._ledgers = OrderedDict((pair, ChunkLedger(self.capacity))
+                                    for pair in self.pairs)
+
+    @property
+    def ledgers(self):
+        return self._ledgers
+
+    @property
+    def at_stake(self):
+        return sum(ledger.count for ledger in self._ledgers.values()) * \
+            self.min_bet
+
+    @property
+    def max_ask(self):
+        free = self.capacity - self.at_stake // self.min_bet
+        return int(min(free, self.leftover // self.min_bet))
+
+    def max_bid(self, pair):
+        return self._ledgers[pair].count
+
+    def curr_depot_value(self, prices):
+        value = self.leftover
+        for pair, ledger in self._ledgers.items():
+            value += prices[pair] * (1 - self.bid_fee) * ledger.total
+        return value
+
+    def get_chunks(self, pair, count, price, inplace=False):
+        """Buy (`count` > 0) or sell the largest chunks of `pair`
+
+        Returns:
+            None if `inplace` else the leftover and sum of the pair's
+            chunks after the trade without changing the broker
+        """
+        ledger = self._ledgers[pair]
+        if count > 0:
+            assert count <= self.max_ask
+            leftover = self.leftover - count * self.min_bet
+            value = self.chunk_value(price)
+            if inplace:
+                ledger.push(count, value)
+            total = ledger.total + count * value
+        elif count < 0:
+            assert -count <= ledger.count
+            sold = ledger.top_sum(-count)
+            leftover = self.leftover + sold * (1 - self.bid_fee) * price
+            if inplace:
+                ledger.pop(-count)
+            total = ledger.total - sold
+        else:
+            leftover, total = self.leftover, ledger.total
+        if inplace:
+            self._leftover = leftover
+            return None
+        return leftover, total
+
+    def execute(self, orders, prices):
+        """Apply the `orders` of :meth:`make_order`, sells first"""
+        for pair, count in sorted(orders.items(), key=itemgetter(1)):
+            if count != 0:
+                self.get_chunks(pair, count, prices[pair], inplace=True)
+
+    def _forecasts(self, price, dists):
+        """Discounted quadrature moments and forecast moments per pair"""
+        n_pairs = len(self.pairs)
+        mass, mean = np.empty(n_pairs), np.empty(n_pairs)
+        loc, scale = np.empty(n_pairs), np.empty(n_pairs)
+        for i, pair in enumerate(self.pairs):
+            assert len(dists[pair]) == self.max_delta + 1
+            diffs = [dist.mean() - price[i] for dist in dists[pair]]
+            delta, _ = find_next_extremum(diffs)
+            dist = dists[pair][delta]
+            nodes, weights = self.quadrature(dist, delta + 1, self.discount)
+            mass[i], mean[i] = weights.sum(), weights.dot(nodes)
+            loc[i], scale[i] = dist.mean(), dist.std()
+        return mass, mean, loc, scale
+
+    def order_candidates(self, price):
+        """Changes of leftover and coins for every pair and count
+
+        Returns:
+            tuple: counts and (pairs x counts) arrays of leftover and coin
+            changes as well as a mask of feasible orders
+        """
+        held = np.array([ledger.count for ledger in self._ledgers.values()])
+        max_bid = held.max() if len(held) else 0
+        counts = np.arange(-max_bid, self.max_ask + 1)
+        sold = np.zeros((len(self.pairs), max_bid + 1))
+        for i, ledger in enumerate(self._ledgers.values()):
+            sums = ledger.top_sums()
+            sold[i, 1:len(sums) + 1] = sums
+            sold[i, len(sums) + 1:] = sums[-1] if len(sums) else 0.
+        sold = sold[:, ::-1]
+        bought = np.arange(1, self.max_ask + 1)
+        d_coins = np.concatenate([
+            -sold,
+            bought[None, :] * self.min_bet /
+            (price[:, None] * (1 + self.ask_fee))], axis=1)
+        d_leftover = np.concatenate([
+            sold * (1 - self.bid_fee) * price[:, None],
+            np.broadcast_to(-bought * self.min_bet,
+                            (len(self.pairs), len(bought)))], axis=1)
+        feasible = counts[None, :] >= -held[:, None]
+        return counts, d_leftover, d_coins, feasible
+
+    def joint_loss_risk(self, loss, price, loc, scale, coins):
+        """Probability that the portfolio loses more than `loss`
+
+        Args:
+            coins (array): coins held per pair, last axis runs over pairs
+
+        Returns:
+            array: probabilities, one per row of `coins`
+        """
+        coins = np.asarray(coins) * (1 - self.bid_fee)
+        mean = coins.dot(loc - price)
+        std = np.sqrt((coins**2).dot(scale**2))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            risk = special.ndtr((-loss - mean) / std)
+        return np.where(std > 0, risk, (mean <= -loss).astype(float))
+
+    def _allocate(self, counts, gains):
+        """Greedily cap the buys per pair by the shared `max_ask`
+
+        The gain of a bought chunk does not depend on how many are bought,
+        so chunks go to the pairs with the best gain per chunk first.
+        """
+        buys = np.maximum(counts, 0)
+        order = np.argsort(-gains)
+        capped = np.minimum(np.cumsum(buys[order]), self.max_ask)
+        buys[order] = np.diff(np.concatenate([[0], capped]))
+        return np.where(counts > 0, buys, counts)
+
+    def make_order(self, prices, dists):
+        """Orders for all pairs maximizing the expected depot value
+
+        Args:
+            prices (dict): current price per pair
+            dists (dict): forecast distributions per pair, one for every
+                time step up to the horizon
+
+        Returns:
+            dict: number of chunks to buy (> 0) or sell (< 0) per pair
+        """
+        price = np.array([prices[pair] for pair in self.pairs], dtype=float)
+        mass, mean, loc, scale = self._forecasts(price, dists)
+        counts, d_leftover, d_coins, feasible = self.order_candidates(price)
+        gains = (d_leftover * mass[:, None] +
+                 (1 - self.bid_fee) * d_coins * mean[:, None])
+        gains[~feasible] = -np.inf
+        best = counts[np.argmax(gains, axis=1)]
+        zero = np.searchsorted(counts, 0)
+        if self.max_ask > 0:
+            orders = self._allocate(best, gains[:, zero + 1])
+        else:
+            orders = best
+
+        held = np.array([ledger.count for ledger in self._ledgers.values()])
+        coins = np.array([ledger.total for ledger in self._ledgers.values()])
+        rows = np.arange(len(self.pairs))
+        max_loss = self.max_loss * self.max_stake
+
+        def positions(buy_frac, sell_frac):
+            """Orders after scaling down buys and selling more holdings"""
+            buys = np.floor(buy_frac * np.maximum(orders, 0)).astype(int)
+            sells = np.minimum(orders, 0)
+            sells -= np.floor(sell_frac * (held + sells)).astype(int)
+            return np.where(buys > 0, buys, sells)
+
+        def joint_risk(orders_):
+            idx = np.searchsorted(counts, orders_)
+            return self.joint_loss_risk(max_loss, price, loc, scale,
+                                        coins + d_coins[rows, idx])
+
+        def bisect(func):
+            """Largest fraction in [0, 1] with risk below :attr:`risk`"""
+            low, high = 0., 1.
+            for _ in range(20):
+                mid = (low + high) / 2
+                if func(mid) < self.risk:
+                    low = mid
+                else:
+                    high = mid
+            return low
+
+        result = positions(1., 0.)
+        if joint_risk(result) >= self.risk:
+            if joint_risk(positions(0., 0.)) < self.risk:
+                frac = bisect(lambda x: joint_risk(positions(x, 0.)))
+                result = positions(frac, 0.)
+            else:
+                frac = bisect(lambda x: joint_risk(positions(0., 1. - x)))
+                result = positions(0., 1. - frac)
+        _logger.info("Portfolio orders {}".format(result.tolist()))
+        return OrderedDict(zip(self.pairs, (int(c) for c in result)))
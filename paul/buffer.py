@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Write-behind buffer between the collector and the database
+"""
+import os
+import json
+import time
+import glob
+import logging
+import asyncio
+from collections import defaultdict
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "gpl3"
+
+_logger = logging.getLogger(__name__)
+
+
+class WriteBuffer(object):
+    """Accumulates records per table and writes them in group commits
+
+    Records are flushed in one transaction as soon as `max_rows` are
+    buffered or the oldest record waited `max_delay` seconds. At most
+    `max_pending` puts are queued. If the queue is full or a write fails,
+    batches are spilled to `spill_dir`, otherwise :meth:`put` blocks until
+    the database catches up. As long as spilled batches exist, new ones
+    are spilled as well and retried every `retry_delay` seconds. Every
+    batch keeps the position of its put, so spilled and buffered batches
+    are written in the order they were put.
+
+    Args:
+        db_client (:obj:`DBClient`): client providing `write_records`
+        max_rows (int): number of buffered rows triggering a flush
+        max_delay (float): maximal time in seconds a row is buffered
+        max_pending (int): maximal number of queued puts
+        spill_dir (str): directory for spilled batches or None
+        retry_delay (float): pause in seconds after a failed write
+        metrics (:obj:`CollectorMetrics`): metrics to update or None
+    """
+    def __init__(self, db_client, max_rows=5000, max_delay=5.,
+                 max_pending=1000, spill_dir=None, retry_delay=5.,
+                 metrics=None):
+        self.db_client = db_client
+        self.metrics = metrics
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.spill_dir = spill_dir
+        self.retry_delay = retry_delay
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._batches = defaultdict(list)
+        self._nrows = 0
+        self._first_key = None  # key of the oldest buffered put
+        self._run = int(1e6 * time.time())
+        self._nputs = 0
+        self._nspills = 0  # number of spill files on disk
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+            self._nspills = len(self._spill_paths())
+
+    @property
+    def nrows(self):
+        return self._nrows
+
+    @property
+    def queue(self):
+        return self._queue
+
+    async def put(self, table, records):
+        await self.put_batches({table: records})
+
+    async def put_batches(self, batches):
+        """Queue records of several tables that are committed together
+
+        Args:
+            batches (dict): table name to list of records
+        """
+        self._nputs += 1
+        # keys sort in the order of the puts, also across restarts
+        key = '{:016d}-{:09d}'.format(self._run, self._nputs)
+        if self.spill_dir is not None and (self._nspills or
+                                           self._queue.full()):
+            if not self._nspills:
+                _logger.warning("Write buffer full, spilling to disk")
+            self._spill(key, {table: list(records)
+                              for table, records in batches.items()})
+        else:
+            await self._queue.put((key, batches))
+
+    def _add(self, key, batches):
+        if self._first_key is None:
+            self._first_key = key
+        for table, records in batches.items():
+            self._batches[table].extend(records)
+            self._nrows += len(records)
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        deadline = None
+        # asyncio.wait instead of wait_for since the latter may swallow a
+        # cancellation that coincides with a finished get
+        getter = None
+        try:
+            while True:
+                timeout = None if deadline is None else max(
+                    deadline - loop.time(), 0.)
+                if getter is None:
+                    getter = asyncio.ensure_future(self._queue.get())
+                await asyncio.wait({getter}, timeout=timeout)
+                if getter.done():
+                    self._add(*getter.result())
+                    getter = None
+                    if deadline is None:
+                        deadline = loop.time() + self.max_delay
+                elif deadline is None and self._nspills:
+                    deadline = loop.time() + self.retry_delay
+                if self._nrows >= self.max_rows or (
+                        deadline is not None and loop.time() >= deadline):
+                    await self.flush()
+                    deadline = (None if not (self._nrows or self._nspills)
+                                else loop.time() + self.retry_delay)
+        finally:
+            if getter is not None:
+                if getter.done() and not getter.cancelled():
+                    self._add(*getter.result())
+                else:
+                    getter.cancel()
+
+    async def flush(self):
+        """Write spilled and buffered batches in the order of their puts
+
+        Puts go to disk as long as spilled batches exist, so queued and
+        buffered batches are older than the spilled batches put after
+        them. These are only replayed once the queue is empty.
+        """
+        if not self._nrows:
+            if self._queue.empty():
+                await self._replay()
+            return
+        batches, nrows = dict(self._batches), self._nrows
+        key, self._first_key = self._first_key, None
+        self._batches, self._nrows = defaultdict(list), 0
+        if await self._replay(before=key) and await self._write(batches):
+            _logger.info("Flushed {} rows to DB".format(nrows))
+            if self._queue.empty():
+                await self._replay()
+        elif self.spill_dir is not None:
+            self._spill(key, batches)
+        else:
+            self._add(key, batches)
+            await asyncio.sleep(self.retry_delay)
+
+    async def close(self):
+        while not self._queue.empty():
+            self._add(*self._queue.get_nowait())
+        await self.flush()
+
+    async def _write(self, batches):
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        try:
+            await loop.run_in_executor(None, self.db_client.write_records,
+                                       batches)
+        except Exception as e:
+            _logger.exception("Writing buffered rows failed:")
+            if self.metrics is not None:
+                self.metrics.errors.inc(type=type(e).__name__)
+            return False
+        else:
+            if self.metrics is not None:
+                self.metrics.db_latency.observe(loop.time() - start,
+                                                table='write_buffer')
+                for table, records in batches.items():
+                    self.metrics.rows_written.inc(len(records), table=table)
+            return True
+
+    def _spill_paths(self):
+        return sorted(glob.glob(os.path.join(self.spill_dir, 'spill-*.json')))
+
+    def _spill(self, key, batches):
+        path = os.path.join(self.spill_dir, 'spill-{}.json'.format(key))
+        with open(path, 'w') as fh:
+            json.dump(batches, fh)
+        self._nspills += 1
+        _logger.info("Spilled batch to {}".format(path))
+
+    async def _replay(self, before=None):
+        """Write spilled batches in order, returns False at a failure
+
+        Args:
+            before (str): only replay batches put before this key
+        """
+        if not self._nspills:
+            return True
+        for path in self._spill_paths():
+            if before is not None and \
+                    os.path.basename(path)[6:-5] >= before:
+                break
+            with open(path) as fh:
+                # JSON turns the record tuples into lists
+                batches = {table: [tuple(record) for record in records]
+                           for table, records in json.load(fh).items()}
+            if not await self._write(batches):
+                return False
+            os.remove(path)
+            self._nspills -= 1
+            _logger.info("Replayed spilled batch {}".format(path))
+        return True
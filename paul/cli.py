@@ -2,13 +2,19 @@
 """
 Paul's command line interface
 """
+import os
 import argparse
 import sys
 import logging
+from datetime import datetime
 
-from .kraken import API
+from .kraken import API, AsyncAPI, KRAKEN_URI
 from .collector import Collector
-from .db import DBClient
+from .feed import FeedCollector, KRAKEN_WS_URI
+from .db import DBClient, month_start
+from .buffer import WriteBuffer
+from .depth import DepthEncoder
+from .metrics import CollectorMetrics
 from . import __version__
 
 __author__ = "Florian Wilhelm"
@@ -18,16 +24,160 @@ __license__ = "gpl3"
 _logger = logging.getLogger(__name__)
 
 
+def make_collector(args, asset_pairs, pairs, limiter=None, index=0):
+    """Collector of `pairs` configured by the arguments of `collect`
+
+    Called in every worker process, so the DB connection and HTTP session
+    are created here. Worker `index` serves its metrics on the metrics
+    port plus `index` and spills to its own subdirectory `worker-<index>`
+    of the spill directory.
+    """
+    client = DBClient(bulk=args.bulk)
+    if args.feed:
+        rates = {'ticker': 0, 'depth': args.book_interval, 'trades': 0,
+                 'spreads': 0}
+    else:
+        rates = {'ticker': 10, 'depth': 600, 'trades': 60, 'spreads': 60}
+    api = AsyncAPI(uri=args.uri, limit=args.max_connections)
+    metrics = CollectorMetrics()
+    if args.write_behind:
+        if args.spill_dir is not None:
+            spill_dir = os.path.join(args.spill_dir,
+                                     'worker-{}'.format(index))
+        else:
+            spill_dir = None
+        buffer = WriteBuffer(client, max_rows=args.flush_rows,
+                             max_delay=args.flush_delay,
+                             spill_dir=spill_dir, metrics=metrics)
+    else:
+        buffer = None
+    if args.depth_keyframes:
+        depth_encoder = DepthEncoder(keyframe_interval=args.depth_keyframes)
+    else:
+        depth_encoder = None
+    if args.metrics_port is not None:
+        metrics_port = args.metrics_port + index
+    else:
+        metrics_port = None
+    kwargs = dict(limiter=limiter, concurrency=args.concurrency,
+                  buffer=buffer, depth_encoder=depth_encoder,
+                  metrics=metrics, metrics_port=metrics_port)
+    if args.feed:
+        wsnames = {pair: asset_pairs[pair].get('wsname', pair)
+                   for pair in pairs}
+        return FeedCollector(client, api, pairs, rates,
+                             feed_uri=args.feed_uri, wsnames=wsnames,
+                             **kwargs)
+    else:
+        return Collector(client, api, pairs, rates, **kwargs)
+
+
 def collect(args):
     _logger.info("Starting to collect...")
-    client = DBClient()
-    api = API()
-    asset_pairs = list(api.asset_pairs()['result'].keys())
+    asset_pairs = API(uri=args.uri).asset_pairs()['result']
     euro_pairs = [x for x in asset_pairs
                   if 'EU' in x and not x.endswith('.d')]
-    rates = {'ticker': 10, 'depth': 600}
-    collector = Collector(client, api, euro_pairs, rates)
-    collector.start()
+    if args.workers > 1:
+        from .supervisor import Supervisor
+        supervisor = Supervisor(make_collector, (args, asset_pairs),
+                                euro_pairs, args.workers,
+                                health_interval=args.health_interval)
+        supervisor.run()
+    else:
+        make_collector(args, asset_pairs, euro_pairs).start()
+
+
+def export(args):
+    _logger.info("Exporting to {}...".format(args.root))
+    from .archive import export as export_archive
+    client = DBClient()
+    export_archive(client, args.root, tables=args.tables, pairs=args.pairs)
+
+
+def prune(args):
+    before = month_start(datetime.utcnow().date(), -args.keep_months)
+    _logger.info("Dropping partitions before {}...".format(before))
+    DBClient().drop_partitions(before)
+
+
+def make_broker(args):
+    from .broker import SimpleBroker
+    return SimpleBroker(args.funds, args.min_bet, args.horizon, args.dt,
+                        args.discount, risk=args.risk,
+                        max_loss=args.max_loss, ask_fee=args.fee,
+                        bid_fee=args.fee)
+
+
+def make_forecaster(args):
+    from .model import RandomWalk, LocalLinearTrend
+    if args.model == 'kalman':
+        return LocalLinearTrend(args.dt)
+    else:
+        return RandomWalk(args.dt)
+
+
+def backtest(args):
+    _logger.info("Starting backtest of {}...".format(args.pair))
+    from .backtest import run as run_backtest
+    report = run_backtest(DBClient(), args.pair, make_broker(args),
+                          make_forecaster(args), args.start, args.end)
+    for key, value in report.items():
+        print("{:20s} {}".format(key, value))
+
+
+def trade(args):
+    _logger.info("Starting agent for {}...".format(args.pair))
+    from .agent import Agent
+    if args.no_persist:
+        client, buffer = None, None
+    else:
+        client = DBClient(bulk=args.bulk)
+        buffer = WriteBuffer(client, spill_dir=args.spill_dir)
+    api = AsyncAPI(uri=args.uri)
+    collector = Collector(client, api, [args.pair],
+                          {'ticker': args.tick_rate}, buffer=buffer,
+                          metrics_port=args.metrics_port)
+    agent = Agent(collector, args.pair, make_broker(args),
+                  make_forecaster(args), warmup=args.warmup)
+    try:
+        collector.start(agent.run())
+    finally:
+        for key, value in agent.report().items():
+            print("{:20s} {}".format(key, value))
+
+
+def sweep(args):
+    from .sweep import (grid, random_search, is_cached, dump_history,
+                        sweep as run_sweep)
+    if not is_cached(args.history, args.pair, args.start, args.end):
+        _logger.info("Dumping ticker history to {}...".format(args.history))
+        dump_history(DBClient(), args.pair, args.history, args.start,
+                     args.end)
+    params = dict(args.params or [])
+    if args.samples:
+        configs = random_search(args.samples, seed=args.seed, **params)
+    else:
+        configs = grid(**params)
+    results = run_sweep(args.history, configs, n_jobs=args.jobs,
+                        checkpoint=args.checkpoint, funds=args.funds,
+                        fee=args.fee)
+    results = [r for r in results if 'error' not in r['report']]
+    results.sort(key=lambda r: r['report']['pnl'], reverse=True)
+    for result in results[:args.top]:
+        print("{:12.2f} {}".format(result['report']['pnl'],
+                                   result['config']))
+
+
+def parse_param(param):
+    """Parse NAME=V1,V2,... into a list or NAME=LOW:HIGH into a range"""
+    name, values = param.split('=', 1)
+    if ':' in values:
+        return name, tuple(float(v) for v in values.split(':'))
+    return name, [float(v) for v in values.split(',')]
+
+
+def parse_date(date):
+    return datetime.strptime(date, '%Y-%m-%d')
 
 
 def interact(args):
@@ -41,6 +191,52 @@ def interact(args):
     embed()
 
 
+def add_broker_arguments(parser):
+    """Arguments of the broker and the forecasting model"""
+    parser.add_argument(
+        '--funds',
+        type=float,
+        default=1000.)
+    parser.add_argument(
+        '--min-bet',
+        dest='min_bet',
+        type=float,
+        default=50.)
+    parser.add_argument(
+        '--horizon',
+        help='lookahead in seconds',
+        type=float,
+        default=600.)
+    parser.add_argument(
+        '--dt',
+        help='time step between decisions in seconds',
+        type=float,
+        default=60.)
+    parser.add_argument(
+        '--discount',
+        type=float,
+        default=0.9999)
+    parser.add_argument(
+        '--risk',
+        type=float,
+        default=0.25)
+    parser.add_argument(
+        '--max-loss',
+        dest='max_loss',
+        type=float,
+        default=0.1)
+    parser.add_argument(
+        '--fee',
+        help='ask and bid fee as fraction',
+        type=float,
+        default=0.0026)
+    parser.add_argument(
+        '--model',
+        help='forecasting model',
+        choices=['randomwalk', 'kalman'],
+        default='randomwalk')
+
+
 def parse_args(args):
     """
     Parse command line parameters
@@ -72,7 +268,229 @@ def parse_args(args):
     collect_parser = subparsers.add_parser(
         'collect',
         help='collect ticker, trades etc.')
+    collect_parser.add_argument(
+        '--uri',
+        dest='uri',
+        help='base URI of the Kraken REST API',
+        default=KRAKEN_URI)
+    collect_parser.add_argument(
+        '--max-connections',
+        dest='max_connections',
+        help='maximal number of pooled HTTP connections',
+        type=int,
+        default=10)
+    collect_parser.add_argument(
+        '--concurrency',
+        dest='concurrency',
+        help='maximal number of pairs polled simultaneously',
+        type=int,
+        default=4)
+    collect_parser.add_argument(
+        '--bulk',
+        dest='bulk',
+        help='insert ticker and depth with COPY',
+        action='store_true')
+    collect_parser.add_argument(
+        '--write-behind',
+        dest='write_behind',
+        help='buffer rows and write them in group commits',
+        action='store_true')
+    collect_parser.add_argument(
+        '--flush-rows',
+        dest='flush_rows',
+        help='number of buffered rows triggering a commit',
+        type=int,
+        default=5000)
+    collect_parser.add_argument(
+        '--flush-delay',
+        dest='flush_delay',
+        help='maximal seconds a row is buffered',
+        type=float,
+        default=5.)
+    collect_parser.add_argument(
+        '--spill-dir',
+        dest='spill_dir',
+        help='directory to spill buffered rows to if the DB is slow, '
+             'every worker uses its subdirectory worker-<index>')
+    collect_parser.add_argument(
+        '--depth-keyframes',
+        dest='depth_keyframes',
+        help='store depth as deltas with a keyframe every N snapshots',
+        type=int,
+        default=0)
+    collect_parser.add_argument(
+        '--metrics-port',
+        dest='metrics_port',
+        help='serve Prometheus metrics on this local port',
+        type=int)
+    collect_parser.add_argument(
+        '--feed',
+        dest='feed',
+        help='stream from the websocket feed instead of polling',
+        action='store_true')
+    collect_parser.add_argument(
+        '--feed-uri',
+        dest='feed_uri',
+        help='URI of the Kraken websocket feed',
+        default=KRAKEN_WS_URI)
+    collect_parser.add_argument(
+        '--book-interval',
+        dest='book_interval',
+        help='minimal seconds between stored books of a pair in feed mode',
+        type=float,
+        default=10.)
+    collect_parser.add_argument(
+        '--workers',
+        dest='workers',
+        help='number of processes sharing the pairs and the rate limit',
+        type=int,
+        default=1)
+    collect_parser.add_argument(
+        '--health-interval',
+        dest='health_interval',
+        help='seconds between health reports of the workers',
+        type=float,
+        default=10.)
     collect_parser.set_defaults(func=collect)
+    export_parser = subparsers.add_parser(
+        'export',
+        help='export collected data to a Parquet archive')
+    export_parser.add_argument(
+        'root',
+        help='root directory of the archive')
+    export_parser.add_argument(
+        '--table',
+        dest='tables',
+        help='table to export, can be given several times',
+        action='append')
+    export_parser.add_argument(
+        '--pair',
+        dest='pairs',
+        help='pair to export, can be given several times',
+        action='append')
+    export_parser.set_defaults(func=export)
+    prune_parser = subparsers.add_parser(
+        'prune',
+        help='drop partitions of old months')
+    prune_parser.add_argument(
+        '--keep-months',
+        dest='keep_months',
+        help='number of past months to keep besides the current one',
+        type=int,
+        default=12)
+    prune_parser.set_defaults(func=prune)
+    backtest_parser = subparsers.add_parser(
+        'backtest',
+        help='run a broker over stored ticker history')
+    backtest_parser.add_argument(
+        'pair',
+        help='asset pair, e.g. XXBTZEUR')
+    backtest_parser.add_argument(
+        '--start',
+        help='first day as YYYY-MM-DD',
+        type=parse_date)
+    backtest_parser.add_argument(
+        '--end',
+        help='day after the last day as YYYY-MM-DD',
+        type=parse_date)
+    add_broker_arguments(backtest_parser)
+    backtest_parser.set_defaults(func=backtest)
+    sweep_parser = subparsers.add_parser(
+        'sweep',
+        help='backtest many broker configurations in parallel')
+    sweep_parser.add_argument(
+        'pair',
+        help='asset pair, e.g. XXBTZEUR')
+    sweep_parser.add_argument(
+        'history',
+        help='history file, dumped from the DB unless it holds the pair '
+             'and time range')
+    sweep_parser.add_argument(
+        '--param',
+        dest='params',
+        help='NAME=V1,V2,... or NAME=LOW:HIGH, can be given several times',
+        type=parse_param,
+        action='append')
+    sweep_parser.add_argument(
+        '--samples',
+        help='number of random configurations instead of a full grid',
+        type=int)
+    sweep_parser.add_argument(
+        '--seed',
+        type=int)
+    sweep_parser.add_argument(
+        '--jobs',
+        help='number of worker processes',
+        type=int)
+    sweep_parser.add_argument(
+        '--checkpoint',
+        help='file to store results in and resume from')
+    sweep_parser.add_argument(
+        '--start',
+        help='first day as YYYY-MM-DD',
+        type=parse_date)
+    sweep_parser.add_argument(
+        '--end',
+        help='day after the last day as YYYY-MM-DD',
+        type=parse_date)
+    sweep_parser.add_argument(
+        '--funds',
+        type=float,
+        default=1000.)
+    sweep_parser.add_argument(
+        '--fee',
+        help='ask and bid fee as fraction',
+        type=float,
+        default=0.0026)
+    sweep_parser.add_argument(
+        '--top',
+        help='number of best configurations to print',
+        type=int,
+        default=10)
+    sweep_parser.set_defaults(func=sweep)
+    run_parser = subparsers.add_parser(
+        'run',
+        help='trade on live tickers without a DB round trip')
+    run_parser.add_argument(
+        'pair',
+        help='asset pair, e.g. XXBTZEUR')
+    run_parser.add_argument(
+        '--uri',
+        dest='uri',
+        help='base URI of the Kraken REST API',
+        default=KRAKEN_URI)
+    run_parser.add_argument(
+        '--tick-rate',
+        dest='tick_rate',
+        help='seconds between ticker polls',
+        type=float,
+        default=10.)
+    run_parser.add_argument(
+        '--warmup',
+        help='number of tickers before the first decision',
+        type=int,
+        default=10)
+    run_parser.add_argument(
+        '--no-persist',
+        dest='no_persist',
+        help='do not store the tickers in the DB',
+        action='store_true')
+    run_parser.add_argument(
+        '--bulk',
+        dest='bulk',
+        help='insert ticker with COPY',
+        action='store_true')
+    run_parser.add_argument(
+        '--spill-dir',
+        dest='spill_dir',
+        help='directory to spill buffered rows to if the DB is slow')
+    run_parser.add_argument(
+        '--metrics-port',
+        dest='metrics_port',
+        help='serve Prometheus metrics on this local port',
+        type=int)
+    add_broker_arguments(run_parser)
+    run_parser.set_defaults(func=trade)
     interact_parser = subparsers.add_parser(
         'interact',
         help='interactive IPython shell')
@@ -2,9 +2,16 @@
 """
 Collector storing Kraken's public data in Mongo DB for later analysis
 """
+import time
 import signal
 import logging
 import asyncio
+from datetime import datetime
+
+from .kraken import RateLimiter
+from .metrics import CollectorMetrics, serve
+from .db import (ticker_records, depth_records, trade_records,
+                 spread_records)
 
 __author__ = "Florian Wilhelm"
 __copyright__ = "Florian Wilhelm"
@@ -15,67 +22,293 @@ _logger = logging.getLogger(__name__)
 
 def signal_handler():
     _logger.info("Signal handler called...")
-    for task in asyncio.Task.all_tasks():
-        task.cancel()
     loop = asyncio.get_event_loop()
+    for task in asyncio.all_tasks(loop):
+        task.cancel()
     loop.stop()
 
 
 class Collector(object):
-    def __init__(self, db_client, kraken_api, pairs, rates):
+    def __init__(self, db_client, kraken_api, pairs, rates, limiter=None,
+                 concurrency=4, buffer=None, depth_encoder=None,
+                 metrics=None, metrics_port=None):
         self.db_client = db_client
+        self.buffer = buffer
+        self.depth_encoder = depth_encoder
         self.api = kraken_api
         self.rates = rates
         self.pairs = pairs
+        self.limiter = RateLimiter() if limiter is None else limiter
+        self.concurrency = concurrency
+        self.metrics = CollectorMetrics() if metrics is None else metrics
+        self.metrics_port = metrics_port
+        if buffer is not None:
+            self.metrics.queue_size.set_function(buffer.queue.qsize,
+                                                 queue='write_buffer')
+        self._cursors = {}
+        self._subscribers = {}
         self._nerrors = 0
+        self._tasks = []
+
+    def subscribe(self, endpoint, maxsize=100):
+        """Queue receiving the parsed responses of `endpoint`
+
+        Items are tuples of the `perf_counter` and POSIX time of receipt
+        and the response. If a consumer falls behind, the oldest items are
+        dropped so that polling never waits for it.
+
+        Returns:
+            :obj:`asyncio.Queue`: queue of received responses
+        """
+        queue = asyncio.Queue(maxsize=maxsize)
+        self._subscribers.setdefault(endpoint, []).append(queue)
+        self.metrics.queue_size.set_function(queue.qsize, queue=endpoint)
+        return queue
+
+    def _publish(self, endpoint, resp):
+        item = (time.perf_counter(), time.time(), resp)
+        for queue in self._subscribers.get(endpoint, []):
+            if queue.full():
+                queue.get_nowait()
+                self.metrics.errors.inc(type='QueueOverflow')
+            queue.put_nowait(item)
+
+    def _count_error(self, error_type):
+        self._nerrors += 1
+        self.metrics.errors.inc(type=error_type)
 
     async def _call_api(self, func, *args):
-        resp = await self._call_async(func, *args)
+        await self.limiter.acquire()
+        with self.metrics.api_latency.time(endpoint=func.__name__):
+            if self.api.is_async:
+                resp = await self._await(func(*args))
+            else:
+                resp = await self._call_async(func, *args)
         if not resp['error']:
             return resp['result']
         else:
             _logger.error(resp['error'])
-            self._nerrors += 1
+            if not resp.get('exception'):
+                self._count_error(str(resp['error'][0]))
             return None
 
-    async def _call_async(self, func, *args):
+    async def _run_in_executor(self, func, *args):
         loop = asyncio.get_event_loop()
+        self.metrics.executor_busy.inc()
         try:
             return await loop.run_in_executor(None, func, *args)
+        finally:
+            self.metrics.executor_busy.dec()
+
+    async def _call_async(self, func, *args):
+        return await self._await(self._run_in_executor(func, *args))
+
+    async def _await(self, awaitable):
+        try:
+            return await awaitable
         except asyncio.CancelledError:
             _logger.info("Task cancelled...")
             raise
         except Exception as e:
             _logger.exception("General error:")
-            self._nerrors += 1
-            return {'error': str(e)}
+            self._count_error(type(e).__name__)
+            return {'error': [str(e)], 'exception': True}
+
+    async def _write_db(self, table, nrows, func, *args):
+        """Write with `func` in the executor, False if that failed"""
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        try:
+            await self._run_in_executor(func, *args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _logger.exception("Writing to DB failed:")
+            self._count_error(type(e).__name__)
+            return False
+        else:
+            self.metrics.db_latency.observe(loop.time() - start, table=table)
+            self.metrics.rows_written.inc(nrows, table=table)
+            return True
+
+    async def _insert_ticker(self, ticker):
+        if self.db_client is None:
+            return
+        elif self.buffer is None:
+            await self._write_db('ticker', len(ticker),
+                                 self.db_client.insert_ticker, ticker)
+        else:
+            records = ticker_records(ticker, datetime.utcnow())
+            await self.buffer.put('ticker', records)
+
+    async def _insert_depth(self, depth):
+        if self.db_client is None:
+            return
+        elif self.depth_encoder is not None:
+            records = self.depth_encoder.records(depth, datetime.utcnow())
+            if not await self._write_records({'depth_book': records}):
+                # later deltas would refer to books that were never stored
+                self.depth_encoder.reset(depth)
+        elif self.buffer is None:
+            nrows = sum(len(orders) for book in depth.values()
+                        for orders in book.values())
+            await self._write_db('depth', nrows,
+                                 self.db_client.insert_depth, depth)
+        else:
+            records = depth_records(depth, datetime.utcnow())
+            await self.buffer.put('depth', records)
+
+    async def _write_records(self, batches):
+        """Write or buffer records, False if writing them failed
+
+        Buffered records are spilled or retried on errors and reach the
+        database in order, so buffering counts as success.
+        """
+        if self.buffer is None:
+            nrows = sum(len(records) for records in batches.values())
+            return await self._write_db('+'.join(sorted(batches)), nrows,
+                                        self.db_client.write_records,
+                                        batches)
+        else:
+            await self.buffer.put_batches(batches)
+            return True
 
     async def poll_ticker(self):
         while True:
             _logger.info("Polling ticker...")
             resp = await self._call_api(self.api.ticker, self.pairs)
             if resp:
-                await self._call_async(self.db_client.insert_ticker, resp)
+                self._publish('ticker', resp)
+                await self._insert_ticker(resp)
             await asyncio.sleep(self.rates['ticker'])
 
+    async def _poll_pair_depth(self, pair, semaphore):
+        async with semaphore:
+            resp = await self._call_api(self.api.depth, pair)
+        if resp:
+            self._publish('depth', resp)
+            await self._insert_depth(resp)
+
     async def poll_depth(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
         while True:
             _logger.info("Polling depth...")
-            for pair in self.pairs:
-                resp = await self._call_api(self.api.depth, pair)
-                if resp:
-                    await self._call_async(self.db_client.insert_depth, resp)
+            await asyncio.gather(*[self._poll_pair_depth(pair, semaphore)
+                                   for pair in self.pairs])
             await asyncio.sleep(self.rates['depth'])
 
-    def start(self):
+    async def _insert_events(self, endpoint, pair, events, last):
+        if self.db_client is None:
+            return
+        elif self.buffer is None:
+            insert = getattr(self.db_client, 'insert_' + endpoint)
+            await self._write_db(endpoint, len(events), insert, pair,
+                                 events, last)
+        else:
+            to_records = {'trades': trade_records,
+                          'spreads': spread_records}[endpoint]
+            await self.buffer.put_batches(
+                {endpoint: to_records(pair, events),
+                 'cursors': [(endpoint, pair, last)]})
+
+    async def _poll_pair_events(self, endpoint, func, pair, semaphore):
+        cursors = self._cursors[endpoint]
+        async with semaphore:
+            resp = await self._call_api(func, pair, cursors.get(pair))
+        if resp:
+            last = str(resp.pop('last'))
+            events = resp.popitem()[1] if resp else []
+            if last != cursors.get(pair):
+                self._publish(endpoint, (pair, events))
+                await self._insert_events(endpoint, pair, events, last)
+                cursors[pair] = last
+
+    async def _load_cursors(self, endpoint):
+        """Load the cursors of `endpoint` once, False if that failed"""
+        if endpoint in self._cursors:
+            return True
+        elif self.db_client is None:
+            self._cursors[endpoint] = {}
+            return True
+        try:
+            cursors = await self._run_in_executor(
+                self.db_client.load_cursors, endpoint)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _logger.exception("Loading cursors failed:")
+            self._count_error(type(e).__name__)
+            return False
+        self._cursors[endpoint] = cursors
+        return True
+
+    async def _poll_events(self, endpoint, func):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            _logger.info("Polling {}...".format(endpoint))
+            if await self._load_cursors(endpoint):
+                await asyncio.gather(*[
+                    self._poll_pair_events(endpoint, func, pair, semaphore)
+                    for pair in self.pairs])
+            await asyncio.sleep(self.rates[endpoint])
+
+    async def poll_trades(self):
+        await self._poll_events('trades', self.api.trades)
+
+    async def poll_spread(self):
+        await self._poll_events('spreads', self.api.spread)
+
+    async def roll_partitions(self):
+        while True:
+            _logger.info("Rolling partitions forward...")
+            await self._call_async(self.db_client.create_partitions)
+            await asyncio.sleep(self.rates.get('partitions', 24 * 3600))
+
+    async def monitor_loop_lag(self, interval=1.):
+        loop = asyncio.get_event_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.metrics.loop_lag.observe(
+                max(loop.time() - start - interval, 0.))
+
+    def tasks(self):
+        """Coroutines collecting and storing the data"""
+        coros = [self.poll_ticker()]
+        if 'depth' in self.rates:
+            coros.append(self.poll_depth())
+        if self.db_client is not None:
+            coros.append(self.roll_partitions())
+        if 'trades' in self.rates:
+            coros.append(self.poll_trades())
+        if 'spreads' in self.rates:
+            coros.append(self.poll_spread())
+        if self.buffer is not None:
+            coros.append(self.buffer.run())
+        return coros
+
+    def finished_tasks(self):
+        """Tasks of :meth:`tasks` that ended, e.g. by an unhandled error"""
+        return [task for task in self._tasks if task.done()]
+
+    def start(self, *coros):
+        """Run the pollers and the additional `coros` until a signal
+
+        Without a `db_client` nothing is persisted, which only makes sense
+        if some of the `coros` consume :meth:`subscribe` queues.
+        """
         _logger.info("Starting event loop...")
         loop = asyncio.get_event_loop()
         if _logger.getEffectiveLevel() < logging.INFO:
             loop.set_debug(True)
         loop.add_signal_handler(signal.SIGINT, signal_handler)
         loop.add_signal_handler(signal.SIGTERM, signal_handler)
-        loop.create_task(self.poll_ticker())
-        loop.create_task(self.poll_depth())
+        self._tasks = [loop.create_task(coro) for coro in self.tasks()]
+        for coro in coros:
+            loop.create_task(coro)
+        if self.metrics_port is not None:
+            loop.create_task(self.monitor_loop_lag())
+            loop.run_until_complete(serve(self.metrics, self.metrics_port))
         try:
             loop.run_forever()
         except asyncio.CancelledError:
@@ -85,4 +318,8 @@ class Collector(object):
             raise
         finally:
             _logger.info("Stopping event loop...")
+            if self.buffer is not None:
+                loop.run_until_complete(self.buffer.close())
+            if self.api.is_async:
+                loop.run_until_complete(self.api.close())
             loop.close()
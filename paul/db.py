@@ -2,12 +2,19 @@
 """
 Database related functionality
 """
+import io
+import re
 import logging
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, date
 
+import pandas as pd
 from sqlalchemy import (Table, Column, Integer, String, MetaData,
-                        create_engine, DateTime, Numeric)
+                        create_engine, DateTime, Numeric, Boolean, Float,
+                        Index, select, func, type_coerce, text, cast)
+from sqlalchemy.dialects.postgresql import insert
+
+from .depth import rebuild_book
 
 __author__ = "Florian Wilhelm"
 __copyright__ = "Florian Wilhelm"
@@ -37,6 +44,12 @@ class Spread(object):
     ask = 'ask'
 
 
+class Cursor(object):
+    endpoint = 'endpoint'
+    pair = 'pair'
+    last = 'last'
+
+
 class Ticker(object):
     createtime = 'createtime'
     pair = 'pair'
@@ -69,26 +82,283 @@ class Depth(object):
     timestamp = 'timestamp'
 
 
-def create_metadata():
+class DepthBook(object):
+    createtime = 'createtime'
+    pair = 'pair'
+    order = 'order'
+    price = 'price'
+    vol = 'volume'
+    timestamp = 'timestamp'
+    keyframe = 'keyframe'
+
+
+TICKER_COLS = [Ticker.createtime, Ticker.pair,
+               Ticker.ask_price, Ticker.ask_vol,
+               Ticker.bid_price, Ticker.bid_vol,
+               Ticker.last_price, Ticker.last_volume,
+               Ticker.vol_day, Ticker.vol_24h,
+               Ticker.vwa_price_day, Ticker.vwa_price_24h,
+               Ticker.n_trades_day, Ticker.n_trades_24h,
+               Ticker.low_day, Ticker.low_24h,
+               Ticker.high_day, Ticker.high_24h,
+               Ticker.open_price]
+DEPTH_COLS = [Depth.createtime, Depth.pair, Depth.order, Depth.idx,
+              Depth.price, Depth.vol, Depth.timestamp]
+
+
+TRADE_COLS = [Trade.createtime, Trade.pair, Trade.price, Trade.volume,
+              Trade.order, Trade.type, Trade.misc]
+SPREAD_COLS = [Spread.createtime, Spread.pair, Spread.bid, Spread.ask]
+CURSOR_COLS = [Cursor.endpoint, Cursor.pair, Cursor.last]
+DEPTH_BOOK_COLS = [DepthBook.createtime, DepthBook.pair, DepthBook.order,
+                   DepthBook.price, DepthBook.vol, DepthBook.timestamp,
+                   DepthBook.keyframe]
+RECORD_COLS = {'ticker': TICKER_COLS,
+               'depth': DEPTH_COLS,
+               'trades': TRADE_COLS,
+               'spreads': SPREAD_COLS,
+               'cursors': CURSOR_COLS,
+               'depth_book': DEPTH_BOOK_COLS}
+
+
+def trade_records(pair, trades):
+    """Raw trade records in the order of :obj:`TRADE_COLS`
+
+    Args:
+        pair (str): asset pair
+        trades (list): trades of the pair as returned by the Kraken API
+
+    Returns:
+        list: list of tuples
+    """
+    return [(datetime.utcfromtimestamp(float(t[2])).isoformat(), pair,
+             t[0], t[1], t[3], t[4], t[5])
+            for t in trades]
+
+
+def spread_records(pair, spreads):
+    """Raw spread records in the order of :obj:`SPREAD_COLS`
+
+    Args:
+        pair (str): asset pair
+        spreads (list): spreads of the pair as returned by the Kraken API
+
+    Returns:
+        list: list of tuples
+    """
+    return [(datetime.utcfromtimestamp(float(s[0])).isoformat(), pair,
+             s[1], s[2])
+            for s in spreads]
+
+
+def ticker_records(ticker, createtime):
+    """Raw ticker records in the order of :obj:`TICKER_COLS`
+
+    Values are kept as the strings Kraken delivers, no type conversion
+    is done.
+
+    Args:
+        ticker (dict): ticker result of the Kraken API
+        createtime (datetime): creation time of the records
+
+    Returns:
+        list: list of tuples
+    """
+    createtime = createtime.isoformat()
+    return [(createtime, pair,
+             info['a'][0], info['a'][2],
+             info['b'][0], info['b'][2],
+             info['c'][0], info['c'][1],
+             info['v'][0], info['v'][1],
+             info['p'][0], info['p'][1],
+             info['t'][0], info['t'][1],
+             info['l'][0], info['l'][1],
+             info['h'][0], info['h'][1],
+             info['o'])
+            for pair, info in ticker.items()]
+
+
+def depth_records(depth, createtime):
+    """Raw depth records in the order of :obj:`DEPTH_COLS`
+
+    Args:
+        depth (dict): depth result of the Kraken API
+        createtime (datetime): creation time of the records
+
+    Returns:
+        list: list of tuples
+    """
+    createtime = createtime.isoformat()
+    # levels often share their timestamp, formatting is the costly part
+    timestamps = {}
+
+    def fmt(timestamp):
+        text = timestamps.get(timestamp)
+        if text is None:
+            text = timestamps[timestamp] = datetime.utcfromtimestamp(
+                timestamp).isoformat()
+        return text
+
+    return [(createtime, pair, order_type, idx, array[0], array[1],
+             fmt(array[2]))
+            for pair, trades in depth.items()
+            for order_type, orders in trades.items()
+            for idx, array in enumerate(orders)]
+
+
+def ticker_rows(ticker, createtime):
+    """Rows of a ticker result as dicts for an INSERT"""
+    return [{Ticker.createtime: createtime,
+             Ticker.pair: pair,
+             Ticker.ask_price: Decimal(info['a'][0]),
+             Ticker.ask_vol: Decimal(info['a'][2]),
+             Ticker.bid_price: Decimal(info['b'][0]),
+             Ticker.bid_vol: Decimal(info['b'][2]),
+             Ticker.last_price: Decimal(info['c'][0]),
+             Ticker.last_volume: Decimal(info['c'][1]),
+             Ticker.vol_day: Decimal(info['v'][0]),
+             Ticker.vol_24h: Decimal(info['v'][1]),
+             Ticker.vwa_price_day: Decimal(info['p'][0]),
+             Ticker.vwa_price_24h: Decimal(info['p'][1]),
+             Ticker.n_trades_day: int(info['t'][0]),
+             Ticker.n_trades_24h: int(info['t'][1]),
+             Ticker.low_day: Decimal(info['l'][0]),
+             Ticker.low_24h: Decimal(info['l'][1]),
+             Ticker.high_day: Decimal(info['h'][0]),
+             Ticker.high_24h: Decimal(info['h'][1]),
+             Ticker.open_price: Decimal(info['o'])}
+            for pair, info in ticker.items()]
+
+
+def depth_rows(depth, createtime):
+    """Rows of a depth result as dicts for an INSERT"""
+    return [{Depth.createtime: createtime,
+             Depth.pair: pair,
+             Depth.order: order_type,
+             Depth.idx: idx,
+             Depth.price: Decimal(array[0]),
+             Depth.vol: Decimal(array[1]),
+             Depth.timestamp: datetime.utcfromtimestamp(array[2])}
+            for pair, trades in depth.items()
+            for order_type, orders in trades.items()
+            for idx, array in enumerate(orders)]
+
+
+# escapes of COPY's text format, the backslash has to come first
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n',
+                              '\r': '\\r'})
+
+
+def copy_buffer(records):
+    """Text buffer of records in PostgreSQL's COPY format
+
+    Values containing a backslash, tab or line break are escaped. As such
+    values are rare, the buffer is built without escaping first and only
+    rebuilt with escaping if counting the special characters reveals any.
+    """
+    def fmt(value):
+        return '\\N' if value is None else str(value)
+
+    def fmt_escaped(value):
+        return '\\N' if value is None else str(value).translate(COPY_ESCAPES)
+
+    records = list(records)
+    n_nulls = sum(record.count(None) for record in records)
+    # records without NULL, i.e. nearly all, skip the per value check
+    text = ''.join('\t'.join(map(fmt if n_nulls and None in record else str,
+                                 record)) + '\n'
+                   for record in records)
+    n_tabs = sum(len(record) - 1 for record in records)
+    if (text.count('\t') != n_tabs or text.count('\n') != len(records) or
+            text.count('\\') != n_nulls or '\r' in text):
+        text = ''.join('\t'.join(map(fmt_escaped, record)) + '\n'
+                       for record in records)
+    return io.StringIO(text)
+
+
+def select_range(table, pair, start=None, end=None, columns=None):
+    """Query of rows of a pair in the time range [start, end)
+
+    Numeric columns are returned as floats.
+
+    Args:
+        table (:obj:`Table`): table with `pair` and `createtime` columns
+        pair (str): asset pair
+        start (datetime): inclusive start or None
+        end (datetime): exclusive end or None
+        columns (list): column names, all but `id` if None
+
+    Returns:
+        :obj:`Select`: query ordered by createtime
+    """
+    if columns is None:
+        columns = [col.name for col in table.columns if col.name != 'id']
+    cols = [type_coerce(table.c[name], Float).label(name)
+            if isinstance(table.c[name].type, Numeric) else table.c[name]
+            for name in columns]
+    createtime = table.c['createtime']
+    query = select(*cols).where(table.c['pair'] == pair)
+    if start is not None:
+        query = query.where(createtime >= start)
+    if end is not None:
+        query = query.where(createtime < end)
+    return query.order_by(createtime)
+
+
+PARTITIONED_TABLES = ['trades', 'spreads', 'ticker', 'depth', 'depth_book']
+PARTITION_KWARGS = {'postgresql_partition_by': 'RANGE (createtime)'}
+PARTITION_RE = re.compile(r'^.+_y(\d{4})m(\d{2})$')
+
+
+def month_start(day, offset=0):
+    """First day of the month `offset` months after the month of `day`"""
+    month = day.year * 12 + day.month - 1 + offset
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    """Name of the partition of a table holding the given month"""
+    return '{}_y{:04d}m{:02d}'.format(table, month.year, month.month)
+
+
+def create_metadata(partitioned=True):
+    """Metadata of all tables
+
+    Args:
+        partitioned (bool): partition tables by month of `createtime`,
+            only supported by PostgreSQL
+
+    Returns:
+        :obj:`MetaData`: metadata
+    """
+    def keys():
+        # the partition key must be part of the primary key
+        return [Column('id', Integer, primary_key=True, autoincrement=True),
+                Column('createtime', DateTime, primary_key=partitioned)]
+
+    opts = PARTITION_KWARGS if partitioned else {}
     metadata = MetaData()
     Table('trades', metadata,
-          Column('id', Integer, primary_key=True),
-          Column(Trade.createtime, DateTime),
+          *keys(),
           Column(Trade.pair, String),
           Column(Trade.volume, VOL_PREC),
           Column(Trade.price, PRICE_PREC),
           Column(Trade.order, String),
           Column(Trade.type, String),
-          Column(Trade.misc, String))
+          Column(Trade.misc, String),
+          **opts)
     Table('spreads', metadata,
-          Column('id', Integer, primary_key=True),
-          Column(Spread.createtime, DateTime),
+          *keys(),
           Column(Spread.pair, String),
           Column(Spread.bid, PRICE_PREC),
-          Column(Spread.ask, PRICE_PREC))
+          Column(Spread.ask, PRICE_PREC),
+          **opts)
+    Table('cursors', metadata,
+          Column(Cursor.endpoint, String, primary_key=True),
+          Column(Cursor.pair, String, primary_key=True),
+          Column(Cursor.last, String))
     Table('ticker', metadata,
-          Column('id', Integer, primary_key=True),
-          Column(Ticker.createtime, DateTime),
+          *keys(),
           Column(Ticker.pair, String),
           Column(Ticker.ask_price, PRICE_PREC),
           Column(Ticker.ask_vol, VOL_PREC),
@@ -106,88 +376,414 @@ def create_metadata():
           Column(Ticker.low_24h, PRICE_PREC),
           Column(Ticker.high_day, PRICE_PREC),
           Column(Ticker.high_24h, PRICE_PREC),
-          Column(Ticker.open_price, PRICE_PREC)
-          )
+          Column(Ticker.open_price, PRICE_PREC),
+          **opts)
     Table('depth', metadata,
-          Column('id', Integer, primary_key=True),
-          Column(Depth.createtime, DateTime),
+          *keys(),
           Column(Depth.pair, String),
           Column(Depth.order, String),
           Column(Depth.idx, Integer),
           Column(Depth.price, PRICE_PREC),
           Column(Depth.vol, VOL_PREC),
-          Column(Depth.timestamp, DateTime)
-          )
+          Column(Depth.timestamp, DateTime),
+          **opts)
+    Table('depth_book', metadata,
+          *keys(),
+          Column(DepthBook.pair, String),
+          Column(DepthBook.order, String),
+          Column(DepthBook.price, PRICE_PREC),
+          Column(DepthBook.vol, VOL_PREC),
+          Column(DepthBook.timestamp, DateTime),
+          Column(DepthBook.keyframe, Boolean),
+          **opts)
+    for name in PARTITIONED_TABLES:
+        table = metadata.tables[name]
+        Index('ix_{}_pair_createtime'.format(name),
+              table.c['pair'], table.c['createtime'])
+    for name in ('depth', 'depth_book'):
+        table = metadata.tables[name]
+        Index('ix_{}_createtime_brin'.format(name), table.c['createtime'],
+              postgresql_using='brin')
     return metadata
 
 
 class DBClient(object):
-    def __init__(self):
-        self.engine = create_engine(DB_URI)
-        self.metadata = create_metadata()
+    """Client to the database
+
+    Args:
+        uri (str): database URI
+        bulk (bool): insert ticker and depth with COPY instead of INSERT
+    """
+    def __init__(self, uri=DB_URI, bulk=False):
+        self.bulk = bulk
+        self.engine = create_engine(uri)
+        self.metadata = create_metadata(partitioned=self.is_postgres)
         self.trades = self.metadata.tables['trades']
         self.spreads = self.metadata.tables['spreads']
         self.ticker = self.metadata.tables['ticker']
         self.depth = self.metadata.tables['depth']
+        self.cursors = self.metadata.tables['cursors']
+        self.depth_book = self.metadata.tables['depth_book']
+
+    @property
+    def is_postgres(self):
+        return self.engine.dialect.name == 'postgresql'
 
     def create_tables(self):
-        self.metadata.create_all(self.engine)
-
-    def insert_trades(self, pair, trades):
-        cols = [Trade.price, Trade.volume, Trade.createtime, Trade.order,
-                Trade.type, Trade.misc]
-        data = [dict(zip(cols, t)) for t in trades]
-        for d in data:
-            d[Trade.pair] = pair
+        """Create all tables and the partitions up to the next months
+
+        Existing tables without partitioning are migrated, i.e. renamed,
+        recreated as partitioned tables and their rows copied over. All of
+        it happens in one transaction, so a failure leaves the schema as
+        it was.
+        """
+        if not self.is_postgres:
+            self.metadata.create_all(self.engine)
+            return
+        today = datetime.utcnow().date()
+        with self.engine.begin() as conn:
+            legacy = self._rename_legacy_tables(conn)
+            self.metadata.create_all(conn)
+            self._create_partitions(conn, today, month_start(today, 2))
+            for name in legacy:
+                self._migrate_legacy_table(conn, name)
+
+    @staticmethod
+    def _rename_legacy_tables(conn):
+        query = text("""
+            SELECT c.relname FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = current_schema() AND c.relkind = 'r'
+            AND c.relname = ANY(:names)""")
+        legacy = [row[0] for row in
+                  conn.execute(query, {'names': PARTITIONED_TABLES})]
+        for name in legacy:
+            _logger.info("Renaming unpartitioned {} for migration".format(
+                name))
+            # indexes and the id sequence would clash with the new table
+            indexes = conn.execute(text(
+                "SELECT indexrelid::regclass::text FROM pg_index "
+                "WHERE indrelid = CAST(:name AS regclass)"),
+                {'name': name}).scalars().all()
+            sequence = conn.execute(text(
+                "SELECT pg_get_serial_sequence(:name, 'id')"),
+                {'name': name}).scalar()
+            conn.execute(text('ALTER TABLE {0} RENAME TO {0}_legacy'
+                              .format(name)))
+            for index in indexes:
+                conn.execute(text('ALTER INDEX {0} RENAME TO {0}_legacy'
+                                  .format(index)))
+            if sequence is not None:
+                conn.execute(text('ALTER SEQUENCE {0} RENAME TO {1}_legacy'
+                                  .format(sequence,
+                                          sequence.split('.')[-1])))
+        return legacy
+
+    def _migrate_legacy_table(self, conn, name):
+        legacy = '{}_legacy'.format(name)
+        cols = ', '.join('"{}"'.format(col.name)
+                         for col in self.metadata.tables[name].columns)
+        first, last = conn.execute(text(
+            'SELECT min(createtime), max(createtime) FROM {}'.format(
+                legacy))).one()
+        if first is not None:
+            self._create_partitions(conn, first.date(), last.date())
+        result = conn.execute(text(
+            'INSERT INTO {0} ({1}) SELECT {1} FROM {2} '
+            'WHERE createtime IS NOT NULL'.format(name, cols, legacy)))
+        conn.execute(text(
+            "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+            "coalesce(max(id), 0) + 1, false) FROM {0}".format(name)))
+        conn.execute(text('DROP TABLE {}'.format(legacy)))
+        _logger.info("Migrated {} rows of {} into partitions".format(
+            result.rowcount, name))
+
+    def create_partitions(self, months_ahead=2):
+        """Create monthly partitions up to `months_ahead` future months
+
+        Call this regularly, e.g. daily, to roll partitions forward.
+        """
+        if not self.is_postgres:
+            return
+        today = datetime.utcnow().date()
+        with self.engine.begin() as conn:
+            self._create_partitions(conn, today,
+                                    month_start(today, months_ahead))
+
+    @staticmethod
+    def _create_partitions(conn, first, last):
+        """Create the DEFAULT partitions and the monthly ones in a range
+
+        Rows outside of all monthly partitions, e.g. old trades of a first
+        poll, go to the DEFAULT partition. A new monthly partition takes
+        over the rows of its month from there, since PostgreSQL rejects a
+        partition for values that are in the DEFAULT partition.
+        """
+        for name in PARTITIONED_TABLES:
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS {0}_default PARTITION OF {0} "
+                "DEFAULT".format(name)))
+        month = month_start(first)
+        while month <= last:
+            end = month_start(month, 1)
+            for name in PARTITIONED_TABLES:
+                partition = partition_name(name, month)
+                exists = conn.execute(text('SELECT to_regclass(:name)'),
+                                      {'name': partition}).scalar()
+                if exists is not None:
+                    continue
+                conn.execute(text(
+                    'CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS '
+                    'INCLUDING CONSTRAINTS)'.format(partition, name)))
+                conn.execute(text(
+                    "WITH moved AS (DELETE FROM {0}_default WHERE "
+                    "createtime >= '{2}' AND createtime < '{3}' "
+                    "RETURNING *) INSERT INTO {1} SELECT * FROM moved"
+                    .format(name, partition, month, end)))
+                conn.execute(text(
+                    "ALTER TABLE {} ATTACH PARTITION {} "
+                    "FOR VALUES FROM ('{}') TO ('{}')".format(
+                        name, partition, month, end)))
+            month = end
+
+    def drop_partitions(self, before):
+        """Drop all partitions holding only data before a given day
+
+        Older rows in the DEFAULT partitions are deleted as well.
+
+        Args:
+            before (date): partitions ending on or before are dropped
+
+        Returns:
+            list: names of the dropped partitions
+        """
+        if not self.is_postgres:
+            return []
+        query = text("""
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+            JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+            WHERE parent.relname = ANY(:names)
+            AND parent.relnamespace = CAST(current_schema() AS regnamespace)
+            """)
+        dropped = []
         with self.engine.begin() as conn:
-            return conn.execute(self.trades.insert(), data)
+            for (name,) in conn.execute(query,
+                                        {'names': PARTITIONED_TABLES}):
+                match = PARTITION_RE.match(name)
+                if match is None:
+                    continue
+                month = date(int(match.group(1)), int(match.group(2)), 1)
+                if month_start(month, 1) <= before:
+                    conn.execute(text('DROP TABLE {}'.format(name)))
+                    dropped.append(name)
+            for name in PARTITIONED_TABLES:
+                conn.execute(text(
+                    "DELETE FROM {}_default WHERE createtime < '{}'".format(
+                        name, before)))
+        _logger.info("Dropped partitions {}".format(dropped))
+        return dropped
 
-    def insert_spreads(self, pair, spreads):
-        cols = [Spread.createtime, Spread.bid, Spread.ask]
-        data = [dict(zip(cols, s)) for s in spreads]
-        for d in data:
-            d[Spread.pair] = pair
+    def copy_records(self, table, cols, records):
+        """Stream records into a table with COPY ... FROM STDIN
+
+        Args:
+            table (:obj:`Table`): target table
+            cols (list): column names in the order of the records
+            records (iterable): tuples of values
+        """
+        conn = self.engine.raw_connection()
+        try:
+            with conn.cursor() as cursor:
+                self._copy(cursor, table, cols, records)
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _copy(cursor, table, cols, records):
+        sql = 'COPY {} ({}) FROM STDIN'.format(
+            table.name, ', '.join('"{}"'.format(col) for col in cols))
+        cursor.copy_expert(sql, copy_buffer(records))
+
+    def _upsert_cursors(self, conn, records):
+        # cursors only move forward, also if older batches are replayed
+        latest = {}
+        for record in records:
+            key = tuple(record[:2])
+            if key not in latest or (Decimal(record[2]) >
+                                     Decimal(latest[key][2])):
+                latest[key] = record
+        data = [dict(zip(CURSOR_COLS, r)) for r in latest.values()]
+        stmt = insert(self.cursors)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Cursor.endpoint, Cursor.pair],
+            set_={Cursor.last: stmt.excluded[Cursor.last]},
+            where=(cast(stmt.excluded[Cursor.last], Numeric) >
+                   cast(self.cursors.c[Cursor.last], Numeric)))
+        conn.execute(stmt, data)
+
+    def write_records(self, batches):
+        """Write records of several tables in one transaction
+
+        Records of the `cursors` table update existing cursors.
+
+        Args:
+            batches (dict): table name to list of records in the order of
+                :obj:`RECORD_COLS`
+        """
         with self.engine.begin() as conn:
-            return conn.execute(self.spreads.insert(), data)
+            for name, records in batches.items():
+                if not records:
+                    continue
+                table = self.metadata.tables[name]
+                cols = RECORD_COLS[name]
+                if name == 'cursors':
+                    self._upsert_cursors(conn, records)
+                elif self.bulk:
+                    with conn.connection.cursor() as cursor:
+                        self._copy(cursor, table, cols, records)
+                else:
+                    data = [dict(zip(cols, r)) for r in records]
+                    conn.execute(table.insert(), data)
+
+    def load_cursors(self, endpoint):
+        """Load the `since` cursors of an endpoint
+
+        Args:
+            endpoint (str): name of the endpoint, e.g. `trades`
+
+        Returns:
+            dict: pair to last cursor
+        """
+        query = (select(self.cursors.c[Cursor.pair],
+                        self.cursors.c[Cursor.last])
+                 .where(self.cursors.c[Cursor.endpoint] == endpoint))
+        with self.engine.connect() as conn:
+            return dict(conn.execute(query).fetchall())
+
+    def insert_trades(self, pair, trades, last=None):
+        batches = {'trades': trade_records(pair, trades)}
+        if last is not None:
+            batches['cursors'] = [('trades', pair, str(last))]
+        return self.write_records(batches)
+
+    def insert_spreads(self, pair, spreads, last=None):
+        batches = {'spreads': spread_records(pair, spreads)}
+        if last is not None:
+            batches['cursors'] = [('spreads', pair, str(last))]
+        return self.write_records(batches)
 
     def insert_ticker(self, ticker):
         _logger.info("Inserting ticker into DB")
         utcnow = datetime.utcnow()
-        data = [{Ticker.createtime: utcnow,
-                 Ticker.pair: pair,
-                 Ticker.ask_price: Decimal(info['a'][0]),
-                 Ticker.ask_vol: Decimal(info['a'][2]),
-                 Ticker.bid_price: Decimal(info['b'][0]),
-                 Ticker.bid_vol: Decimal(info['b'][2]),
-                 Ticker.last_price: Decimal(info['c'][0]),
-                 Ticker.last_volume: Decimal(info['c'][1]),
-                 Ticker.vol_day: Decimal(info['v'][0]),
-                 Ticker.vol_24h: Decimal(info['v'][1]),
-                 Ticker.vwa_price_day: Decimal(info['p'][0]),
-                 Ticker.vwa_price_24h: Decimal(info['p'][1]),
-                 Ticker.n_trades_day: int(info['t'][0]),
-                 Ticker.n_trades_24h: int(info['t'][1]),
-                 Ticker.low_day: Decimal(info['l'][0]),
-                 Ticker.low_24h: Decimal(info['l'][1]),
-                 Ticker.high_day: Decimal(info['h'][0]),
-                 Ticker.high_24h: Decimal(info['h'][1]),
-                 Ticker.open_price: Decimal(info['o'])}
-                for pair, info in ticker.items()]
+        if self.bulk:
+            records = ticker_records(ticker, utcnow)
+            return self.copy_records(self.ticker, TICKER_COLS, records)
+        data = ticker_rows(ticker, utcnow)
         with self.engine.begin() as conn:
             return conn.execute(self.ticker.insert(), data)
 
     def insert_depth(self, depth):
         _logger.info("Inserting depth into DB")
         utcnow = datetime.utcnow()
-        data = [{Depth.createtime: utcnow,
-                 Depth.pair: pair,
-                 Depth.order: order_type,
-                 Depth.idx: idx,
-                 Depth.price: Decimal(array[0]),
-                 Depth.vol: Decimal(array[1]),
-                 Depth.timestamp: datetime.utcfromtimestamp(array[2])}
-                for pair, trades in depth.items()
-                for order_type, orders in trades.items()
-                for idx, array in enumerate(orders)]
+        if self.bulk:
+            records = depth_records(depth, utcnow)
+            return self.copy_records(self.depth, DEPTH_COLS, records)
+        data = depth_rows(depth, utcnow)
         with self.engine.begin() as conn:
             return conn.execute(self.depth.insert(), data)
+
+    def load(self, table, pair, start=None, end=None, columns=None,
+             chunksize=None):
+        """Load rows of a pair in the time range [start, end)
+
+        With `chunksize`, rows are streamed through a server-side cursor
+        and an iterator of data frames with at most `chunksize` rows is
+        returned, otherwise a single data frame.
+
+        Args:
+            table (str): table name
+            pair (str): asset pair
+            start (datetime): inclusive start or None
+            end (datetime): exclusive end or None
+            columns (list): column names, all but `id` if None
+            chunksize (int): number of rows per chunk or None
+
+        Returns:
+            :obj:`DataFrame` or iterator of :obj:`DataFrame`
+        """
+        query = select_range(self.metadata.tables[table], pair, start, end,
+                             columns)
+        if chunksize is None:
+            with self.engine.connect() as conn:
+                result = conn.execute(query)
+                return pd.DataFrame(result.fetchall(),
+                                    columns=list(result.keys()))
+        else:
+            return self._iter_chunks(query, chunksize)
+
+    def _iter_chunks(self, query, chunksize):
+        with self.engine.connect() as conn:
+            result = conn.execution_options(
+                stream_results=True, max_row_buffer=chunksize).execute(query)
+            cols = list(result.keys())
+            for rows in result.partitions(chunksize):
+                yield pd.DataFrame(rows, columns=cols)
+
+    def load_ticker(self, pair, start=None, end=None, columns=None,
+                    chunksize=None):
+        return self.load('ticker', pair, start, end, columns, chunksize)
+
+    def load_depth(self, pair, start=None, end=None, columns=None,
+                   chunksize=None):
+        return self.load('depth', pair, start, end, columns, chunksize)
+
+    def load_trades(self, pair, start=None, end=None, columns=None,
+                    chunksize=None):
+        return self.load('trades', pair, start, end, columns, chunksize)
+
+    def load_spreads(self, pair, start=None, end=None, columns=None,
+                     chunksize=None):
+        return self.load('spreads', pair, start, end, columns, chunksize)
+
+    def pairs(self, table):
+        """Distinct pairs stored in a table"""
+        col = self.metadata.tables[table].c['pair']
+        with self.engine.connect() as conn:
+            return [row[0] for row in conn.execute(select(col).distinct())]
+
+    def time_range(self, table, pair):
+        """First and last createtime of a pair in a table"""
+        t = self.metadata.tables[table]
+        query = (select(func.min(t.c['createtime']),
+                        func.max(t.c['createtime']))
+                 .where(t.c['pair'] == pair))
+        with self.engine.connect() as conn:
+            return tuple(conn.execute(query).one())
+
+    def load_book(self, pair, at):
+        """Rebuild the order book of a pair from the `depth_book` table
+
+        Args:
+            pair (str): asset pair
+            at (datetime): point in time
+
+        Returns:
+            dict: `asks` and `bids` lists of [price, volume, timestamp]
+        """
+        c = self.depth_book.c
+        keyframe = (select(func.max(c[DepthBook.createtime]))
+                    .where(c[DepthBook.pair] == pair,
+                           c[DepthBook.keyframe].is_(True),
+                           c[DepthBook.createtime] <= at)
+                    .scalar_subquery())
+        query = (select(c[DepthBook.createtime], c[DepthBook.order],
+                        c[DepthBook.price], c[DepthBook.vol],
+                        c[DepthBook.timestamp], c[DepthBook.keyframe])
+                 .where(c[DepthBook.pair] == pair,
+                        c[DepthBook.createtime] >= keyframe,
+                        c[DepthBook.createtime] <= at)
+                 .order_by(c[DepthBook.createtime], c['id']))
+        with self.engine.connect() as conn:
+            return rebuild_book(conn.execute(query))
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Delta encoding of order book snapshots
+"""
+import logging
+from datetime import datetime
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "gpl3"
+
+_logger = logging.getLogger(__name__)
+
+ORDERS = ('asks', 'bids')
+
+
+def book_levels(book):
+    """Levels of an order book keyed by order type and price
+
+    Args:
+        book (dict): `asks` and `bids` lists of [price, volume, timestamp]
+
+    Returns:
+        dict: (order type, price) to (volume, timestamp)
+    """
+    return {(order, level[0]): (level[1], level[2])
+            for order in ORDERS
+            for level in book.get(order, [])}
+
+
+def diff_levels(old, new):
+    """Changed, added and removed levels between two books
+
+    Removed levels are reported with volume and timestamp None.
+
+    Args:
+        old (dict): levels as returned by :func:`book_levels`
+        new (dict): levels as returned by :func:`book_levels`
+
+    Returns:
+        dict: (order type, price) to (volume, timestamp)
+    """
+    delta = {key: value for key, value in new.items()
+             if old.get(key) != value}
+    delta.update((key, (None, None)) for key in old if key not in new)
+    return delta
+
+
+def levels_to_book(levels):
+    """Inverse of :func:`book_levels` with asks ascending, bids descending"""
+    book = {order: [] for order in ORDERS}
+    for (order, price), (volume, timestamp) in levels.items():
+        book[order].append([price, volume, timestamp])
+    book['asks'].sort(key=lambda level: float(level[0]))
+    book['bids'].sort(key=lambda level: float(level[0]), reverse=True)
+    return book
+
+
+def rebuild_book(records):
+    """Rebuild an order book from a keyframe followed by deltas
+
+    Args:
+        records (iterable): tuples (createtime, order type, price, volume,
+            timestamp, keyframe) ordered by createtime
+
+    Returns:
+        dict: `asks` and `bids` lists of [price, volume, timestamp]
+    """
+    levels = {}
+    curr_keyframe = None
+    for createtime, order, price, volume, timestamp, keyframe in records:
+        if keyframe and createtime != curr_keyframe:
+            levels = {}
+            curr_keyframe = createtime
+        if volume is None:
+            levels.pop((order, price), None)
+        else:
+            levels[(order, price)] = (volume, timestamp)
+    return levels_to_book(levels)
+
+
+class DepthEncoder(object):
+    """Encodes depth snapshots as periodic keyframes plus deltas
+
+    Args:
+        keyframe_interval (int): number of snapshots per pair between two
+            full keyframes
+    """
+    def __init__(self, keyframe_interval=100):
+        self.keyframe_interval = keyframe_interval
+        self._levels = {}
+        self._nframes = {}
+
+    def encode(self, pair, book):
+        """Encode the next snapshot of a pair
+
+        Args:
+            pair (str): asset pair
+            book (dict): `asks` and `bids` as returned by the Kraken API
+
+        Returns:
+            tuple: keyframe flag and dict of levels to store
+        """
+        levels = book_levels(book)
+        nframes = self._nframes.get(pair, 0)
+        keyframe = pair not in self._levels or (
+            nframes % self.keyframe_interval == 0)
+        delta = levels if keyframe else diff_levels(self._levels[pair],
+                                                    levels)
+        self._levels[pair] = levels
+        self._nframes[pair] = nframes + 1
+        return keyframe, delta
+
+    def reset(self, pairs):
+        """Start the next snapshots of `pairs` with a keyframe
+
+        Call this if the records of the last snapshots were not stored,
+        since later deltas would refer to them.
+        """
+        for pair in pairs:
+            self._levels.pop(pair, None)
+            self._nframes.pop(pair, None)
+
+    def records(self, depth, createtime):
+        """Records for the `depth_book` table in the order of
+        :obj:`paul.db.DEPTH_BOOK_COLS`
+
+        Args:
+            depth (dict): depth result of the Kraken API
+            createtime (datetime): creation time of the records
+
+        Returns:
+            list: list of tuples
+        """
+        createtime = createtime.isoformat()
+        records = []
+        for pair, book in depth.items():
+            keyframe, delta = self.encode(pair, book)
+            for (order, price), (volume, timestamp) in delta.items():
+                if timestamp is not None:
+                    timestamp = datetime.utcfromtimestamp(
+                        timestamp).isoformat()
+                records.append((createtime, pair, order, price, volume,
+                                timestamp, keyframe))
+        return records
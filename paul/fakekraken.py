@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for Kraken's public REST API and websocket feed for tests
+and load tests
+"""
+import json
+import time
+import random
+import logging
+import argparse
+import asyncio
+
+from aiohttp import web, WSMsgType
+
+from .feed import book_checksum
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "gpl3"
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_PAIRS = ['XXBTZEUR', 'XETHZEUR', 'XLTCZEUR', 'XXRPZEUR', 'XZECZEUR',
+                 'XETCZEUR', 'XREPZEUR', 'XXMRZEUR', 'XXLMZEUR', 'DASHEUR']
+RATE_LIMIT_ERROR = 'EAPI:Rate limit exceeded'
+SERVICE_ERROR = 'EService:Unavailable'
+
+
+class FakeKraken(object):
+    """Fake Kraken server serving random walk market data
+
+    Args:
+        pairs (list): asset pairs to serve
+        latency (float): mean response latency in seconds
+        error_rate (float): probability of an error response
+        max_count (float): call counter limit, no rate limit if None
+        decay (float): decrease of the call counter per second
+        depth_levels (int): levels per side of the order book
+        seed (int): seed of the random generator
+        ws_interval (float): seconds between two rounds of feed messages
+        checksum_error_rate (float): probability of a wrong book checksum
+        drop_rate (float): probability to close the feed after a round
+    """
+    def __init__(self, pairs=None, latency=0., error_rate=0.,
+                 max_count=None, decay=1., depth_levels=100, seed=None,
+                 ws_interval=0.05, checksum_error_rate=0., drop_rate=0.):
+        self.pairs = DEFAULT_PAIRS if pairs is None else pairs
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_count = max_count
+        self.decay = decay
+        self.depth_levels = depth_levels
+        self.ncalls = 0
+        self._rnd = random.Random(seed)
+        self._prices = {pair: self._rnd.uniform(1., 5000.)
+                        for pair in self.pairs}
+        self._counter = 0.
+        self._last_call = time.monotonic()
+        self._trade_id = int(1e9 * time.time())
+        self.ws_interval = ws_interval
+        self.checksum_error_rate = checksum_error_rate
+        self.drop_rate = drop_rate
+        self.nconnects = 0
+        self._wsnames = {self.wsname(pair): pair for pair in self.pairs}
+
+    @staticmethod
+    def wsname(pair):
+        return pair[:-3] + '/EUR'
+
+    def _rate_limited(self):
+        if self.max_count is None:
+            return False
+        now = time.monotonic()
+        self._counter = max(0., self._counter -
+                            (now - self._last_call) * self.decay)
+        self._last_call = now
+        if self._counter + 1 > self.max_count:
+            return True
+        self._counter += 1
+        return False
+
+    def _price(self, pair):
+        price = self._prices[pair] * (1 + self._rnd.gauss(0, 1e-3))
+        self._prices[pair] = price
+        return price
+
+    def _pairs(self, params):
+        pairs = params.get('pair')
+        return self.pairs if not pairs else pairs.split(',')
+
+    def ticker(self, params):
+        result = {}
+        for pair in self._pairs(params):
+            price = self._price(pair)
+            result[pair] = {
+                'a': ['{:.5f}'.format(price * 1.0005), '1', '1.000'],
+                'b': ['{:.5f}'.format(price * 0.9995), '2', '2.000'],
+                'c': ['{:.5f}'.format(price), '0.10000000'],
+                'v': ['{:.8f}'.format(self._rnd.uniform(1, 1e3))] * 2,
+                'p': ['{:.5f}'.format(price)] * 2,
+                't': [self._rnd.randint(1, 10000)] * 2,
+                'l': ['{:.5f}'.format(price * 0.98)] * 2,
+                'h': ['{:.5f}'.format(price * 1.02)] * 2,
+                'o': '{:.5f}'.format(price)}
+        return result
+
+    def depth(self, params):
+        pair = params['pair']
+        count = int(params.get('count', self.depth_levels))
+        price = self._price(pair)
+        now = int(time.time())
+
+        def levels(sign):
+            return [['{:.5f}'.format(price * (1 + sign * 1e-4 * (i + 1))),
+                     '{:.3f}'.format(self._rnd.uniform(0.01, 50)),
+                     now - self._rnd.randint(0, 600)]
+                    for i in range(count)]
+
+        return {pair: {'asks': levels(1), 'bids': levels(-1)}}
+
+    def trades(self, params):
+        pair = params['pair']
+        now = time.time()
+        trades = [['{:.5f}'.format(self._price(pair)),
+                   '{:.8f}'.format(self._rnd.uniform(0.001, 5)),
+                   now - self._rnd.uniform(0, 1),
+                   self._rnd.choice('bs'), self._rnd.choice('ml'), '']
+                  for _ in range(self._rnd.randint(0, 20))]
+        self._trade_id += len(trades)
+        return {pair: trades, 'last': str(self._trade_id)}
+
+    def spread(self, params):
+        pair = params['pair']
+        now = int(time.time())
+        spreads = []
+        for _ in range(self._rnd.randint(0, 20)):
+            price = self._price(pair)
+            spreads.append([now, '{:.5f}'.format(price * 0.9995),
+                            '{:.5f}'.format(price * 1.0005)])
+        return {pair: spreads, 'last': now}
+
+    def asset_pairs(self, params):
+        return {pair: {'altname': pair, 'wsname': self.wsname(pair)}
+                for pair in self._pairs(params)}
+
+    def time(self, params):
+        now = time.time()
+        return {'unixtime': int(now), 'rfc1123': time.strftime(
+            '%a, %d %b %y %H:%M:%S +0000', time.gmtime(now))}
+
+    async def handle(self, request):
+        self.ncalls += 1
+        handler = {'Ticker': self.ticker, 'Depth': self.depth,
+                   'Trades': self.trades, 'Spread': self.spread,
+                   'AssetPairs': self.asset_pairs,
+                   'Time': self.time}.get(request.match_info['method'])
+        if handler is None:
+            return web.json_response({'error': ['EGeneral:Unknown method']})
+        params = dict(await request.post())
+        if self.latency > 0:
+            await asyncio.sleep(self._rnd.expovariate(1. / self.latency))
+        if self._rate_limited():
+            return web.json_response({'error': [RATE_LIMIT_ERROR]})
+        if self._rnd.random() < self.error_rate:
+            if self._rnd.random() < 0.5:
+                raise web.HTTPServiceUnavailable()
+            return web.json_response({'error': [SERVICE_ERROR]})
+        return web.json_response({'error': [], 'result': handler(params)})
+
+    def _feed_ticker(self, pair):
+        ticker = self.ticker({'pair': pair})[pair]
+        ticker['o'] = [ticker['o']] * 2
+        return [ticker]
+
+    def _feed_trade(self, pair):
+        trades = self.trades({'pair': pair})[pair]
+        for trade in trades:
+            trade[2] = '{:.6f}'.format(trade[2])
+        return [trades] if trades else None
+
+    def _feed_spread(self, pair):
+        price = self._price(pair)
+        return [['{:.5f}'.format(price * 0.9995),
+                 '{:.5f}'.format(price * 1.0005),
+                 '{:.6f}'.format(time.time()), '1.000', '2.000']]
+
+    def _book_level(self, price):
+        return ['{:.5f}'.format(price), '{:.8f}'.format(
+            self._rnd.uniform(0.01, 50)), '{:.6f}'.format(time.time())]
+
+    def _feed_book(self, pair, book, depth):
+        """Snapshot if `book` is empty, else an update of a few levels"""
+        price = self._price(pair)
+        if not book:
+            for order, key, sign in (('asks', 'as', 1), ('bids', 'bs', -1)):
+                book[order] = [self._book_level(
+                    price * (1 + sign * 1e-4 * (i + 1)))
+                    for i in range(depth)]
+            return [{'as': book['asks'], 'bs': book['bids']}]
+        payloads = []
+        for order, key, sign in (('asks', 'a', 1), ('bids', 'b', -1)):
+            levels = book[order]
+            changes = []
+            action = self._rnd.choice(['change', 'insert', 'delete'])
+            if action == 'change':
+                idx = self._rnd.randrange(len(levels))
+                levels[idx] = self._book_level(float(levels[idx][0]))
+                changes.append(levels[idx])
+            elif action == 'insert':
+                # clients drop the level pushed out of the subscribed depth
+                best = float(levels[0][0])
+                level = self._book_level(best * (1 - sign * 5e-5))
+                levels.insert(0, level)
+                del levels[depth:]
+                changes.append(level)
+            else:
+                idx = self._rnd.randrange(len(levels))
+                removed = levels.pop(idx)
+                worst = float(levels[-1][0])
+                level = self._book_level(worst * (1 + sign * 1e-4))
+                levels.append(level)
+                changes += [[removed[0], '0.00000000', removed[2]], level]
+            payloads.append({key: changes})
+        checksum = book_checksum(book)
+        if self._rnd.random() < self.checksum_error_rate:
+            checksum += 1
+        payloads[-1]['c'] = str(checksum)
+        return payloads
+
+    async def feed(self, request):
+        """Websocket feed with the message format of Kraken's feed"""
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.nconnects += 1
+        await ws.send_json({'event': 'systemStatus', 'status': 'online',
+                            'version': '1.0.0'})
+        subscriptions = {}
+        books = {}
+        channel_ids = iter(range(1, 2**31))
+
+        async def publish():
+            while True:
+                await asyncio.sleep(self.ws_interval)
+                if not subscriptions:
+                    await ws.send_json({'event': 'heartbeat'})
+                for (name, wsname), (channel_id, depth) in list(
+                        subscriptions.items()):
+                    pair = self._wsnames[wsname]
+                    if name == 'book':
+                        payloads = self._feed_book(
+                            pair, books.setdefault(wsname, {}), depth)
+                        name = 'book-{}'.format(depth)
+                    else:
+                        payloads = getattr(self, '_feed_' + name)(pair)
+                    if payloads:
+                        await ws.send_json([channel_id] + payloads +
+                                           [name, wsname])
+                if self._rnd.random() < self.drop_rate:
+                    await ws.close()
+                    return
+
+        publisher = asyncio.ensure_future(publish())
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                name = data['subscription']['name']
+                for wsname in data['pair']:
+                    key = (name, wsname)
+                    status = {'event': 'subscriptionStatus', 'pair': wsname,
+                              'subscription': data['subscription']}
+                    if wsname not in self._wsnames:
+                        status.update(status='error',
+                                      errorMessage='Currency pair not '
+                                                   'supported')
+                    elif data['event'] == 'subscribe':
+                        subscriptions[key] = (
+                            next(channel_ids),
+                            data['subscription'].get('depth', 10))
+                        if name == 'book':
+                            books.pop(wsname, None)
+                        status['status'] = 'subscribed'
+                    else:
+                        subscriptions.pop(key, None)
+                        status['status'] = 'unsubscribed'
+                    await ws.send_json(status)
+        finally:
+            publisher.cancel()
+        return ws
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/0/public/{method}', self.handle)
+        app.router.add_get('/ws', self.feed)
+        return app
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Start serving in the running event loop
+
+        Returns:
+            tuple: runner to clean up and base URI of the server
+        """
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        port = runner.addresses[0][1]
+        uri = 'http://{}:{}'.format(host, port)
+        _logger.info("Fake Kraken listening on {}".format(uri))
+        return runner, uri
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Fake Kraken REST API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--pairs', type=int, default=len(DEFAULT_PAIRS),
+                        help='number of asset pairs')
+    parser.add_argument('--latency', type=float, default=0.)
+    parser.add_argument('--error-rate', dest='error_rate', type=float,
+                        default=0.)
+    parser.add_argument('--max-count', dest='max_count', type=float)
+    parser.add_argument('--decay', type=float, default=1.)
+    args = parser.parse_args(args)
+    pairs = DEFAULT_PAIRS + ['PAIR{}EUR'.format(i) for i in range(
+        max(args.pairs - len(DEFAULT_PAIRS), 0))]
+    kraken = FakeKraken(pairs[:args.pairs], latency=args.latency,
+                        error_rate=args.error_rate, max_count=args.max_count,
+                        decay=args.decay)
+    web.run_app(kraken.app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
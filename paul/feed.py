@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Collector streaming Kraken's public websocket feed instead of polling
+"""
+import json
+import zlib
+import asyncio
+import logging
+
+from decimal import Decimal
+
+import aiohttp
+
+from .collector import Collector
+from .orderbook import OrderBook
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "gpl3"
+
+_logger = logging.getLogger(__name__)
+
+KRAKEN_WS_URI = 'wss://ws.kraken.com'
+# channels of the websocket feed for the endpoints in `rates`
+CHANNELS = {'ticker': 'ticker', 'depth': 'book', 'trades': 'trade',
+            'spreads': 'spread'}
+# time of a trade or spread in the unit of its REST cursor, i.e. ns or s
+EVENT_TIMES = {'trades': lambda event: Decimal(event[2]) * 10**9,
+               'spreads': lambda event: Decimal(str(event[0]))}
+
+
+class FeedError(Exception):
+    """Connection to the feed lost or the feed is inconsistent"""
+
+
+def _checksum_digits(value):
+    return value.replace('.', '').lstrip('0')
+
+
+def book_checksum(book, n_levels=10):
+    """CRC32 checksum of the top levels of an order book as Kraken does
+
+    Args:
+        book (dict): `asks` ascending and `bids` descending lists of
+            [price, volume, timestamp] with prices and volumes as strings
+        n_levels (int): number of levels per side
+
+    Returns:
+        int: unsigned 32-bit checksum
+    """
+    digits = ''.join(_checksum_digits(level[0]) + _checksum_digits(level[1])
+                     for order in ('asks', 'bids')
+                     for level in book[order][:n_levels])
+    return zlib.crc32(digits.encode())
+
+
+def ticker_from_feed(payload):
+    """Ticker of the feed in the format of the REST API"""
+    ticker = dict(payload)
+    ticker['o'] = payload['o'][0]
+    return ticker
+
+
+def spread_from_feed(payload):
+    """Spread of the feed as [time, bid, ask] like in the REST API"""
+    bid, ask, timestamp = payload[:3]
+    return [float(timestamp), bid, ask]
+
+
+def levels_from_feed(payload, keys):
+    """Changed levels of book messages keyed by order type and price"""
+    delta = {}
+    for key, order in keys:
+        for level in payload.get(key, []):
+            delta[(order, level[0])] = (level[1], float(level[2]))
+    return delta
+
+
+class FeedCollector(Collector):
+    """Collector subscribing to the websocket feed of Kraken
+
+    Instead of polling, the channels of all endpoints in `rates` are
+    subscribed over one persistent connection. The rate of `depth` only
+    limits how often a changed book is written. Ticker, trades, spreads
+    and books are written to the same tables as by :class:`Collector`.
+
+    The connection is re-established with exponential backoff if it is
+    closed or no message, not even a heartbeat, arrives within
+    `heartbeat_timeout`. After every (re)connect, trades and spreads are
+    polled once from the REST API to fill the gap using the stored
+    cursors. Feed events at or before the cursors of the resync are
+    dropped since the resync already stored them, later feed events are
+    all kept, also several within the same second. Cursors never move
+    backwards. A book whose checksum does not match is resubscribed to
+    get a fresh snapshot.
+
+    Gaps are only detected by the checksum over the top 10 levels of the
+    books and the heartbeat timeout. Trades and spreads carry no sequence
+    numbers, so a message lost while connected goes unnoticed and only
+    the resync after a reconnect fills gaps. Unexpected errors while
+    handling a message are logged, counted and lead to a reconnect.
+
+    Args:
+        feed_uri (str): URI of the websocket feed
+        wsnames (dict): pair to its name in the feed, e.g. XBT/EUR
+        book_depth (int): subscribed levels per side of the books
+        heartbeat_timeout (float): seconds without messages until reconnect
+        max_backoff (float): maximal seconds between reconnects
+        **kwargs: see :class:`Collector`
+    """
+    def __init__(self, db_client, kraken_api, pairs, rates,
+                 feed_uri=KRAKEN_WS_URI, wsnames=None, book_depth=10,
+                 heartbeat_timeout=5., max_backoff=60., **kwargs):
+        super().__init__(db_client, kraken_api, pairs, rates, **kwargs)
+        self.feed_uri = feed_uri
+        self.wsnames = wsnames if wsnames is not None else {
+            pair: pair for pair in pairs}
+        self.book_depth = book_depth
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_backoff = max_backoff
+        self._pairs_of = {wsname: pair
+                          for pair, wsname in self.wsnames.items()}
+        self._books = {}
+        self._books_written = {}
+        self._ws = None
+        self._resynced = {}  # cursors of the last resync per endpoint
+        self.nconnects = 0
+
+    def _subscription(self, endpoint):
+        subscription = {'name': CHANNELS[endpoint]}
+        if endpoint == 'depth':
+            subscription['depth'] = self.book_depth
+        return subscription
+
+    async def _send(self, event, endpoint, pairs):
+        await self._ws.send_json({
+            'event': event, 'pair': [self.wsnames[pair] for pair in pairs],
+            'subscription': self._subscription(endpoint)})
+
+    async def _resync(self):
+        """Poll trades and spreads since the stored cursors"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        funcs = {'trades': self.api.trades, 'spreads': self.api.spread}
+        for endpoint, func in funcs.items():
+            if endpoint in self.rates:
+                if not await self._load_cursors(endpoint):
+                    raise FeedError("No cursors of {}".format(endpoint))
+                await asyncio.gather(*[
+                    self._poll_pair_events(endpoint, func, pair, semaphore)
+                    for pair in self.pairs])
+                self._resynced[endpoint] = {
+                    pair: Decimal(last)
+                    for pair, last in self._cursors[endpoint].items()
+                    if last is not None}
+
+    async def stream(self):
+        backoff = min(1., self.max_backoff)
+        while True:
+            try:
+                async with self.api.session.ws_connect(self.feed_uri) as ws:
+                    self._ws = ws
+                    self.nconnects += 1
+                    _logger.info("Connected to {}".format(self.feed_uri))
+                    for endpoint in CHANNELS:
+                        if endpoint in self.rates:
+                            await self._send('subscribe', endpoint,
+                                             self.pairs)
+                    await self._resync()
+                    backoff = min(1., self.max_backoff)
+                    await self._consume(ws)
+            except asyncio.CancelledError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError,
+                    FeedError) as e:
+                _logger.warning("Feed interrupted: {!r}".format(e))
+                self._count_error(type(e).__name__)
+            except Exception as e:
+                _logger.exception("Feed failed, reconnecting:")
+                self._count_error(type(e).__name__)
+            finally:
+                self._ws = None
+                self._books.clear()
+            await asyncio.sleep(backoff)
+            backoff = min(2 * backoff, self.max_backoff)
+
+    async def _consume(self, ws):
+        while True:
+            msg = await ws.receive(timeout=self.heartbeat_timeout)
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                await self._handle(json.loads(msg.data))
+            elif msg.type in (aiohttp.WSMsgType.CLOSE,
+                              aiohttp.WSMsgType.CLOSING,
+                              aiohttp.WSMsgType.CLOSED,
+                              aiohttp.WSMsgType.ERROR):
+                raise FeedError("Connection closed: {}".format(msg.type))
+
+    async def _handle(self, msg):
+        if isinstance(msg, dict):
+            if msg.get('status') == 'error':
+                _logger.error(msg.get('errorMessage'))
+                self._count_error(msg.get('errorMessage', 'FeedError'))
+            return
+        channel, wsname = msg[-2], msg[-1]
+        pair = self._pairs_of.get(wsname)
+        if pair is None:
+            return
+        payloads = msg[1:-2]
+        if channel == 'ticker':
+            ticker = {pair: ticker_from_feed(payloads[0])}
+            self._publish('ticker', ticker)
+            await self._insert_ticker(ticker)
+        elif channel == 'trade':
+            await self._on_events('trades', pair, payloads[0])
+        elif channel == 'spread':
+            await self._on_events('spreads', pair,
+                                  [spread_from_feed(payloads[0])])
+        elif channel.startswith('book'):
+            await self._on_book(pair, payloads)
+
+    async def _on_events(self, endpoint, pair, events):
+        """Store the `events` not stored by the resync and advance the cursor
+
+        Only the cursor of the last resync filters the events, not the
+        cursor advanced by the feed itself, which is cut to whole seconds
+        for spreads and would drop later events of the same second.
+        """
+        if not await self._load_cursors(endpoint):
+            raise FeedError("No cursors of {}".format(endpoint))
+        to_time = EVENT_TIMES[endpoint]
+        resynced = self._resynced.get(endpoint, {}).get(pair)
+        if resynced is not None:
+            events = [event for event in events if to_time(event) > resynced]
+            if not events:
+                return
+        cursors = self._cursors[endpoint]
+        last = int(max(to_time(event) for event in events))
+        if cursors.get(pair) is not None:
+            last = max(last, int(Decimal(cursors[pair])))
+        last = str(last)
+        self._publish(endpoint, (pair, events))
+        await self._insert_events(endpoint, pair, events, last)
+        cursors[pair] = last
+
+    async def _on_book(self, pair, payloads):
+        book = self._books.get(pair)
+        checksum = None
+        for payload in payloads:
+            if 'as' in payload or 'bs' in payload:
+                book = self._books[pair] = OrderBook(pair)
+                book.apply(levels_from_feed(payload, [('as', 'asks'),
+                                                      ('bs', 'bids')]))
+            elif book is not None:
+                book.apply(levels_from_feed(payload, [('a', 'asks'),
+                                                      ('b', 'bids')]))
+                checksum = payload.get('c', checksum)
+        if book is None:
+            return
+        snapshot = book.to_book()
+        outside = {(order, level[0]): (None, None)
+                   for order in snapshot
+                   for level in snapshot[order][self.book_depth:]}
+        if outside:
+            book.apply(outside)
+            snapshot = book.to_book()
+        if checksum is not None and int(checksum) != book_checksum(snapshot):
+            _logger.warning("Checksum mismatch of {} book".format(pair))
+            self._count_error('ChecksumMismatch')
+            del self._books[pair]
+            await self._send('unsubscribe', 'depth', [pair])
+            await self._send('subscribe', 'depth', [pair])
+            return
+        self._publish('depth', {pair: snapshot})
+        loop = asyncio.get_event_loop()
+        if loop.time() - self._books_written.get(pair, -float('inf')) >= \
+                self.rates['depth']:
+            self._books_written[pair] = loop.time()
+            await self._insert_depth({pair: snapshot})
+
+    def tasks(self):
+        coros = [self.stream()]
+        if self.db_client is not None:
+            coros.append(self.roll_partitions())
+        if self.buffer is not None:
+            coros.append(self.buffer.run())
+        return coros
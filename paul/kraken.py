@@ -10,6 +10,10 @@ import time
 import hashlib
 import hmac
 import base64
+import asyncio
+import multiprocessing
+
+import aiohttp
 
 from .utils import tolist
 
@@ -20,13 +24,98 @@ __license__ = "gpl3"
 _logger = logging.getLogger(__name__)
 
 
+class RateLimiter(object):
+    """Token bucket modelling Kraken's API call counter
+
+    Every call increases Kraken's counter by its cost and the counter
+    decreases by `decay` per second. Calls are rejected as soon as the
+    counter would exceed `max_count`. The bucket holds the remaining
+    budget `max_count - counter` and waits until enough budget is back.
+
+    Args:
+        max_count (float): maximal value of the call counter
+        decay (float): decrease of the call counter per second
+    """
+    def __init__(self, max_count=15, decay=1.):
+        self.max_count = max_count
+        self.decay = decay
+        self._tokens = max_count
+        self._last = None
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        if self._last is not None:
+            elapsed = now - self._last
+            self._tokens = min(self.max_count,
+                               self._tokens + elapsed * self.decay)
+        self._last = now
+
+    async def acquire(self, cost=1):
+        assert 0 < cost <= self.max_count
+        loop = asyncio.get_event_loop()
+        async with self._lock:
+            self._refill(loop.time())
+            while self._tokens < cost:
+                await asyncio.sleep((cost - self._tokens) / self.decay)
+                self._refill(loop.time())
+            self._tokens -= cost
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+class SharedRateLimiter(RateLimiter):
+    """Token bucket of :class:`RateLimiter` shared by several processes
+
+    The budget and the time of its last refill live in shared memory and
+    are only touched while holding its lock, which is never held across
+    an await. Pass the limiter to the processes when creating them.
+
+    Args:
+        max_count (float): maximal value of the call counter
+        decay (float): decrease of the call counter per second
+        context: multiprocessing context, the default one if None
+    """
+    def __init__(self, max_count=15, decay=1., context=None):
+        # no asyncio.Lock as in RateLimiter, it cannot be sent to processes
+        self.max_count = max_count
+        self.decay = decay
+        context = multiprocessing if context is None else context
+        self._state = context.Array('d', [max_count, -1.])
+
+    async def acquire(self, cost=1):
+        assert 0 < cost <= self.max_count
+        while True:
+            with self._state.get_lock():
+                now = time.monotonic()
+                tokens, last = self._state[0], self._state[1]
+                if last >= 0:
+                    tokens = min(self.max_count,
+                                 tokens + (now - last) * self.decay)
+                self._state[1] = now
+                if tokens >= cost:
+                    self._state[0] = tokens - cost
+                    return
+                self._state[0] = tokens
+            await asyncio.sleep((cost - tokens) / self.decay)
+
+
+KRAKEN_URI = 'https://api.kraken.com'
+
+
 class API(object):
     """Kraken.com crypto currency exchange API.
     """
-    def __init__(self, key=None, secret=None):
+    is_async = False
+
+    def __init__(self, key=None, secret=None, uri=KRAKEN_URI):
         self._key = key
         self._secret = secret
-        self._uri = 'https://api.kraken.com'
+        self._uri = uri
         self._apiversion = 0
 
     def load_key(self, path):
@@ -109,3 +198,58 @@ class API(object):
         if since:
             params['since'] = since
         return self.query_public('Spread', params)
+
+
+class AsyncAPI(API):
+    """Kraken.com crypto currency exchange API for asyncio
+
+    All query methods return coroutines. Requests share one pooled
+    keep-alive session which is created on first use.
+
+    Args:
+        key (str): API key
+        secret (str): API secret
+        uri (str): base URI of the API
+        limit (int): maximal number of simultaneous connections
+        limit_per_host (int): maximal number of connections per host
+        timeout (float): total timeout of a request in seconds
+    """
+    is_async = True
+
+    def __init__(self, key=None, secret=None, uri=KRAKEN_URI, limit=10,
+                 limit_per_host=0, timeout=30.):
+        super().__init__(key, secret, uri)
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._timeout = timeout
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._limit, limit_per_host=self._limit_per_host)
+            timeout = aiohttp.ClientTimeout(total=self._timeout)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=timeout)
+        return self._session
+
+    async def _query(self, urlpath, params=None, headers=None):
+        params = {} if params is None else params
+        headers = {} if headers is None else headers
+        url = self._uri + urlpath
+        async with self.session.post(url, data=params,
+                                     headers=headers) as r:
+            r.raise_for_status()
+            return await r.json()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Minimal metrics in Prometheus' text exposition format
+"""
+import time
+import bisect
+import logging
+import asyncio
+from contextlib import contextmanager
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "gpl3"
+
+_logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1., 2.5, 5., 10.)
+
+
+def _fmt_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace(
+        '\\', '\\\\').replace('"', '\\"')) for name, value in pairs) + '}'
+
+
+class Metric(object):
+    """Base class of all metrics
+
+    Args:
+        name (str): metric name
+        doc (str): help text
+        labels (tuple): label names
+    """
+    type = None
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def _key(self, labels):
+        assert set(labels) == set(self.labels)
+        return tuple(labels[name] for name in self.labels)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield self.name + _fmt_labels(self.labels, key), value
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.doc),
+                 '# TYPE {} {}'.format(self.name, self.type)]
+        lines.extend('{} {}'.format(name, repr(float(value)))
+                     for name, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def total(self):
+        """Sum over all label values"""
+        return sum(self._values.values())
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name, doc, labels=()):
+        super().__init__(name, doc, labels)
+        self._funcs = {}
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, func, **labels):
+        """Evaluate `func` whenever the gauge is rendered"""
+        self._funcs[self._key(labels)] = func
+
+    def get(self, **labels):
+        key = self._key(labels)
+        func = self._funcs.get(key)
+        return func() if func is not None else self._values.get(key, 0)
+
+    def samples(self):
+        keys = sorted(set(self._values) | set(self._funcs))
+        for key in keys:
+            yield (self.name + _fmt_labels(self.labels, key),
+                   self.get(**dict(zip(self.labels, key))))
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        if key not in self._values:
+            self._values[key] = [[0] * (len(self.buckets) + 1), 0., 0]
+        counts, _, _ = state = self._values[key]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        return self._values.get(self._key(labels), [None, 0., 0])[2]
+
+    def total(self):
+        """Number of observations over all label values"""
+        return sum(state[2] for state in self._values.values())
+
+    def mean(self, **labels):
+        _, total, count = self._values.get(self._key(labels), [None, 0., 0])
+        return total / count if count else 0.
+
+    def samples(self):
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield (self.name + '_bucket' + _fmt_labels(
+                    self.labels, key, [('le', le)]), cumulative)
+            yield self.name + '_sum' + _fmt_labels(self.labels, key), total
+            yield self.name + '_count' + _fmt_labels(self.labels, key), count
+
+
+class Registry(object):
+    """Collection of metrics rendered together"""
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, doc, labels=()):
+        return self.register(Counter(name, doc, labels))
+
+    def gauge(self, name, doc, labels=()):
+        return self.register(Gauge(name, doc, labels))
+
+    def histogram(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, doc, labels, buckets))
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+class CollectorMetrics(Registry):
+    """Metrics of the collector and its write path"""
+    def __init__(self):
+        super().__init__()
+        self.api_latency = self.histogram(
+            'paul_api_latency_seconds', 'Latency of Kraken API calls',
+            ('endpoint',))
+        self.db_latency = self.histogram(
+            'paul_db_write_latency_seconds', 'Latency of DB writes',
+            ('table',))
+        self.rows_written = self.counter(
+            'paul_db_rows_written_total', 'Rows written to the DB',
+            ('table',))
+        self.loop_lag = self.histogram(
+            'paul_event_loop_lag_seconds', 'Delay of scheduled wake-ups')
+        self.executor_busy = self.gauge(
+            'paul_executor_busy', 'Calls running in the thread pool')
+        self.queue_size = self.gauge(
+            'paul_queue_size', 'Occupancy of internal queues', ('queue',))
+        self.errors = self.counter(
+            'paul_errors_total', 'Errors by type', ('type',))
+
+    def summary(self):
+        """Totals for health reports"""
+        return {'api_calls': self.api_latency.total(),
+                'rows': self.rows_written.total(),
+                'errors': self.errors.total()}
+
+
+async def serve(registry, port, host='127.0.0.1'):
+    """Serve the metrics of a registry via HTTP on every path
+
+    Returns:
+        :obj:`asyncio.AbstractServer`: started server
+    """
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            body = registry.render().encode()
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: text/plain; version=0.0.4\r\n' +
+                         'Content-Length: {}\r\n'.format(
+                             len(body)).encode() +
+                         b'Connection: close\r\n\r\n' + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    _logger.info("Serving metrics on {}:{}".format(host, port))
+    return server
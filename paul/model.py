@@ -3,10 +3,12 @@
 Stochastic model for price movement
 """
 import logging
+from collections import namedtuple
 
 import numpy as np
 import pandas as pd
 import scipy as sp
+from scipy import special
 
 __author__ = "Florian Wilhelm"
 __copyright__ = "Florian Wilhelm"
@@ -16,7 +18,258 @@ _logger = logging.getLogger(__name__)
 
 
 def resample(rule, df):
-    return df.resample(rule, how=np.mean).interpolate()
+    """Offline mean bars of `rule` with gaps linearly interpolated
+
+    This is the bulk counterpart of :class:`BarBuilder` for history.
+    """
+    return df.resample(rule).mean().interpolate()
+
+
+Bar = namedtuple('Bar', ['pair', 'rule', 'start', 'open', 'high', 'low',
+                         'close', 'mean', 'volume', 'count'])
+
+
+def rule_seconds(rule):
+    """Width of a fixed frequency like `10s`, `1min` or `1h` in seconds"""
+    return pd.to_timedelta(rule).total_seconds()
+
+
+def posix_seconds(time):
+    """POSIX seconds of a float, datetime or timestamp, naive means UTC"""
+    if isinstance(time, (int, float, np.number)):
+        return float(time)
+    return pd.Timestamp(time).value / 1e9
+
+
+class BarBuilder(object):
+    """Streaming OHLCV and mean bars of several rules per pair
+
+    Every tick updates the open bar of each rule in O(1). A bar is
+    emitted once a tick of a later bar arrives. Empty bars in between are
+    emitted together with the next completed bar, interpolated linearly
+    like :func:`resample` does, since only then both neighbours are known.
+    Bars start at multiples of the rule width since the epoch and ticks
+    must arrive in time order per pair.
+
+    Args:
+        rules (list): fixed frequencies like `10s`, `1min` or `1h`
+        interpolate (bool): emit interpolated bars for gaps
+    """
+    def __init__(self, rules=('10s', '1min', '1h'), interpolate=True):
+        self.rules = list(rules)
+        self.widths = [rule_seconds(rule) for rule in self.rules]
+        self.interpolate = interpolate
+        self._open = {}  # (pair, rule) to [start, o, h, l, c, sum, vol, n]
+        self._last = {}  # (pair, rule) to the last emitted bar
+
+    def update(self, pair, time, price, volume=0.):
+        """Add a tick and return the bars it completed
+
+        Args:
+            pair (str): name of the asset pair
+            time: POSIX seconds, datetime or timestamp of the tick
+            price (float): price of the tick
+            volume (float): traded volume of the tick
+
+        Returns:
+            list: completed :obj:`Bar` objects, oldest first
+        """
+        now = posix_seconds(time)
+        bars = []
+        for rule, width in zip(self.rules, self.widths):
+            key = (pair, rule)
+            start = now - now % width
+            state = self._open.get(key)
+            if state is not None and start > state[0]:
+                bars.extend(self._close(key, width))
+                state = None
+            if state is None:
+                self._open[key] = [start, price, price, price, price, price,
+                                   volume, 1]
+            else:
+                if price > state[2]:
+                    state[2] = price
+                if price < state[3]:
+                    state[3] = price
+                state[4] = price
+                state[5] += price
+                state[6] += volume
+                state[7] += 1
+        return bars
+
+    def flush(self, pair=None):
+        """Close the open bars of `pair` or of all pairs
+
+        Returns:
+            list: completed :obj:`Bar` objects
+        """
+        bars = []
+        for key in list(self._open):
+            if pair is None or key[0] == pair:
+                bars.extend(self._close(key, self.widths[
+                    self.rules.index(key[1])]))
+        return bars
+
+    def _close(self, key, width):
+        start, open_, high, low, close, total, volume, count = \
+            self._open.pop(key)
+        bar = Bar(key[0], key[1], start, open_, high, low, close,
+                  total / count, volume, count)
+        last = self._last.get(key)
+        self._last[key] = bar
+        if last is None or not self.interpolate:
+            return [bar]
+        n_gaps = int(round((start - last.start) / width)) - 1
+        bars = []
+        for i in range(1, n_gaps + 1):
+            frac = i / (n_gaps + 1)
+            values = [a + frac * (b - a) for a, b in zip(last[3:8], bar[3:8])]
+            bars.append(Bar(key[0], key[1], last.start + i * width,
+                            *values, volume=0., count=0))
+        bars.append(bar)
+        return bars
+
+
+class Normal(object):
+    """Normal distribution with the interface of a frozen scipy one
+
+    Only `mean`, `std`, `pdf`, `cdf` and `ppf` are provided, which is all
+    :meth:`SimpleBroker.make_order` needs, at a fraction of the cost of
+    creating :obj:`scipy.stats.norm` objects.
+    """
+    def __init__(self, loc=0., scale=1.):
+        self.loc = loc
+        self.scale = scale
+
+    def mean(self):
+        return self.loc
+
+    def std(self):
+        return self.scale
+
+    def pdf(self, x):
+        z = (np.asarray(x) - self.loc) / self.scale
+        return np.exp(-0.5 * z**2) / (np.sqrt(2 * np.pi) * self.scale)
+
+    def cdf(self, x):
+        return special.ndtr((np.asarray(x) - self.loc) / self.scale)
+
+    def ppf(self, q):
+        return self.loc + self.scale * special.ndtri(q)
+
+
+class RandomWalk(object):
+    """Gaussian random walk with drift estimated by exponential smoothing
+
+    Increments are normalized to time steps of `dt` seconds.
+
+    Args:
+        dt (float): time step of the forecast in seconds
+        halflife (float): half-life of the estimates in time steps
+        min_scale (float): lower bound of the standard deviation per step
+    """
+    def __init__(self, dt, halflife=100., min_scale=1e-8):
+        self.dt = dt
+        self.alpha = 1 - 0.5**(1. / halflife)
+        self.min_scale = min_scale
+        self.price = None
+        self.time = None
+        self.drift = 0.
+        self.var = 0.
+
+    def update(self, time, price):
+        if self.price is not None and time > self.time:
+            steps = (time - self.time) / self.dt
+            diff = price - self.price
+            alpha = 1 - (1 - self.alpha)**steps
+            self.drift += alpha * (diff / steps - self.drift)
+            self.var += alpha * ((diff - steps * self.drift)**2 / steps -
+                                 self.var)
+        self.price, self.time = price, time
+
+    def forecast(self, n_steps):
+        """Predictive distributions 1, ..., `n_steps` time steps ahead"""
+        steps = np.arange(1, n_steps + 1)
+        locs = self.price + steps * self.drift
+        scales = np.maximum(np.sqrt(steps * self.var), self.min_scale)
+        return [Normal(loc, scale)
+                for loc, scale in zip(locs.tolist(), scales.tolist())]
+
+
+class LocalLinearTrend(object):
+    """Kalman filter of a local linear trend with adaptive noise level
+
+    The state is the level and the slope per time step of `dt` seconds.
+    The noise variances of level and slope are given relative to the
+    observation noise whose scale is tracked by exponential smoothing of
+    the standardized innovations. Updates are O(1) and irregular tick
+    times are handled by predicting over fractional time steps.
+
+    Args:
+        dt (float): time step of the forecast in seconds
+        level_ratio (float): level noise per step over observation noise
+        slope_ratio (float): slope noise per step over observation noise
+        halflife (float): half-life of the noise scale in updates
+        min_scale (float): lower bound of the standard deviation per step
+    """
+    def __init__(self, dt, level_ratio=1., slope_ratio=1e-4, halflife=100.,
+                 min_scale=1e-8):
+        self.dt = dt
+        self.level_ratio = level_ratio
+        self.slope_ratio = slope_ratio
+        self.alpha = 1 - 0.5**(1. / halflife)
+        self.min_scale = min_scale
+        self.time = None
+        self.state = np.zeros(2)  # level and slope
+        self.cov = np.zeros((2, 2))
+        self.var = None  # variance of the observation noise
+
+    @property
+    def price(self):
+        return self.state[0] if self.time is not None else None
+
+    def _predict(self, steps):
+        trans = np.array([[1., steps], [0., 1.]])
+        self.state = trans.dot(self.state)
+        self.cov = trans.dot(self.cov).dot(trans.T)
+        self.cov[0, 0] += steps * self.level_ratio * self.var
+        self.cov[1, 1] += steps * self.slope_ratio * self.var
+
+    def update(self, time, price):
+        if self.time is None:
+            self.var = max((price * 1e-4)**2, self.min_scale**2)
+            self.state = np.array([price, 0.])
+            self.cov = np.diag([self.var, self.slope_ratio * self.var])
+            self.time = time
+            return
+        if time > self.time:
+            self._predict((time - self.time) / self.dt)
+            self.time = time
+        innovation = price - self.state[0]
+        total_var = self.cov[0, 0] + self.var
+        gain = self.cov[:, 0] / total_var
+        self.state = self.state + gain * innovation
+        self.cov = self.cov - np.outer(gain, self.cov[0, :])
+        ratio = innovation**2 / total_var
+        self.var = max(self.var * (1 + self.alpha * (ratio - 1)),
+                       self.min_scale**2)
+
+    def forecast(self, n_steps):
+        """Predictive distributions 1, ..., `n_steps` time steps ahead
+
+        The slope noise of step j enters the level of step h with factor
+        h - j, hence its variance sums up to (h - 1) h (2h - 1) / 6.
+        """
+        steps = np.arange(1, n_steps + 1)
+        level, slope = self.state
+        locs = level + steps * slope
+        cov = self.cov
+        var = (cov[0, 0] + 2 * steps * cov[0, 1] + steps**2 * cov[1, 1] +
+               self.var * (steps * self.level_ratio + self.slope_ratio *
+                           (steps - 1) * steps * (2 * steps - 1) / 6 + 1))
+        scales = np.maximum(np.sqrt(var), self.min_scale)
+        return [Normal(loc, scale)
+                for loc, scale in zip(locs.tolist(), scales.tolist())]
 
 
 # ToDo: Add pyflux model and Vikram model here
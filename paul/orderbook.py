@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory L2 order book of a pair backed by NumPy arrays
+"""
+import logging
+
+import numpy as np
+
+from .depth import ORDERS, book_levels, diff_levels, levels_to_book
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "gpl3"
+
+_logger = logging.getLogger(__name__)
+
+
+class BookSide(object):
+    """Price levels of one side sorted from the best price outwards
+
+    Prices are kept as keys that are ascending for both sides, i.e. the
+    price for asks and the negative price for bids. An update inserts
+    and deletes levels in place, which is O(n) in the number of levels.
+    Cumulative volume and notional are only recomputed by the first query
+    after a change, so bursts of updates pay for a single cumulative sum
+    and queries are binary searches.
+
+    Args:
+        order (str): `asks` or `bids`
+    """
+    def __init__(self, order):
+        assert order in ORDERS
+        self.order = order
+        self._sign = 1. if order == 'asks' else -1.
+        self.keys = np.empty(0)
+        self.volumes = np.empty(0)
+        self._cum_volumes = None
+        self._cum_notional = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def prices(self):
+        return self._sign * self.keys
+
+    @property
+    def cum_volumes(self):
+        if self._cum_volumes is None:
+            self._cum_volumes = np.cumsum(self.volumes)
+        return self._cum_volumes
+
+    @property
+    def cum_notional(self):
+        if self._cum_notional is None:
+            self._cum_notional = np.cumsum(self.volumes * self.prices)
+        return self._cum_notional
+
+    def apply(self, prices, volumes):
+        """Set the volumes of price levels, levels with volume 0 are removed
+
+        Args:
+            prices (array): prices of the changed levels
+            volumes (array): new volumes of the levels
+        """
+        keys = self._sign * np.asarray(prices, dtype=np.float64)
+        volumes = np.asarray(volumes, dtype=np.float64)
+        order = np.argsort(keys, kind='mergesort')
+        keys, volumes = keys[order], volumes[order]
+        idx = np.searchsorted(self.keys, keys)
+        found = idx < len(self.keys)
+        found[found] = self.keys[idx[found]] == keys[found]
+        self.volumes[idx[found]] = volumes[found]
+        new = ~found & (volumes > 0)
+        self.keys = np.insert(self.keys, idx[new], keys[new])
+        self.volumes = np.insert(self.volumes, idx[new], volumes[new])
+        if np.any(volumes[found] <= 0):
+            keep = self.volumes > 0
+            self.keys, self.volumes = self.keys[keep], self.volumes[keep]
+        self._cum_volumes = self._cum_notional = None
+
+    @property
+    def best(self):
+        return self._sign * self.keys[0] if len(self.keys) else np.nan
+
+    def depth(self, price):
+        """Volume offered at `price` or better"""
+        idx = np.searchsorted(self.keys, self._sign * price, side='right')
+        return self.cum_volumes[idx - 1] if idx else 0.
+
+    def fill_price(self, volume):
+        """Volume-weighted price of filling `volume` against this side
+
+        Returns:
+            float: average price or nan if the side is too thin
+        """
+        idx = np.searchsorted(self.cum_volumes, volume)
+        if idx == len(self.keys):
+            return np.nan
+        filled = self.cum_volumes[idx - 1] if idx else 0.
+        notional = self.cum_notional[idx - 1] if idx else 0.
+        return (notional + (volume - filled) * self._sign *
+                self.keys[idx]) / volume
+
+
+class OrderBook(object):
+    """Live order book of a pair updated from depth snapshots
+
+    Snapshots as returned by :meth:`API.depth` are diffed against the
+    current levels with :func:`~paul.depth.diff_levels` and only the
+    changes touch the arrays. Mid, spread and microprice are O(1), depth
+    and fill prices O(log n) in the number of levels once the cumulative
+    sums are up to date, see :class:`BookSide`.
+
+    Args:
+        pair (str): name of the asset pair
+    """
+    def __init__(self, pair):
+        self.pair = pair
+        self.sides = {order: BookSide(order) for order in ORDERS}
+        self._levels = {}
+
+    @property
+    def levels(self):
+        """Current levels as returned by :func:`~paul.depth.book_levels`"""
+        return self._levels
+
+    def to_book(self):
+        """Snapshot with asks ascending and bids descending"""
+        return levels_to_book(self._levels)
+
+    @property
+    def asks(self):
+        return self.sides['asks']
+
+    @property
+    def bids(self):
+        return self.sides['bids']
+
+    def update(self, book):
+        """Apply a full snapshot
+
+        Args:
+            book (dict): `asks` and `bids` lists of [price, volume,
+                timestamp] like in the result of :meth:`API.depth`
+
+        Returns:
+            dict: changed levels as returned by :func:`diff_levels`
+        """
+        levels = book_levels(book)
+        delta = diff_levels(self._levels, levels)
+        self._levels = levels
+        self._apply(delta)
+        return delta
+
+    def apply(self, delta):
+        """Apply changed levels, volume None or 0 removes a level
+
+        Args:
+            delta (dict): (order type, price) to (volume, timestamp)
+        """
+        for (order, price), (volume, timestamp) in delta.items():
+            if volume is None or float(volume) == 0.:
+                self._levels.pop((order, price), None)
+            else:
+                self._levels[(order, price)] = (volume, timestamp)
+        self._apply(delta)
+
+    def _apply(self, delta):
+        changes = {order: ([], []) for order in ORDERS}
+        for (order, price), (volume, _) in delta.items():
+            prices, volumes = changes[order]
+            prices.append(float(price))
+            volumes.append(0. if volume is None else float(volume))
+        for order, (prices, volumes) in changes.items():
+            if prices:
+                self.sides[order].apply(prices, volumes)
+
+    @property
+    def best_ask(self):
+        return self.asks.best
+
+    @property
+    def best_bid(self):
+        return self.bids.best
+
+    @property
+    def mid(self):
+        return (self.best_ask + self.best_bid) / 2
+
+    @property
+    def spread(self):
+        return self.best_ask - self.best_bid
+
+    @property
+    def microprice(self):
+        """Mid price weighted by the volumes at the top of the book"""
+        if not (len(self.asks) and len(self.bids)):
+            return np.nan
+        ask_vol, bid_vol = self.asks.volumes[0], self.bids.volumes[0]
+        return ((self.best_ask * bid_vol + self.best_bid * ask_vol) /
+                (ask_vol + bid_vol))
+
+    def depth(self, order, price):
+        """Cumulative volume of `order` type at `price` or better"""
+        return self.sides[order].depth(price)
+
+    def fill_price(self, order, volume):
+        """Average price of taking `volume` from `order` type
+
+        Buying takes the `asks`, selling the `bids`.
+        """
+        return self.sides[order].fill_price(volume)
+
+
+def update_books(books, depth):
+    """Update the order books of all pairs in a depth result
+
+    Args:
+        books (dict): pair to :obj:`OrderBook`, missing pairs are added
+        depth (dict): pair to snapshot as returned by :meth:`API.depth`
+
+    Returns:
+        dict: `books`
+    """
+    for pair, book in depth.items():
+        if pair not in books:
+            books[pair] = OrderBook(pair)
+        books[pair].update(book)
+    return books
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Expectations and loss risks from sampled forecast paths
+"""
+import logging
+
+import numpy as np
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "gpl3"
+
+_logger = logging.getLogger(__name__)
+
+
+class SampledPaths(object):
+    """Forecast of price paths given by samples instead of distributions
+
+    Samples are processed in blocks of `chunksize` paths so that the full
+    matrix never has to be in memory at once, e.g. a :obj:`numpy.memmap`
+    of 1e6 paths works as well as a callable returning a fresh iterable
+    of (paths x steps) blocks for every pass.
+
+    Args:
+        paths: array of shape (paths, steps) or callable yielding blocks
+        chunksize (int): number of paths per block of an array
+    """
+    def __init__(self, paths, chunksize=65536):
+        self.paths = paths
+        self.chunksize = chunksize
+        self._mean = None
+        self._count = None
+
+    def blocks(self):
+        """Iterate over the samples as (paths x steps) blocks"""
+        if callable(self.paths):
+            for block in self.paths():
+                yield np.asarray(block, dtype=np.float64)
+        else:
+            for start in range(0, len(self.paths), self.chunksize):
+                block = self.paths[start:start + self.chunksize]
+                yield np.asarray(block, dtype=np.float64)
+
+    def _moments(self):
+        total, count = None, 0
+        for block in self.blocks():
+            sums = block.sum(axis=0)
+            total = sums if total is None else total + sums
+            count += len(block)
+        if not count:
+            raise RuntimeError("No sampled paths")
+        self._mean, self._count = total / count, count
+
+    @property
+    def n_paths(self):
+        if self._count is None:
+            self._moments()
+        return self._count
+
+    def mean(self):
+        """Mean price per step
+
+        Returns:
+            array: mean of all paths for every step
+        """
+        if self._mean is None:
+            self._moments()
+        return self._mean
+
+    def cdf(self, step, prices):
+        """Fraction of paths below each of `prices` at `step`
+
+        The prices are sorted once and every block of samples is binned
+        with :func:`numpy.searchsorted`, so a single pass over the paths
+        yields the probabilities of all prices in O(paths * log(prices)).
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        order = np.argsort(prices, kind='mergesort')
+        thresholds = prices[order]
+        below = np.zeros(len(thresholds) + 1, dtype=np.int64)
+        count = 0
+        for block in self.blocks():
+            samples = block[:, step]
+            idx = np.searchsorted(thresholds, samples, side='right')
+            below += np.bincount(idx, minlength=len(below))
+            count += len(samples)
+        # a sample binned at i is below all thresholds from index i on
+        probs = np.empty_like(prices)
+        probs[order] = np.cumsum(below)[:-1] / count
+        return probs
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Collectors in several processes sharing one rate limit budget
+"""
+import os
+import time
+import queue
+import signal
+import asyncio
+import logging
+import multiprocessing
+
+from .kraken import SharedRateLimiter
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "gpl3"
+
+_logger = logging.getLogger(__name__)
+
+
+def shard(pairs, n_shards):
+    """Split `pairs` round robin into at most `n_shards` non-empty lists"""
+    return [shard for shard in (pairs[i::n_shards] for i in range(n_shards))
+            if shard]
+
+
+def run_worker(factory, factory_args, index, pairs, limiter, health,
+               interval, loglevel=logging.WARNING):
+    """Entry point of a worker process
+
+    Builds a collector with `factory(*factory_args, pairs=pairs,
+    limiter=limiter, index=index)` and runs it together with a task that
+    puts a health report on the `health` queue every `interval` seconds.
+    Reports include the number of collection tasks that have ended.
+    """
+    logging.basicConfig(
+        level=loglevel, datefmt='%Y-%m-%d %H:%M:%S',
+        format='[%(asctime)s] %(levelname)s:%(processName)s:%(name)s:'
+               '%(message)s')
+    collector = factory(*factory_args, pairs=pairs, limiter=limiter,
+                        index=index)
+
+    async def report():
+        while True:
+            summary = collector.metrics.summary()
+            summary.update(worker=index, pid=os.getpid(), time=time.time(),
+                           finished=len(collector.finished_tasks()))
+            health.put(summary)
+            await asyncio.sleep(interval)
+
+    collector.start(report())
+
+
+class Supervisor(object):
+    """Runs collectors for shards of the pairs in separate processes
+
+    Every worker process has its own event loop, HTTP session and DB
+    connection while all of them draw from one
+    :class:`~paul.kraken.SharedRateLimiter`. Workers are restarted with
+    exponential backoff if they exit, stop reporting for three health
+    intervals, report an ended collection task or make no progress, i.e.
+    neither API calls nor written rows increase, for `max_stall` health
+    intervals. The reports of all workers are aggregated by
+    :meth:`summary`.
+
+    Args:
+        factory (callable): picklable function returning a collector
+        factory_args (tuple): positional arguments of `factory`
+        pairs (list): asset pairs to distribute
+        n_workers (int): number of worker processes
+        max_count (float): maximal value of Kraken's call counter
+        decay (float): decrease of the call counter per second
+        health_interval (float): seconds between health reports
+        max_backoff (float): maximal seconds before a restart
+        max_stall (float): health intervals without progress until a
+            restart
+        context (str): multiprocessing start method
+    """
+    def __init__(self, factory, factory_args, pairs, n_workers,
+                 max_count=15, decay=1., health_interval=10.,
+                 max_backoff=60., max_stall=30., context='spawn'):
+        self.factory = factory
+        self.factory_args = factory_args
+        self.shards = shard(list(pairs), n_workers)
+        self.health_interval = health_interval
+        self.max_backoff = max_backoff
+        self.max_stall = max_stall
+        self._context = multiprocessing.get_context(context)
+        self.limiter = SharedRateLimiter(max_count, decay,
+                                         context=self._context)
+        self.health = self._context.Queue()
+        n_shards = len(self.shards)
+        self.processes = [None] * n_shards
+        self.reports = [None] * n_shards
+        self.restarts = [0] * n_shards
+        self._started = [0.] * n_shards
+        self._backoff = [min(1., max_backoff)] * n_shards
+        self._restart_at = [None] * n_shards
+        self._progress = [None] * n_shards  # last progress and its time
+        self._stopping = False
+
+    def _start(self, index):
+        process = self._context.Process(
+            target=run_worker, name='worker-{}'.format(index),
+            args=(self.factory, self.factory_args, index,
+                  self.shards[index], self.limiter, self.health,
+                  self.health_interval,
+                  logging.getLogger().getEffectiveLevel()))
+        process.start()
+        _logger.info("Started worker {} (pid {}) with {} pairs".format(
+            index, process.pid, len(self.shards[index])))
+        self.processes[index] = process
+        self._started[index] = time.time()
+        self._restart_at[index] = None
+        self._progress[index] = None
+
+    def _collect_reports(self, timeout):
+        try:
+            report = self.health.get(timeout=timeout)
+            while True:
+                index = report['worker']
+                if report['pid'] == self.processes[index].pid:
+                    self.reports[index] = report
+                    self._update_progress(index, report)
+                report = self.health.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _update_progress(self, index, report):
+        progress = report['api_calls'] + report['rows']
+        last = self._progress[index]
+        if last is None or progress > last[0]:
+            if last is not None:
+                self._backoff[index] = min(1., self.max_backoff)
+            self._progress[index] = (progress, report['time'])
+
+    def _unhealthy(self, index, now):
+        """Reason why a running worker is unhealthy or None"""
+        report = self.reports[index]
+        if report is None or report['time'] < self._started[index]:
+            report = None
+        last = report['time'] if report is not None else 0.
+        if now - max(self._started[index], last) > 3 * self.health_interval:
+            return "stopped reporting"
+        elif report is not None and report['finished']:
+            return "has {} finished tasks".format(report['finished'])
+        progress = self._progress[index]
+        last = progress[1] if progress is not None else 0.
+        if now - max(self._started[index], last) > \
+                self.max_stall * self.health_interval:
+            return "makes no progress"
+        return None
+
+    def _check(self, index):
+        process = self.processes[index]
+        now = time.time()
+        if self._restart_at[index] is not None:
+            if now >= self._restart_at[index]:
+                self.restarts[index] += 1
+                self._start(index)
+            return
+        reason = self._unhealthy(index, now) if process.is_alive() else None
+        if reason is not None:
+            _logger.warning("Worker {} {}, terminating it...".format(
+                index, reason))
+            process.terminate()
+            process.join(self.health_interval)
+        if not process.is_alive():
+            backoff = self._backoff[index]
+            _logger.error("Worker {} exited with code {}, restarting in "
+                          "{:.0f}s...".format(index, process.exitcode,
+                                              backoff))
+            self._restart_at[index] = now + backoff
+            self._backoff[index] = min(2 * backoff, self.max_backoff)
+
+    def poll(self, timeout=1.):
+        """Collect health reports and restart failed workers"""
+        self._collect_reports(timeout)
+        if not self._stopping:
+            for index in range(len(self.processes)):
+                self._check(index)
+
+    def summary(self):
+        """Aggregated health of all workers
+
+        Returns:
+            dict: number of alive workers, restarts and the sums of the
+            last reported totals
+        """
+        summary = {'workers': len(self.processes),
+                   'alive': sum(process is not None and process.is_alive()
+                                for process in self.processes),
+                   'restarts': sum(self.restarts)}
+        for key in ('api_calls', 'rows', 'errors'):
+            summary[key] = sum(report[key] for report in self.reports
+                               if report is not None)
+        return summary
+
+    def _stop(self, signum, frame):
+        _logger.info("Stopping workers...")
+        self._stopping = True
+
+    def stop(self, timeout=30.):
+        self._stopping = True
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.kill()
+
+    def run(self):
+        for index in range(len(self.shards)):
+            self._start(index)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        last_summary = time.time()
+        try:
+            while not self._stopping:
+                self.poll()
+                if time.time() - last_summary >= self.health_interval:
+                    _logger.info("Health: {}".format(self.summary()))
+                    last_summary = time.time()
+        finally:
+            self.stop()
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel parameter sweeps of broker hyperparameters over price history
+
+The history is stored once as a memory-mapped file of (time, bid, ask)
+rows which every worker process maps instead of receiving a pickled copy.
+Results are appended to a checkpoint file so an interrupted sweep resumes
+where it stopped.
+"""
+import os
+import json
+import random
+import logging
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from .backtest import Backtest, TICKER_COLS, to_seconds
+from .broker import SimpleBroker
+from .model import RandomWalk
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "gpl3"
+
+_logger = logging.getLogger(__name__)
+
+PARAMS = ('risk', 'max_loss', 'horizon', 'dt', 'discount', 'min_bet',
+          'max_stake')
+DEFAULTS = {'risk': 0.25, 'max_loss': 0.1, 'horizon': 600., 'dt': 60.,
+            'discount': 0.9999, 'min_bet': 50., 'max_stake': None}
+
+
+def grid(**params):
+    """All combinations of the given parameter values
+
+    Args:
+        **params: parameter name to list of values
+
+    Returns:
+        list: configurations as dicts
+    """
+    names = sorted(params)
+    return [dict(zip(names, values))
+            for values in itertools.product(*[params[n] for n in names])]
+
+
+# parameters which have to be a multiple of another one for the broker
+MULTIPLES = (('dt', 'horizon'), ('min_bet', 'max_stake'))
+
+
+def random_search(n, seed=None, **params):
+    """Random configurations the broker accepts
+
+    Parameters are sampled independently, but `horizon` is rounded to a
+    multiple of `dt` and `max_stake` to a multiple of `min_bet`. If `dt`
+    or `min_bet` is sampled from a range, it is rounded to a whole number
+    first so that these multiples are exact.
+
+    Args:
+        n (int): number of configurations
+        seed (int): seed of the random generator
+        **params: parameter name to a list of choices or a tuple
+            (low, high) to sample uniformly from
+
+    Returns:
+        list: configurations as dicts
+    """
+    rnd = random.Random(seed)
+
+    def sample(values):
+        if isinstance(values, tuple):
+            return rnd.uniform(*values)
+        return rnd.choice(values)
+
+    def sample_config():
+        config = {name: sample(values)
+                  for name, values in sorted(params.items())}
+        for base, multiple in MULTIPLES:
+            if base not in config and multiple not in config:
+                continue
+            if isinstance(params.get(base), tuple):
+                config[base] = float(max(round(config[base]), 1))
+            step = config.get(base, DEFAULTS[base])
+            value = config.get(multiple, DEFAULTS[multiple])
+            if value is not None:
+                config[multiple] = max(round(value / step), 1) * step
+        return config
+
+    return [sample_config() for _ in range(n)]
+
+
+def save_history(path, chunks):
+    """Write chunks of (times, bids, asks) arrays to a raw float64 file
+
+    Returns:
+        int: number of rows written
+    """
+    n_rows = 0
+    with open(path, 'wb') as fh:
+        for times, bids, asks in chunks:
+            rows = np.column_stack([times, bids, asks]).astype(np.float64)
+            rows.tofile(fh)
+            n_rows += len(rows)
+    return n_rows
+
+
+def dump_history(db_client, pair, path, start=None, end=None,
+                 chunksize=100000):
+    """Stream the ticker of a pair from the database into a history file
+
+    The pair and time range are stored next to it in `path` + `.json`
+    once the history is complete.
+    """
+    if os.path.exists(path + '.json'):
+        os.remove(path + '.json')
+    chunks = ((to_seconds(df['createtime'].values), df['bid_price'].values,
+               df['ask_price'].values)
+              for df in db_client.load_ticker(pair, start, end,
+                                              columns=TICKER_COLS,
+                                              chunksize=chunksize))
+    n_rows = save_history(path, chunks)
+    with open(path + '.json', 'w') as fh:
+        json.dump(history_meta(pair, start, end), fh)
+    return n_rows
+
+
+def history_meta(pair, start=None, end=None):
+    return {'pair': pair,
+            'start': None if start is None else start.isoformat(),
+            'end': None if end is None else end.isoformat()}
+
+
+def is_cached(path, pair, start=None, end=None):
+    """Whether `path` holds the history of the pair and time range"""
+    try:
+        with open(path + '.json') as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        return False
+    return os.path.exists(path) and meta == history_meta(pair, start, end)
+
+
+def load_history(path):
+    """Memory-map a history file as array of (time, bid, ask) rows"""
+    return np.memmap(path, dtype=np.float64, mode='r').reshape(-1, 3)
+
+
+def config_key(config):
+    return json.dumps(config, sort_keys=True)
+
+
+def evaluate(config, path, funds=1000., fee=0.0026, warmup=10,
+             chunksize=100000):
+    """Backtest one configuration over a history file
+
+    Returns:
+        dict: backtest report or the error of a failed configuration
+    """
+    params = dict(DEFAULTS, **config)
+    try:
+        if params['max_stake'] is None:
+            params['max_stake'] = (funds // params['min_bet'] *
+                                   params['min_bet'])
+        broker = SimpleBroker(funds, params['min_bet'], params['horizon'],
+                              params['dt'], params['discount'],
+                              risk=params['risk'],
+                              max_stake=params['max_stake'],
+                              ask_fee=fee, bid_fee=fee,
+                              max_loss=params['max_loss'])
+        backtest = Backtest(broker, RandomWalk(params['dt']), warmup=warmup)
+        history = load_history(path)
+        for start in range(0, len(history), chunksize):
+            rows = np.asarray(history[start:start + chunksize])
+            backtest.feed(rows[:, 0], rows[:, 1], rows[:, 2])
+        return backtest.report()
+    except Exception as e:
+        # one failing configuration must not abort the whole sweep
+        _logger.exception("Configuration {} failed:".format(config))
+        return {'error': '{}: {}'.format(type(e).__name__, e)}
+
+
+def load_checkpoint(path):
+    """Results of a checkpoint file keyed by configuration"""
+    results = {}
+    if path is not None and os.path.exists(path):
+        with open(path) as fh:
+            for line in fh:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue  # partially written last line
+                results[config_key(result['config'])] = result
+    return results
+
+
+def sweep(path, configs, n_jobs=None, checkpoint=None, **kwargs):
+    """Evaluate configurations in parallel over a history file
+
+    Args:
+        path (str): history file as written by :func:`save_history`
+        configs (list): configurations as dicts
+        n_jobs (int): number of worker processes, all cores if None
+        checkpoint (str): file to append results to and resume from
+        **kwargs: further arguments of :func:`evaluate`
+
+    Returns:
+        list: dicts with `config` and `report` in the order of `configs`
+    """
+    results = load_checkpoint(checkpoint)
+    pending = [c for c in configs if config_key(c) not in results]
+    _logger.info("{} of {} configurations to evaluate".format(
+        len(pending), len(configs)))
+    if pending:
+        fh = open(checkpoint, 'a') if checkpoint is not None else None
+        try:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = {executor.submit(evaluate, config, path, **kwargs):
+                           config for config in pending}
+                for future in as_completed(futures):
+                    result = {'config': futures[future],
+                              'report': future.result()}
+                    results[config_key(result['config'])] = result
+                    if fh is not None:
+                        fh.write(json.dumps(result) + '\n')
+                        fh.flush()
+        finally:
+            if fh is not None:
+                fh.close()
+    return [results[config_key(c)] for c in configs]
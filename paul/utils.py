@@ -29,3 +29,4 @@ def find_next_extremum(series):
             pos += 1
         else:
             return pos, ext
+    return pos, ext
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import signal
+import socket
+import asyncio
+import subprocess
+
+from paul.agent import Agent
+from paul.broker import SimpleBroker
+from paul.collector import Collector
+from paul.fakekraken import FakeKraken
+from paul.kraken import AsyncAPI, RateLimiter
+from paul.model import RandomWalk
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+
+def test_agent_without_db():
+    async def run():
+        kraken = FakeKraken(pairs=['XXBTZEUR', 'XETHZEUR'], seed=42)
+        runner, uri = await kraken.start()
+        api = AsyncAPI(uri=uri)
+        collector = Collector(None, api, ['XXBTZEUR'], {'ticker': 0.},
+                              limiter=RateLimiter(max_count=1000))
+        broker = SimpleBroker(funds=1000., min_bet=100., horizon=0.,
+                              dt=1e-6, discount=0.9999)
+        agent = Agent(collector, 'XXBTZEUR', broker, RandomWalk(dt=1.),
+                      warmup=2)
+        tasks = [asyncio.ensure_future(collector.poll_ticker()),
+                 asyncio.ensure_future(agent.run())]
+        try:
+            while agent.trader.n_decisions < 5:
+                await asyncio.sleep(0.01)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await api.close()
+            await runner.cleanup()
+        return agent.report()
+
+    report = asyncio.run(asyncio.wait_for(run(), timeout=10))
+    assert report['decisions'] >= 5
+    assert report['ticks'] >= report['decisions'] + 2
+    assert 0 < report['latency_mean'] <= report['latency_max'] < 1.
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10.):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1.).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("Port {} is not open".format(port))
+
+
+def test_run_command():
+    port = free_port()
+    kraken = subprocess.Popen([sys.executable, '-m', 'paul.fakekraken',
+                               '--port', str(port)],
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        agent = subprocess.Popen(
+            [sys.executable, '-m', 'paul.cli', 'run', 'XXBTZEUR',
+             '--uri', 'http://127.0.0.1:{}'.format(port), '--no-persist',
+             '--tick-rate', '0.05', '--warmup', '2', '--horizon', '60',
+             '--dt', '60'],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        time.sleep(3.)
+        agent.send_signal(signal.SIGINT)
+        output, _ = agent.communicate(timeout=10)
+    finally:
+        kraken.terminate()
+        kraken.wait(10)
+    report = dict(line.split(None, 1) for line in
+                  output.decode().splitlines() if line and line[0] != '[')
+    assert agent.returncode == 0
+    assert int(report['decisions']) > 0
+    assert int(report['ticks']) >= int(report['decisions']) + 2
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+from paul.archive import write_partition, exported_days, load  # noqa
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+
+def test_write_load(tmpdir):
+    root = str(tmpdir)
+    for day in (date(2017, 1, 1), date(2017, 1, 2)):
+        df = pd.DataFrame({
+            'createtime': pd.date_range(day, periods=4, freq='6h'),
+            'pair': 'XXBTZEUR',
+            'price': [1., 2., 3., 4.],
+            'volume': [.1, .2, .3, .4],
+            'order': 'b', 'type': 'l', 'misc': ''})
+        write_partition(root, 'trades', 'XXBTZEUR', day, df)
+    assert exported_days(root, 'trades', 'XXBTZEUR') == [
+        date(2017, 1, 1), date(2017, 1, 2)]
+    df = load(root, 'trades', 'XXBTZEUR', start=datetime(2017, 1, 1, 12),
+              end=datetime(2017, 1, 2, 6), columns=['price'])
+    assert list(df.columns) == ['price']
+    assert df['price'].tolist() == [3., 4., 1.]
+    assert df['price'].dtype == 'float64'
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from paul.broker import SimpleBroker
+from paul.model import RandomWalk
+from paul.backtest import Backtest, to_seconds
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+
+def test_backtest():
+    rng = np.random.RandomState(42)
+    n = 2000
+    times = 1.5e9 + 10. * np.arange(n)
+    mids = 100. + np.cumsum(rng.normal(0.05, 0.1, n))
+    broker = SimpleBroker(1000., 100., horizon=60, dt=10, discount=1.,
+                          ask_fee=0.001, bid_fee=0.001)
+    backtest = Backtest(broker, RandomWalk(dt=10))
+    for chunk in np.array_split(np.arange(n), 4):
+        backtest.feed(times[chunk], mids[chunk] - 0.01, mids[chunk] + 0.01)
+    report = backtest.report()
+    assert report['ticks'] == n
+    assert report['decisions'] == n - backtest.warmup
+    assert report['trades'] > 0
+    assert report['pnl'] == pytest.approx(
+        broker.curr_depot_value(mids[-1] - 0.01) - 1000.)
+    assert 0 <= report['max_drawdown'] < 1
+
+
+def test_to_seconds():
+    times = np.array(['2017-01-01T00:00:01'], dtype='datetime64[ns]')
+    assert to_seconds(times).tolist() == [1483228801.]
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from scipy import stats
+from paul.broker import (SimpleBroker, ChunkLedger, Quadrature,
+                         PortfolioBroker)
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+
+def make_broker(fee=0.):
+    return SimpleBroker(funds=1000., min_bet=200., horizon=60, dt=10,
+                        discount=0.9999, risk=0.25, max_loss=0.1,
+                        ask_fee=fee, bid_fee=fee)
+
+
+def scenarios():
+    return [[stats.norm(100.5 + i, 2) for i in range(7)],
+            [stats.norm(99.5 - i, 2) for i in range(7)],
+            [stats.norm(100.5 + 0.1 * i, 20) for i in range(7)]]
+
+
+@pytest.mark.parametrize('fee', [0., 0.002])
+def test_vectorized_make_order(fee):
+    broker = make_broker(fee)
+    for holdings in [[], [(2, 100.), (1, 110.)]]:
+        for count, price in holdings:
+            broker.get_chunks(count, price, inplace=True)
+        for dists in scenarios():
+            assert (broker.make_order(100., dists, vectorized=False) ==
+                    broker.make_order(100., dists))
+
+
+def test_order_candidates():
+    broker = make_broker(0.002)
+    broker.get_chunks(2, 100., inplace=True)
+    broker.get_chunks(1, 90., inplace=True)
+    counts, leftovers, sums = broker.order_candidates(95.)
+    for count, leftover, chunk_sum in zip(counts, leftovers, sums):
+        exp_leftover, chunks = broker.get_chunks(int(count), 95.)
+        assert leftover == pytest.approx(exp_leftover)
+        assert chunk_sum == pytest.approx(np.sum(chunks))
+
+
+def test_chunk_ledger():
+    ledger = ChunkLedger(6)
+    ledger.push(2, 1.)
+    ledger.push(3, 2.)
+    ledger.push(1, 1.5)
+    assert ledger.values.tolist() == [2., 2., 2., 1.5, 1., 1.]
+    assert ledger.free == 0
+    assert ledger.total == pytest.approx(9.5)
+    assert ledger.top_sum(4) == pytest.approx(7.5)
+    assert ledger.pop(4) == pytest.approx(7.5)
+    assert ledger.values.tolist() == [1., 1.]
+    assert ledger.total == pytest.approx(2.)
+    with pytest.raises(ValueError):
+        ledger.values[0] = 3.
+
+
+@pytest.mark.parametrize('rule', ['gauss', 'trapezoid'])
+def test_quadrature(rule):
+    quadrature = Quadrature(n_points=64 if rule == 'gauss' else 2048,
+                            rule=rule)
+    dist = stats.lognorm(0.1, scale=100.)
+    prices, weights = quadrature(dist, 2, 0.9)
+    assert weights.sum() == pytest.approx(0.81, rel=1e-6)
+    assert weights.dot(prices) == pytest.approx(0.81 * dist.mean(), rel=1e-6)
+    other = Quadrature(n_points=quadrature.n_points, rule=rule)
+    assert other._weights is quadrature._weights
+
+
+@pytest.mark.parametrize('fee', [0., 0.002])
+def test_portfolio_single_pair(fee):
+    broker = make_broker(fee)
+    portfolio = PortfolioBroker(['XBTEUR'], funds=1000., min_bet=200.,
+                                horizon=60, dt=10, discount=0.9999,
+                                risk=0.25, max_loss=0.1, ask_fee=fee,
+                                bid_fee=fee)
+    for holdings in [[], [(2, 100.), (1, 110.)]]:
+        for count, price in holdings:
+            broker.get_chunks(count, price, inplace=True)
+            portfolio.get_chunks('XBTEUR', count, price, inplace=True)
+        for dists in scenarios():
+            orders = portfolio.make_order({'XBTEUR': 100.},
+                                          {'XBTEUR': dists})
+            assert orders['XBTEUR'] == broker.make_order(100., dists)
+
+
+def test_portfolio_allocation():
+    pairs = ['up', 'more_up', 'down']
+    broker = PortfolioBroker(pairs, funds=1000., min_bet=100., horizon=60,
+                             dt=10, discount=0.9999, risk=0.5, max_loss=0.5)
+    dists = {'up': [stats.norm(100.5 + i, 1) for i in range(7)],
+             'more_up': [stats.norm(101 + 2 * i, 1) for i in range(7)],
+             'down': [stats.norm(99.5 - i, 1) for i in range(7)]}
+    prices = {pair: 100. for pair in pairs}
+    orders = broker.make_order(prices, dists)
+    assert orders == {'up': 0, 'more_up': 10, 'down': 0}
+    broker.execute(orders, prices)
+    assert broker.at_stake == 1000.
+    assert broker.max_ask == 0
+    dists['more_up'], dists['up'] = dists['down'], dists['more_up']
+    orders = broker.make_order(prices, dists)
+    assert orders['more_up'] == -10
+    broker.execute(orders, prices)
+    assert broker.leftover == pytest.approx(1000.)
+
+    broker.risk = 0.001
+    orders = broker.make_order(prices, {pair: [stats.norm(100.5, 20)] * 7
+                                        for pair in pairs})
+    assert 0 < sum(orders.values()) < 10
+
+
+def test_portfolio_has_no_single_pair_api():
+    broker = PortfolioBroker(['A', 'B'], funds=1000., min_bet=100.,
+                             horizon=60, dt=10, discount=0.9999)
+    assert not isinstance(broker, SimpleBroker)
+    for name in ('chunks', 'ask_chunks', 'bid_chunks', 'loss_risk',
+                 'make_order_samples'):
+        assert not hasattr(broker, name)
+    assert broker.capacity == 10
+    assert broker.max_ask == 10
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import asyncio
+
+import pytest
+from paul.buffer import WriteBuffer
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+
+class FakeDBClient(object):
+    def __init__(self):
+        self.fail = False
+        self.written = []
+
+    def write_records(self, batches):
+        if self.fail:
+            raise RuntimeError("DB down")
+        self.written.append(batches)
+
+
+def test_flush_on_size():
+    async def run():
+        db = FakeDBClient()
+        buffer = WriteBuffer(db, max_rows=3, max_delay=60.)
+        task = asyncio.ensure_future(buffer.run())
+        await buffer.put('ticker', [(1,), (2,)])
+        await buffer.put('depth', [(3,)])
+        await asyncio.sleep(0.05)
+        task.cancel()
+        return db.written
+
+    written = asyncio.run(run())
+    assert written == [{'ticker': [(1,), (2,)], 'depth': [(3,)]}]
+
+
+def test_spill_and_replay(tmpdir):
+    async def run():
+        db = FakeDBClient()
+        buffer = WriteBuffer(db, max_rows=1, spill_dir=str(tmpdir))
+        db.fail = True
+        await buffer.put('ticker', [(1,)])
+        await buffer.close()
+        assert len(os.listdir(str(tmpdir))) == 1
+        db.fail = False
+        await buffer.put('ticker', [(2,)])
+        await buffer.close()
+        return db.written
+
+    written = asyncio.run(run())
+    assert written == [{'ticker': [(1,)]}, {'ticker': [(2,)]}]
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_overflow_while_db_down(tmpdir):
+    async def run():
+        db = FakeDBClient()
+        buffer = WriteBuffer(db, max_rows=1, max_pending=2,
+                             spill_dir=str(tmpdir), retry_delay=0.01)
+        db.fail = True
+        task = asyncio.ensure_future(buffer.run())
+        for i in range(6):
+            await buffer.put_batches({'trades': [(i,)],
+                                      'cursors': [('trades', 'A', str(i))]})
+        await asyncio.sleep(0.05)
+        assert db.written == []
+        assert os.listdir(str(tmpdir))
+        db.fail = False
+        await asyncio.sleep(0.1)
+        await buffer.put_batches({'trades': [(6,)],
+                                  'cursors': [('trades', 'A', '6')]})
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await buffer.close()
+        return db.written
+
+    written = asyncio.run(run())
+    assert [batch['trades'] for batch in written] == [[(i,)]
+                                                     for i in range(7)]
+    assert [batch['cursors'][0][2] for batch in written] == [
+        str(i) for i in range(7)]
+    assert os.listdir(str(tmpdir)) == []
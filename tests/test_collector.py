@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+from paul.collector import Collector
+from paul.fakekraken import FakeKraken
+from paul.kraken import AsyncAPI
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+
+class FlakyDBClient(object):
+    def __init__(self):
+        self.nloads = 0
+        self.written = []
+
+    def load_cursors(self, endpoint):
+        self.nloads += 1
+        if self.nloads == 1:
+            raise RuntimeError("DB down")
+        return {}
+
+    def insert_trades(self, pair, trades, last=None):
+        self.written.append((pair, last))
+
+
+def test_poll_events_survives_cursor_errors():
+    async def run():
+        kraken = FakeKraken(pairs=['XXBTZEUR'], seed=42)
+        runner, uri = await kraken.start()
+        db = FlakyDBClient()
+        try:
+            async with AsyncAPI(uri=uri) as api:
+                collector = Collector(db, api, ['XXBTZEUR'], {'trades': 0.05})
+                task = asyncio.ensure_future(collector.poll_trades())
+                await asyncio.sleep(0.3)
+                task.cancel()
+                errors = collector.metrics.errors.get(type='RuntimeError')
+        finally:
+            await runner.cleanup()
+        return db, errors
+
+    db, errors = asyncio.run(run())
+    assert errors == 1
+    assert db.nloads == 2
+    assert db.written
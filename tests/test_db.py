@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+from decimal import Decimal
+from datetime import datetime, date
+
+import pytest
+from sqlalchemy import create_engine, text
+from paul.db import (depth_records, ticker_records, copy_buffer,
+                     trade_records, spread_records, create_metadata,
+                     TICKER_COLS, DEPTH_COLS, DBClient, DB_URI, month_start,
+                     partition_name)
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+# PostgreSQL for the partition tests, these are skipped if not reachable
+PG_URI = os.environ.get('PAUL_TEST_DB_URI', DB_URI)
+
+TICKER = {'XXBTZEUR': {'a': ['5000.1', '1', '1.000'],
+                       'b': ['5000.0', '2', '2.000'],
+                       'c': ['5000.0', '0.5'],
+                       'v': ['10.0', '20.0'],
+                       'p': ['4990.0', '4980.0'],
+                       't': [100, 200],
+                       'l': ['4900.0', '4800.0'],
+                       'h': ['5100.0', '5200.0'],
+                       'o': '4950.0'}}
+DEPTH = {'XXBTZEUR': {'asks': [['5000.1', '1.0', 1500000000],
+                               ['5000.2', '2.0', 1500000001]],
+                      'bids': [['5000.0', '3.0', 1500000002]]}}
+
+
+def test_ticker_records():
+    createtime = datetime(2017, 1, 1)
+    records = ticker_records(TICKER, createtime)
+    assert len(records) == 1
+    assert len(records[0]) == len(TICKER_COLS)
+    assert records[0][:4] == ('2017-01-01T00:00:00', 'XXBTZEUR',
+                              '5000.1', '1.000')
+
+
+def test_depth_records_copy_buffer():
+    records = depth_records(DEPTH, datetime(2017, 1, 1))
+    assert len(records) == 3
+    assert all(len(r) == len(DEPTH_COLS) for r in records)
+    lines = copy_buffer(records).read().splitlines()
+    assert lines[1].split('\t') == ['2017-01-01T00:00:00', 'XXBTZEUR',
+                                    'asks', '1', '5000.2', '2.0',
+                                    '2017-07-14T02:40:01']
+
+
+def test_copy_buffer_escapes():
+    records = [('a\tb', 'c\\d', None), ('e\nf', '', 'g\rh')]
+    assert copy_buffer(records).read() == (
+        'a\\tb\tc\\\\d\t\\N\ne\\nf\t\tg\\rh\n')
+    assert copy_buffer([('1', None), ('2', '3')]).read() == (
+        '1\t\\N\n2\t3\n')
+
+
+def test_trade_spread_records():
+    trades = [['5000.0', '0.1', 1500000000.1234, 'b', 'l', '']]
+    spreads = [[1500000000, '5000.0', '5000.1']]
+    assert trade_records('XXBTZEUR', trades) == [
+        ('2017-07-14T02:40:00.123400', 'XXBTZEUR', '5000.0', '0.1',
+         'b', 'l', '')]
+    assert spread_records('XXBTZEUR', spreads) == [
+        ('2017-07-14T02:40:00', 'XXBTZEUR', '5000.0', '5000.1')]
+
+
+def test_load_chunks():
+    client = DBClient(uri='sqlite://')
+    client.create_tables()
+    rows = [{'createtime': datetime(2017, 1, 1, 0, i), 'pair': pair,
+             'price': Decimal('1.5') * i, 'volume': Decimal('0.25')}
+            for i in range(10) for pair in ('XXBTZEUR', 'XETHZEUR')]
+    with client.engine.begin() as conn:
+        conn.execute(client.trades.insert(), rows)
+    start, end = datetime(2017, 1, 1, 0, 2), datetime(2017, 1, 1, 0, 9)
+    df = client.load_trades('XXBTZEUR', start, end, columns=['price'])
+    assert df['price'].tolist() == [1.5 * i for i in range(2, 9)]
+    chunks = list(client.load_trades('XXBTZEUR', start, end, chunksize=3))
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    assert chunks[0]['volume'].dtype == 'float64'
+
+
+def test_month_start_partition_name():
+    assert month_start(date(2017, 11, 15), 2) == date(2018, 1, 1)
+    assert month_start(date(2017, 1, 31), -1) == date(2016, 12, 1)
+    assert partition_name('ticker', date(2017, 3, 1)) == 'ticker_y2017m03'
+
+
+class RecordingConnection(object):
+    def __init__(self, existing=()):
+        self.existing = existing
+        self.statements = []
+
+    def execute(self, stmt, params=None):
+        self.statements.append(str(stmt))
+        exists = params is not None and params['name'] in self.existing
+        return type('Result', (object,), {
+            'scalar': lambda _: 'exists' if exists else None})()
+
+
+def test_create_partitions_moves_default_rows():
+    conn = RecordingConnection(existing=['trades_y2017m01'])
+    DBClient._create_partitions(conn, date(2017, 1, 15), date(2017, 1, 20))
+    ddl = [stmt for stmt in conn.statements if 'to_regclass' not in stmt]
+    assert ddl[0] == ('CREATE TABLE IF NOT EXISTS trades_default '
+                      'PARTITION OF trades DEFAULT')
+    spreads = [stmt for stmt in ddl if 'spreads_y2017m01' in stmt]
+    assert len(spreads) == 3
+    assert 'DELETE FROM spreads_default' in spreads[1]
+    assert "ATTACH PARTITION spreads_y2017m01 FOR VALUES FROM " \
+           "('2017-01-01') TO ('2017-02-01')" in spreads[2]
+    assert not any('trades_y2017m01' in stmt for stmt in ddl)
+
+
+@pytest.fixture
+def pg_uri():
+    """URI of a fresh schema in PostgreSQL, dropped after the test"""
+    pytest.importorskip('psycopg2')
+    engine = create_engine(PG_URI)
+    schema = 'paul_test_{}'.format(os.getpid())
+    try:
+        with engine.begin() as conn:
+            conn.execute(text('CREATE SCHEMA {}'.format(schema)))
+    except Exception as e:
+        engine.dispose()
+        pytest.skip("PostgreSQL not available: {}".format(e))
+    sep = '&' if '?' in PG_URI else '?'
+    yield '{}{}options=-csearch_path%3D{}'.format(PG_URI, sep, schema)
+    with engine.begin() as conn:
+        conn.execute(text('DROP SCHEMA {} CASCADE'.format(schema)))
+    engine.dispose()
+
+
+def spread_partitions(client):
+    """Number of spreads per partition"""
+    with client.engine.connect() as conn:
+        return dict(conn.execute(text(
+            'SELECT tableoid::regclass::text, count(*) FROM spreads '
+            'GROUP BY 1')).fetchall())
+
+
+def test_pg_migrate_legacy_tables(pg_uri):
+    engine = create_engine(pg_uri)
+    create_metadata(partitioned=False).create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO spreads (createtime, pair, bid, ask) VALUES "
+            "('2017-01-15', 'XXBTZEUR', 1, 2), "
+            "('2017-03-15', 'XXBTZEUR', 1, 2), "
+            "(now() at time zone 'utc', 'XXBTZEUR', 1, 2)"))
+    engine.dispose()
+    client = DBClient(uri=pg_uri)
+    client.create_tables()
+    this_month = partition_name('spreads', datetime.utcnow().date())
+    assert spread_partitions(client) == {'spreads_y2017m01': 1,
+                                         'spreads_y2017m03': 1,
+                                         this_month: 1}
+    with client.engine.connect() as conn:
+        assert conn.execute(text(
+            "SELECT to_regclass('spreads_legacy')")).scalar() is None
+        assert conn.execute(text(
+            "SELECT to_regclass('spreads_y2017m02')")).scalar() is not None
+    client.write_records({'spreads': [('2017-01-20T00:00:00', 'XXBTZEUR',
+                                       '1', '2')]})
+    assert spread_partitions(client)['spreads_y2017m01'] == 2
+    client.engine.dispose()
+
+
+def test_pg_roll_and_drop_partitions(pg_uri):
+    client = DBClient(uri=pg_uri)
+    client.create_tables()
+    future = month_start(datetime.utcnow().date(), 4)
+    client.write_records({'spreads': [
+        ('2016-05-01T00:00:00', 'XXBTZEUR', '1', '2'),
+        ('{}T12:00:00'.format(future), 'XXBTZEUR', '1', '2')]})
+    assert spread_partitions(client) == {'spreads_default': 2}
+
+    client.create_partitions(months_ahead=4)
+    assert spread_partitions(client) == {
+        'spreads_default': 1, partition_name('spreads', future): 1}
+
+    client.write_records({'spreads': [
+        ('2017-01-15T00:00:00', 'XXBTZEUR', '1', '2')]})
+    with client.engine.begin() as conn:
+        DBClient._create_partitions(conn, date(2017, 1, 1),
+                                    date(2017, 2, 1))
+    assert spread_partitions(client)['spreads_y2017m01'] == 1
+    dropped = client.drop_partitions(date(2017, 2, 1))
+    assert 'spreads_y2017m01' in dropped
+    assert 'spreads_y2017m02' not in dropped
+    assert spread_partitions(client) == {
+        partition_name('spreads', future): 1}
+    client.engine.dispose()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timedelta
+
+import pytest
+from paul.depth import DepthEncoder, rebuild_book
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+BOOKS = [{'asks': [['10.1', '1.0', 100], ['10.2', '2.0', 100]],
+          'bids': [['10.0', '1.5', 100], ['9.9', '3.0', 100]]},
+         {'asks': [['10.1', '1.0', 100], ['10.3', '2.0', 101]],
+          'bids': [['10.0', '0.5', 101], ['9.9', '3.0', 100]]},
+         {'asks': [['10.1', '1.0', 100], ['10.3', '2.0', 101]],
+          'bids': [['10.0', '0.5', 101], ['9.9', '3.0', 100]]},
+         {'asks': [['10.05', '1.0', 102]],
+          'bids': [['10.0', '0.5', 101], ['9.9', '3.0', 100]]}]
+
+
+def test_encode_rebuild():
+    encoder = DepthEncoder(keyframe_interval=3)
+    start = datetime(2017, 1, 1)
+    stored = []
+    for i, book in enumerate(BOOKS):
+        createtime = start + timedelta(minutes=i)
+        records = encoder.records({'XXBTZEUR': book}, createtime)
+        stored.extend((r[0], r[2], r[3], r[4], r[5], r[6])
+                      for r in records)
+        rebuilt = rebuild_book(stored)
+        assert [l[:2] for l in rebuilt['asks']] == [
+            l[:2] for l in book['asks']]
+        assert [l[:2] for l in rebuilt['bids']] == [
+            l[:2] for l in book['bids']]
+        if i == 2:
+            assert records == []
+        if i == 3:
+            assert all(r[-1] for r in records)
+
+
+def test_reset_forces_keyframe():
+    encoder = DepthEncoder(keyframe_interval=100)
+    encoder.encode('XXBTZEUR', BOOKS[0])
+    keyframe, delta = encoder.encode('XXBTZEUR', BOOKS[1])
+    assert not keyframe
+    encoder.reset(['XXBTZEUR'])
+    keyframe, delta = encoder.encode('XXBTZEUR', BOOKS[2])
+    assert keyframe
+    assert len(delta) == 4
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+from decimal import Decimal
+
+import pytest
+from paul.buffer import WriteBuffer
+from paul.fakekraken import FakeKraken
+from paul.feed import FeedCollector, book_checksum
+from paul.kraken import AsyncAPI, RateLimiter
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+PAIRS = ['XXBTZEUR', 'XETHZEUR']
+
+
+class FakeDBClient(object):
+    def __init__(self):
+        self.written = []
+
+    def write_records(self, batches):
+        self.written.append(batches)
+
+    def load_cursors(self, endpoint):
+        return {}
+
+    def create_partitions(self):
+        pass
+
+    def rows(self, table):
+        return [row for batches in self.written
+                for row in batches.get(table, [])]
+
+
+def collect(duration, setup=None, **kwargs):
+    async def run():
+        kraken = FakeKraken(pairs=PAIRS, seed=42, ws_interval=0.005,
+                            **kwargs)
+        runner, uri = await kraken.start()
+        db = FakeDBClient()
+        collector = FeedCollector(
+            db, AsyncAPI(uri=uri), PAIRS,
+            {'ticker': 0, 'depth': 0, 'trades': 0, 'spreads': 0},
+            feed_uri=uri.replace('http', 'ws') + '/ws',
+            wsnames={pair: kraken.wsname(pair) for pair in PAIRS},
+            heartbeat_timeout=1., max_backoff=0.01,
+            limiter=RateLimiter(max_count=1000),
+            buffer=WriteBuffer(db, max_rows=100, max_delay=0.01))
+        if setup is not None:
+            setup(collector)
+        tasks = [asyncio.ensure_future(coro) for coro in collector.tasks()]
+        await asyncio.sleep(duration)
+        books = {pair: book.to_book()
+                 for pair, book in collector._books.items()}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await collector.buffer.close()
+        await collector.api.close()
+        await runner.cleanup()
+        return collector, db, books
+
+    return asyncio.run(run())
+
+
+def test_book_checksum():
+    # example of Kraken's documentation of the websocket feed
+    book = {'asks': [['0.05005', '0.00000500'], ['0.05010', '0.00000500'],
+                     ['0.05015', '0.00000500'], ['0.05020', '0.00000500'],
+                     ['0.05025', '0.00000500'], ['0.05030', '0.00000500'],
+                     ['0.05035', '0.00000500'], ['0.05040', '0.00000500'],
+                     ['0.05045', '0.00000500'], ['0.05050', '0.00000500']],
+            'bids': [['0.05000', '0.00000500'], ['0.04995', '0.00000500'],
+                     ['0.04990', '0.00000500'], ['0.04980', '0.00000500'],
+                     ['0.04975', '0.00000500'], ['0.04970', '0.00000500'],
+                     ['0.04965', '0.00000500'], ['0.04960', '0.00000500'],
+                     ['0.04955', '0.00000500'], ['0.04950', '0.00000500']]}
+    assert book_checksum(book) == 974947235
+
+
+def test_feed_collector():
+    collector, db, books = collect(0.5)
+    assert collector.nconnects == 1
+    assert collector.metrics.errors.get(type='ChecksumMismatch') == 0
+    assert {row[1] for row in db.rows('ticker')} == set(PAIRS)
+    assert db.rows('trades') and db.rows('spreads')
+    depth = db.rows('depth')
+    assert {row[1] for row in depth} == set(PAIRS)
+    for book in books.values():
+        assert len(book['asks']) == len(book['bids']) == 10
+    cursors = {(row[0], row[1]) for row in db.rows('cursors')}
+    assert ('trades', 'XXBTZEUR') in cursors
+
+
+def test_feed_collector_resync():
+    collector, db, _ = collect(1., checksum_error_rate=0.1, drop_rate=0.05)
+    assert collector.nconnects > 1
+    assert collector.metrics.errors.get(type='ChecksumMismatch') > 0
+    assert collector.metrics.errors.get(type='FeedError') > 0
+    assert len(db.rows('depth')) > 0
+
+
+def test_feed_collector_reconnects_on_unexpected_errors():
+    def setup(collector):
+        handle = collector._handle
+        failed = []
+
+        async def flaky_handle(msg):
+            if not failed and isinstance(msg, list):
+                failed.append(msg)
+                raise KeyError('unexpected')
+            await handle(msg)
+
+        collector._handle = flaky_handle
+
+    collector, db, _ = collect(0.5, setup=setup)
+    assert collector.nconnects > 1
+    assert collector.metrics.errors.get(type='KeyError') == 1
+    assert db.rows('ticker')
+
+
+class EventsDBClient(object):
+    def __init__(self):
+        self.rows = {'trades': [], 'spreads': []}
+
+    def load_cursors(self, endpoint):
+        return {}
+
+    def insert_trades(self, pair, trades, last):
+        self.rows['trades'].extend(trades)
+
+    def insert_spreads(self, pair, spreads, last):
+        self.rows['spreads'].extend(spreads)
+
+
+def trade(time):
+    return ['100.0', '1.0', time, 'b', 'l', '']
+
+
+def events_collector():
+    collector = FeedCollector(EventsDBClient(), None, ['XXBTZEUR'],
+                              {'trades': 0, 'spreads': 0},
+                              wsnames={'XXBTZEUR': 'XBT/EUR'})
+    collector._cursors = {'trades': {'XXBTZEUR': '1500000000500000000'},
+                          'spreads': {'XXBTZEUR': '1500000001'}}
+    collector._resynced = {
+        endpoint: {pair: Decimal(last) for pair, last in cursors.items()}
+        for endpoint, cursors in collector._cursors.items()}
+    return collector
+
+
+def handle_all(collector, msgs):
+    async def run():
+        for msg in msgs:
+            await collector._handle(msg)
+
+    asyncio.run(run())
+
+
+def test_feed_events_after_resync():
+    collector = events_collector()
+    trades = collector.subscribe('trades')
+    handle_all(collector, [
+        [1, [trade('1500000000.400000'), trade('1500000000.600000')],
+         'trade', 'XBT/EUR'],
+        [1, [trade('1500000000.100000')], 'trade', 'XBT/EUR'],
+        [2, ['99.9', '100.1', '1500000000.5'], 'spread', 'XBT/EUR'],
+        [2, ['99.9', '100.1', '1500000002.5'], 'spread', 'XBT/EUR']])
+    assert trades.qsize() == 1
+    assert trades.get_nowait()[2] == ('XXBTZEUR',
+                                      [trade('1500000000.600000')])
+    assert len(collector.db_client.rows['spreads']) == 1
+    assert collector._cursors == {
+        'trades': {'XXBTZEUR': '1500000000600000000'},
+        'spreads': {'XXBTZEUR': '1500000002'}}
+
+
+def test_feed_events_within_one_second():
+    collector = events_collector()
+    spreads = collector.subscribe('spreads')
+    times = ['1500000001.2', '1500000001.4', '1500000001.9',
+             '1500000002.1', '1500000002.6']
+    handle_all(collector, [[2, ['99.9', '100.1', time], 'spread', 'XBT/EUR']
+                           for time in times] +
+               [[1, [trade('1500000000.700000')], 'trade', 'XBT/EUR'],
+                [1, [trade('1500000000.700000')], 'trade', 'XBT/EUR']])
+    assert spreads.qsize() == len(times)
+    stored = collector.db_client.rows['spreads']
+    assert [spread[0] for spread in stored] == [float(t) for t in times]
+    assert len(collector.db_client.rows['trades']) == 2
+    assert collector._cursors == {
+        'trades': {'XXBTZEUR': '1500000000700000000'},
+        'spreads': {'XXBTZEUR': '1500000002'}}
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+from paul.collector import Collector
+from paul.kraken import RateLimiter, AsyncAPI
+from paul.fakekraken import FakeKraken, RATE_LIMIT_ERROR
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+
+def test_rate_limiter():
+    async def run():
+        limiter = RateLimiter(max_count=2, decay=50.)
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        for _ in range(2):
+            await limiter.acquire()
+        burst = loop.time() - start
+        for _ in range(3):
+            await limiter.acquire()
+        return burst, loop.time() - start
+
+    burst, total = asyncio.run(run())
+    assert burst < 0.02
+    assert total >= 3 / 50. - 1e-3
+
+
+def test_async_api_fake_kraken():
+    async def run():
+        kraken = FakeKraken(pairs=['XXBTZEUR', 'XETHZEUR'], max_count=3,
+                            decay=1e-3, depth_levels=5, seed=42)
+        runner, uri = await kraken.start()
+        try:
+            async with AsyncAPI(uri=uri) as api:
+                ticker = await api.ticker(['XXBTZEUR', 'XETHZEUR'])
+                depth = await api.depth('XXBTZEUR')
+                trades = await api.trades('XXBTZEUR')
+                limited = await api.spread('XXBTZEUR')
+        finally:
+            await runner.cleanup()
+        return ticker, depth, trades, limited
+
+    ticker, depth, trades, limited = asyncio.run(run())
+    assert set(ticker['result']) == {'XXBTZEUR', 'XETHZEUR'}
+    assert len(depth['result']['XXBTZEUR']['asks']) == 5
+    assert 'last' in trades['result']
+    assert limited['error'] == [RATE_LIMIT_ERROR]
+
+
+def test_async_api_session():
+    async def run():
+        kraken = FakeKraken(pairs=['XXBTZEUR'], seed=42)
+        runner, uri = await kraken.start()
+        try:
+            api = AsyncAPI(uri=uri, limit=2)
+            await api.ticker('XXBTZEUR')
+            session = api.session
+            await api.time()
+            assert api.session is session
+            assert session.connector.limit == 2
+            await api.close()
+            assert session.closed
+            resp = await api.time()
+            assert api.session is not session
+            await api.close()
+        finally:
+            await runner.cleanup()
+        return resp
+
+    assert not asyncio.run(run())['error']
+
+
+def test_async_api_errors_and_retries():
+    async def run():
+        kraken = FakeKraken(pairs=['XXBTZEUR'], error_rate=1., seed=42)
+        runner, uri = await kraken.start()
+        try:
+            async with AsyncAPI(uri=uri) as api:
+                collector = Collector(None, api, ['XXBTZEUR'], {})
+                failed = [await collector._call_api(api.ticker, 'XXBTZEUR')
+                          for _ in range(4)]
+                errors = collector.metrics.errors.total()
+                kraken.error_rate = 0.
+                retried = await collector._call_api(api.ticker, 'XXBTZEUR')
+        finally:
+            await runner.cleanup()
+        return failed, errors, retried
+
+    failed, errors, retried = asyncio.run(run())
+    assert failed == [None] * 4
+    assert errors == 4
+    assert 'XXBTZEUR' in retried
+
+
+def test_async_api_rate_limited_client():
+    async def run():
+        kraken = FakeKraken(pairs=['XXBTZEUR'], max_count=3, decay=50.)
+        runner, uri = await kraken.start()
+        try:
+            async with AsyncAPI(uri=uri) as api:
+                collector = Collector(None, api, ['XXBTZEUR'], {},
+                                      limiter=RateLimiter(3, 40.))
+                resps = await asyncio.gather(*[
+                    collector._call_api(api.time) for _ in range(10)])
+        finally:
+            await runner.cleanup()
+        return resps, collector.metrics.errors.total()
+
+    resps, errors = asyncio.run(run())
+    assert all(resps)
+    assert errors == 0
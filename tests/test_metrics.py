@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+from paul.metrics import Registry, serve
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+
+def test_render():
+    registry = Registry()
+    errors = registry.counter('errors_total', 'Errors', ('type',))
+    latency = registry.histogram('latency_seconds', 'Latency', ('endpoint',),
+                                 buckets=(0.1, 1.))
+    queue = registry.gauge('queue_size', 'Queue size')
+    errors.inc(type='ValueError')
+    errors.inc(2, type='ValueError')
+    latency.observe(0.05, endpoint='ticker')
+    latency.observe(0.5, endpoint='ticker')
+    queue.set_function(lambda: 7)
+    lines = registry.render().splitlines()
+    assert 'errors_total{type="ValueError"} 3.0' in lines
+    assert 'latency_seconds_bucket{endpoint="ticker",le="0.1"} 1.0' in lines
+    assert 'latency_seconds_bucket{endpoint="ticker",le="+Inf"} 2.0' in lines
+    assert 'latency_seconds_count{endpoint="ticker"} 2.0' in lines
+    assert 'queue_size 7.0' in lines
+    assert '# TYPE latency_seconds histogram' in lines
+
+
+def test_serve():
+    async def run():
+        registry = Registry()
+        registry.counter('requests_total', 'Requests').inc()
+        server = await serve(registry, 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        response = await reader.read()
+        writer.close()
+        server.close()
+        return response.decode()
+
+    response = asyncio.run(run())
+    assert response.startswith('HTTP/1.1 200 OK')
+    assert 'requests_total 1.0' in response
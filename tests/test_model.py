@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+from paul.model import BarBuilder, LocalLinearTrend, resample
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+
+def test_bar_builder():
+    rng = np.random.RandomState(0)
+    times = np.sort(rng.uniform(0, 3 * 3600, 3000))
+    times = times[(times < 2000) | (times > 5000)]
+    prices = 100 + np.cumsum(rng.randn(len(times)))
+    builder = BarBuilder(rules=['10s', '1min', '1h'])
+    bars = []
+    for time, price in zip(times, prices):
+        bars.extend(builder.update('XBTEUR', time, price, volume=1.))
+    bars.extend(builder.flush())
+
+    df = pd.DataFrame({'price': prices},
+                      index=pd.to_datetime(times, unit='s'))
+    for rule in builder.rules:
+        rule_bars = [bar for bar in bars if bar.rule == rule]
+        expected = resample(rule, df)['price']
+        assert np.allclose([bar.mean for bar in rule_bars], expected)
+        assert sum(bar.count for bar in rule_bars) == len(times)
+    hour = [bar for bar in bars if bar.rule == '1h'][0]
+    first = prices[times < 3600]
+    assert (hour.open, hour.close) == (first[0], first[-1])
+    assert (hour.high, hour.low) == (first.max(), first.min())
+    assert hour.volume == len(first)
+
+
+def test_local_linear_trend():
+    rng = np.random.RandomState(1)
+    times = np.cumsum(rng.exponential(5., 5000))
+    prices = 100 + 0.002 * times + 0.1 * rng.randn(len(times))
+    model = LocalLinearTrend(dt=10)
+    for time, price in zip(times, prices):
+        model.update(time, price)
+    assert abs(model.state[1] - 0.02) < 0.005
+    dists = model.forecast(60)
+    assert len(dists) == 60
+    means = np.array([dist.mean() for dist in dists])
+    stds = np.array([dist.std() for dist in dists])
+    assert np.allclose(np.diff(means), model.state[1])
+    assert np.all(np.diff(stds) > 0)
+    assert abs(dists[0].mean() - (100 + 0.002 * (times[-1] + 10))) < 0.2
+
+
+def test_local_linear_trend_forecast_variance():
+    model = LocalLinearTrend(dt=10, level_ratio=0.5, slope_ratio=0.1)
+    model.var = 2.
+    model.state = np.array([100., 0.1])
+    model.cov = np.array([[0.3, 0.05], [0.05, 0.02]])
+    cov, var = model.cov, model.var
+    q_level, q_slope = 0.5 * var, 0.1 * var
+    variances = np.array([dist.std()**2 for dist in model.forecast(5)])
+    # closed form for one and two steps ahead, one step has no slope noise
+    assert np.allclose(variances[:2], [
+        cov[0, 0] + 2 * cov[0, 1] + cov[1, 1] + q_level + var,
+        cov[0, 0] + 4 * cov[0, 1] + 4 * cov[1, 1] + 2 * q_level + q_slope +
+        var])
+    # iterating the one step prediction of the filter
+    expected = []
+    for _ in range(5):
+        model._predict(1.)
+        expected.append(model.cov[0, 0] + model.var)
+    assert np.allclose(variances, expected)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+
+import numpy as np
+import pytest
+from paul.orderbook import OrderBook, update_books
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+
+def random_book(rnd, n_levels=50):
+    asks = sorted(rnd.sample(range(10001, 10200), n_levels))
+    bids = sorted(rnd.sample(range(9800, 10000), n_levels), reverse=True)
+    return {order: [['{:.2f}'.format(p / 100.),
+                     '{:.3f}'.format(rnd.uniform(0.1, 5)), 1500000000]
+                    for p in prices]
+            for order, prices in (('asks', asks), ('bids', bids))}
+
+
+def levels(book, order):
+    return (np.array([float(level[0]) for level in book[order]]),
+            np.array([float(level[1]) for level in book[order]]))
+
+
+def test_order_book():
+    rnd = random.Random(42)
+    books = {}
+    for _ in range(5):
+        book = random_book(rnd)
+        update_books(books, {'XXBTZEUR': book})
+        ob = books['XXBTZEUR']
+        ask_prices, ask_vols = levels(book, 'asks')
+        bid_prices, bid_vols = levels(book, 'bids')
+        assert np.allclose(ob.asks.prices, ask_prices)
+        assert np.allclose(ob.bids.volumes, bid_vols)
+        assert ob.mid == (ask_prices[0] + bid_prices[0]) / 2
+        assert ob.spread == pytest.approx(ask_prices[0] - bid_prices[0])
+        assert bid_prices[0] < ob.microprice < ask_prices[0]
+        assert ob.depth('asks', ask_prices[9]) == pytest.approx(
+            ask_vols[:10].sum())
+        assert ob.depth('bids', bid_prices[0] + 1) == 0.
+        volume = ask_vols[:3].sum() + ask_vols[3] / 2
+        expected = (np.dot(ask_prices[:3], ask_vols[:3]) +
+                    ask_prices[3] * ask_vols[3] / 2) / volume
+        assert ob.fill_price('asks', volume) == pytest.approx(expected)
+        assert np.isnan(ob.fill_price('bids', bid_vols.sum() + 1))
+
+    ob.apply({('asks', book['asks'][0][0]): (None, None),
+              ('bids', '99.995'): ('1.000', 1500000001)})
+    assert ob.best_ask == ask_prices[1]
+    assert ob.best_bid == 99.995
+    # the cumulative sums of the queries above are recomputed
+    assert ob.depth('bids', 99.995) == pytest.approx(1.)
+    assert ob.depth('asks', ask_prices[9]) == pytest.approx(
+        ask_vols[1:10].sum())
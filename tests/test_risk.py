@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from scipy import stats
+from paul.broker import SimpleBroker
+from paul.risk import SampledPaths
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+
+def test_sampled_paths():
+    rng = np.random.RandomState(0)
+    paths = rng.normal(100., 2., size=(10001, 3))
+    sampled = SampledPaths(paths, chunksize=1000)
+    assert sampled.n_paths == 10001
+    assert np.allclose(sampled.mean(), paths.mean(axis=0))
+    prices = np.array([101., 95., 100., np.inf, -np.inf])
+    expected = [np.mean(paths[:, 1] < price) for price in prices]
+    assert np.allclose(sampled.cdf(1, prices), expected)
+
+    blocks = SampledPaths(lambda: np.array_split(paths, 7))
+    assert np.allclose(blocks.cdf(1, prices), expected)
+
+
+@pytest.mark.parametrize('fee', [0., 0.002])
+def test_make_order_samples(fee):
+    # stratified samples match the moments of the normal forecasts
+    z = stats.norm.ppf((np.arange(100000) + 0.5) / 100000)[:, None]
+    broker = SimpleBroker(funds=1000., min_bet=200., horizon=60, dt=10,
+                          discount=0.9999, risk=0.25, max_loss=0.1,
+                          ask_fee=fee, bid_fee=fee)
+    broker.get_chunks(2, 100., inplace=True)
+    for locs, scale in [(100.5 + np.arange(7), 2),
+                        (99.5 - np.arange(7), 2),
+                        (100.5 + 0.1 * np.arange(7), 20)]:
+        paths = locs + scale * z
+        dists = [stats.norm(loc, scale) for loc in locs]
+        assert (broker.make_order_samples(100., paths) ==
+                broker.make_order(100., dists))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import asyncio
+import multiprocessing
+
+import pytest
+from paul.kraken import SharedRateLimiter
+from paul.metrics import CollectorMetrics
+from paul.supervisor import Supervisor, shard
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+
+class FakeCollector(object):
+    def __init__(self, pairs, mode):
+        self.metrics = CollectorMetrics()
+        self.mode = mode
+        self._tasks = []
+
+    async def poll(self):
+        if self.mode == 'fail':
+            raise KeyError('unexpected')
+        while True:
+            if self.mode != 'stall':
+                self.metrics.rows_written.inc(1, table='ticker')
+            await asyncio.sleep(0.01)
+
+    def finished_tasks(self):
+        return [task for task in self._tasks if task.done()]
+
+    def start(self, *coros):
+        async def main():
+            self._tasks = [asyncio.ensure_future(self.poll())]
+            await asyncio.gather(*coros)
+        asyncio.run(main())
+
+
+def make_collector(mode, pairs, limiter, index):
+    if mode == 'crash':
+        raise RuntimeError("Worker {} crashed".format(index))
+    return FakeCollector(pairs, mode)
+
+
+def spend(limiter, calls):
+    async def main():
+        await asyncio.gather(*[limiter.acquire() for _ in range(calls)])
+    asyncio.run(main())
+
+
+def test_shard():
+    pairs = ['A', 'B', 'C', 'D', 'E']
+    assert shard(pairs, 2) == [['A', 'C', 'E'], ['B', 'D']]
+    assert shard(pairs[:1], 3) == [['A']]
+
+
+def test_shared_rate_limiter():
+    context = multiprocessing.get_context('fork')
+    limiter = SharedRateLimiter(max_count=5, decay=20., context=context)
+    start = time.monotonic()
+    processes = [context.Process(target=spend, args=(limiter, 10))
+                 for _ in range(2)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(10)
+        assert process.exitcode == 0
+    # 20 calls with a burst of 5 need at least 15 / 20 seconds in total
+    assert time.monotonic() - start >= 0.7
+
+
+def poll_until(supervisor, condition, timeout=10.):
+    deadline = time.time() + timeout
+    while time.time() < deadline and not condition():
+        supervisor.poll(timeout=0.1)
+    return condition()
+
+
+def test_supervisor_reports():
+    supervisor = Supervisor(make_collector, ('ok',), ['A', 'B', 'C'], 2,
+                            health_interval=0.1, max_stall=5,
+                            context='fork')
+    try:
+        for index in range(len(supervisor.shards)):
+            supervisor._start(index)
+        assert poll_until(supervisor, lambda: all(supervisor.reports))
+        assert poll_until(supervisor,
+                          lambda: supervisor.summary()['rows'] > 100)
+        summary = supervisor.summary()
+        assert summary['alive'] == 2
+        assert summary['restarts'] == 0
+    finally:
+        supervisor.stop(timeout=5.)
+    assert supervisor.summary()['alive'] == 0
+
+
+@pytest.mark.parametrize('mode', ['crash', 'fail', 'stall'])
+def test_supervisor_restarts(mode):
+    supervisor = Supervisor(make_collector, (mode,), ['A'], 1,
+                            health_interval=0.1, max_backoff=0.1,
+                            max_stall=3, context='fork')
+    try:
+        supervisor._start(0)
+        assert poll_until(supervisor, lambda: supervisor.restarts[0] >= 2)
+    finally:
+        supervisor.stop(timeout=5.)
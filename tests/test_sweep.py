@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+from datetime import datetime
+
+from paul.sweep import (grid, random_search, save_history, load_history,
+                        sweep, evaluate, dump_history, is_cached)
+
+__author__ = "Florian Wilhelm"
+__copyright__ = "Florian Wilhelm"
+__license__ = "new-bsd"
+
+
+def test_grid_random_search():
+    configs = grid(risk=[0.1, 0.2], dt=[10., 60.])
+    assert len(configs) == 4
+    assert {'dt': 60., 'risk': 0.1} in configs
+    configs = random_search(5, seed=1, risk=(0.1, 0.3), dt=[10., 60.])
+    assert len(configs) == 5
+    assert all(0.1 <= c['risk'] <= 0.3 and c['dt'] in (10., 60.)
+               for c in configs)
+    configs = random_search(50, seed=1, horizon=(60., 600.), dt=(5., 50.),
+                            min_bet=(10., 100.), max_stake=(100., 1000.))
+    assert all(c['horizon'] % c['dt'] == 0 for c in configs)
+    assert all(c['max_stake'] % c['min_bet'] == 0 for c in configs)
+
+
+def test_evaluate_records_any_error(tmpdir):
+    path = str(tmpdir.join('history.bin'))
+    save_history(path, [(np.arange(3.), np.ones(3), np.ones(3))])
+    report = evaluate({'min_bet': 0.}, path)
+    assert report['error'].startswith('ZeroDivisionError')
+
+
+class FakeDBClient(object):
+    def load_ticker(self, pair, start, end, columns, chunksize):
+        import pandas as pd
+        yield pd.DataFrame({'createtime': pd.to_datetime([0, 1e9]),
+                            'bid_price': [1., 2.], 'ask_price': [1., 2.]})
+
+
+def test_history_cache(tmpdir):
+    path = str(tmpdir.join('history.bin'))
+    start = datetime(2017, 1, 1)
+    assert not is_cached(path, 'XXBTZEUR', start)
+    assert dump_history(FakeDBClient(), 'XXBTZEUR', path, start) == 2
+    assert is_cached(path, 'XXBTZEUR', start)
+    assert not is_cached(path, 'XETHZEUR', start)
+    assert not is_cached(path, 'XXBTZEUR', start, datetime(2017, 2, 1))
+
+
+def test_sweep_resume(tmpdir):
+    rng = np.random.RandomState(0)
+    n = 500
+    times = 1.5e9 + 10. * np.arange(n)
+    mids = 100. + np.cumsum(rng.normal(0.05, 0.1, n))
+    path = str(tmpdir.join('history.bin'))
+    assert save_history(path, [(times, mids - .01, mids + .01)]) == n
+    assert load_history(path).shape == (n, 3)
+    checkpoint = str(tmpdir.join('results.jsonl'))
+    configs = grid(risk=[0.1, 0.25], horizon=[60.], dt=[10., 7.])
+    results = sweep(path, configs[:2], n_jobs=2, checkpoint=checkpoint)
+    assert [r['config'] for r in results] == configs[:2]
+    results = sweep(path, configs, n_jobs=2, checkpoint=checkpoint)
+    assert [r['config'] for r in results] == configs
+    assert sum(1 for _ in open(checkpoint)) == len(configs)
+    errors = [r for r in results if 'error' in r['report']]
+    assert [r['config']['dt'] for r in errors] == [7., 7.]